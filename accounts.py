@@ -0,0 +1,70 @@
+import contextvars
+import re
+from contextlib import contextmanager
+
+import Dat
+
+###---- Accounts (override from Dat if present)
+# Dat.accounts = [{"name": "main", "key": "...", "secret": "..."}, {"name": "sub1", ..., "exchange": "BINANCE"}]
+# Without it the process runs the single Dat.BinK / Dat.BinS account, named Dat.account_name.
+DEFAULT_ACCOUNT = getattr(Dat, 'account_name', 'main')
+ACCOUNT_NAME = re.compile(r"^[A-Za-z0-9_-]{1,32}$")     # Stored in VARCHAR(32) account columns
+
+
+class Account:
+    """One set of exchange credentials; `name` is what the DB rows are tagged with, `exchange` picks the backend."""
+
+    __slots__ = ("name", "api_key", "api_secret", "exchange")
+
+    def __init__(self, name, api_key, api_secret, exchange="BINANCE"):
+        if not ACCOUNT_NAME.match(name):
+            raise ValueError(f"Invalid account name {name!r} (letters, digits, '_' or '-', up to 32)")
+        self.name = name
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.exchange = exchange
+
+    def __repr__(self):
+        return f"Account({self.name!r})"
+
+
+def load_accounts():
+    """Every configured account, in Dat order."""
+    configured = getattr(Dat, 'accounts', None)
+    if not configured:
+        return [Account(DEFAULT_ACCOUNT, Dat.BinK, Dat.BinS)]
+    loaded = [Account(a["name"], a["key"], a["secret"], a.get("exchange", "BINANCE")) for a in configured]
+    names = [a.name for a in loaded]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate account names in Dat.accounts: {names}")
+    return loaded
+
+
+###---- Account of the running code (each worker thread / task sets its own)
+_current = contextvars.ContextVar("account", default=None)
+_default = None
+
+
+def current():
+    """Account the calling thread or task works for; the first configured account when none was set."""
+    global _default
+    account = _current.get()
+    if account is not None:
+        return account
+    if _default is None:
+        _default = load_accounts()[0]
+    return _default
+
+
+def current_name():
+    return current().name
+
+
+@contextmanager
+def use(account):
+    """`with accounts.use(account):` — Binance clients, DB rows and log records inside belong to `account`."""
+    token = _current.set(account)
+    try:
+        yield account
+    finally:
+        _current.reset(token)
@@ -0,0 +1,186 @@
+import asyncio
+import time
+
+import accounts
+import exchange
+import exchange_async
+import exchange_info
+import metrics
+import order_intents
+import position_history
+import profiler
+import read_api
+import state_store
+import store_data
+import place_orders
+from binance_ops import position_levels, TRAIL_PERCENT, ACTIVATION_BUFFER
+from logging_pipeline import configure as configure_logging, get_logger
+from open_orders import OpenOrdersSnapshot
+
+CYCLE_INTERVAL = 5          # Seconds between cycle starts (fixed cadence, not sleep-after-work)
+MAX_CONCURRENCY = 8         # Symbols handled at the same time
+STATS_CYCLES = 30           # Cycles between stats prints, as in the sync loop
+
+log = get_logger(__name__)
+
+
+class AsyncMonitor:
+    """
+    Same TP/SL and trailing-stop logic as the binance_ops loop, with symbols handled concurrently.
+    Each symbol's steps (TP/SL → cancel → place) stay sequential inside its own coroutine.
+    All exchange traffic goes through an exchange_async backend.
+    """
+
+    def __init__(self, backend, interval=CYCLE_INTERVAL, max_concurrency=MAX_CONCURRENCY):
+        self.backend = backend
+        self.interval = interval
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.store = state_store.StateStore()
+        self.counter = 0
+
+    async def fetch_snapshot(self):
+        """OpenOrdersSnapshot of every open order, or None if the request failed."""
+        orders = await self.backend.get_open_orders()
+        return OpenOrdersSnapshot(orders) if orders is not None else None
+
+    async def place_close_order(self, symbol, side, order_type, stop_price, snapshot):
+        """
+        exchange.Order of the placed order (also added to the snapshot), or None if it was rejected.
+        Sent through an order_intents.IntentQueue, like the TP/SL placements: an order already open is not re-sent.
+        """
+        intents = order_intents.IntentQueue(snapshot)
+        intent = intents.submit(symbol, side, order_type, stop_price)
+        if intent is None:
+            client_id = exchange.client_order_id(symbol, order_type, stop_price)
+            return next(o for o in snapshot.orders(symbol, order_type) if o.client_order_id == client_id)
+        return (await intents.dispatch_async(self.backend))[intent.client_order_id]
+
+    async def replace_stop(self, symbol, side, stop_price, snapshot):
+        """Async place_orders.replace_stop_loss: cancel known ids, place, retry/restore on rejection."""
+        old_stops = snapshot.orders(symbol, "STOP_MARKET")
+        start = time.perf_counter()
+        cancelled = await self.backend.cancel_orders(symbol, [o.order_id for o in old_stops]) if old_stops else []
+        for order_id in cancelled:
+            snapshot.remove(symbol, order_id)
+        if cancelled:
+            await asyncio.to_thread(store_data.sync_info, symbol=symbol, state=11)
+
+        order = await self.place_close_order(symbol, side, "STOP_MARKET", stop_price, snapshot)
+        if order is None:
+            order = await self.place_close_order(symbol, side, "STOP_MARKET", stop_price, snapshot)
+        failed = order is None
+        if failed and old_stops:
+            log.error("[%s] !! New SL %s rejected, restoring %s", symbol, stop_price, old_stops[0].stop_price,
+                      extra={"symbol": symbol, "stop_price": stop_price})
+            await self.place_close_order(symbol, side, "STOP_MARKET", old_stops[0].stop_price, snapshot)
+        if cancelled:
+            place_orders.record_unprotected_window((time.perf_counter() - start) * 1000, failed)
+        return order
+
+    async def handle_position(self, position, snapshot):
+        async with self.semaphore:
+            levels = position_levels(position)
+            symbol, side = levels['symbol'], levels['side']
+
+            # --- TP/SL flags were refreshed in bulk by run_cycle(); types already on the exchange are not re-posted
+            if not self.store.tp_set(symbol):
+                log.info("Placing SL/TP for %s: SL=%s, TP=%s", symbol, levels['stop_loss'], levels['take_profit'],
+                         extra={"symbol": symbol, "stop_loss": levels['stop_loss'], "take_profit": levels['take_profit']})
+                intents = order_intents.IntentQueue(snapshot)
+                for order_type, level in (("TAKE_PROFIT_MARKET", levels['take_profit']), ("STOP_MARKET", levels['stop_loss'])):
+                    if not snapshot.has_sl_tp(symbol, (order_type,)):
+                        intents.submit(symbol, side, order_type, level)
+                if intents:
+                    await intents.dispatch_async(self.backend)
+                await asyncio.to_thread(store_data.mark_tp_sl_as_set, symbol, 1)
+                stop = snapshot.stop_price(symbol)
+                self.store.mark_tp_sl_set(symbol, stop if stop is not None else levels['stop_loss'])
+
+            # --- Trailing stop: same decision as place_orders.update_trailing_stop
+            if levels['pnl'] > 0:
+                decision = place_orders.evaluate_trailing_stop(position, snapshot.stop_price(symbol),
+                                                               TRAIL_PERCENT, ACTIVATION_BUFFER)
+                if decision["action"] == "replace":
+                    await self.replace_stop(symbol, side, decision["new_sl"], snapshot)
+                elif decision["action"] == "place":
+                    await self.place_close_order(symbol, side, "STOP_MARKET", decision["new_sl"], snapshot)
+                if decision["action"] is not None:
+                    await asyncio.to_thread(store_data.update_position_metrics, symbol=symbol,
+                                            trailing_stop=decision["new_sl"], info=decision["info"])
+                    self.store.set_stop(symbol, snapshot.stop_price(symbol))
+                await asyncio.to_thread(store_data.sync_info, symbol=symbol, state=decision["state"])
+                self.store.set_state(symbol, decision["state"])
+            return levels['pnl']
+
+    async def run_cycle(self):
+        with metrics.timer("cycle_seconds", monitor="async", account=accounts.current_name()), profiler.cycle():
+            return await self._run_cycle()
+
+    async def _run_cycle(self):
+        with metrics.timer("cycle_stage_seconds", stage="position_fetch"):
+            positions, snapshot = await asyncio.gather(self.backend.get_positions(), self.fetch_snapshot())
+        if positions is None or snapshot is None:
+            snapshot = OpenOrdersSnapshot()
+            positions = []  # Without positions or open orders nothing can be decided; the store is kept, retry next cycle
+        else:
+            self.store.apply_positions(positions)
+            await asyncio.to_thread(self.store.refresh, [p.symbol for p in positions])
+
+        with metrics.timer("cycle_stage_seconds", stage="symbols"):
+            results = await asyncio.gather(*(self.handle_position(p, snapshot) for p in positions), return_exceptions=True)
+        pnl_sum = 0
+        for position, result in zip(positions, results):
+            if isinstance(result, Exception):
+                log.error("[%s] Error in cycle: %r", position.symbol, result, exc_info=result,
+                          extra={"symbol": position.symbol})
+            else:
+                pnl_sum += result
+        position_history.record_positions(positions, self.store)
+        read_api.publish(positions, self.store, pnl_sum)
+
+        with metrics.timer("cycle_stage_seconds", stage="db_sync"):
+            if positions:
+                await asyncio.to_thread(store_data.sync_positions, positions)
+            else:
+                await asyncio.to_thread(store_data.flush_pending)
+        return pnl_sum
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_start = loop.time()
+        while True:
+            started = loop.time()
+            await asyncio.to_thread(exchange_info.refresh_if_stale)
+            pnl_sum = await self.run_cycle()
+            elapsed = loop.time() - started
+
+            if self.counter % STATS_CYCLES == 0:
+                self.store.print_stats()
+                self.backend.print_stats()
+                place_orders.print_replace_stats()
+            self.counter += 1
+            log.info("Total unrealized PnL this cycle: %s | cycle %.2fs", round(pnl_sum, 2), elapsed,
+                     extra={"pnl_sum": round(pnl_sum, 2), "cycle_seconds": round(elapsed, 3)})
+
+            # --- Fixed cadence: skip missed ticks instead of piling cycles up
+            next_start += self.interval
+            if next_start < loop.time():
+                next_start = loop.time()
+            await asyncio.sleep(next_start - loop.time())
+
+
+async def main():
+    configure_logging()
+    metrics.start_server()
+    read_api.start_server()
+    profiler.install_signal_handler()
+    exchange_info.load()
+    async with exchange_async.create_backend() as backend:
+        monitor = AsyncMonitor(backend)
+        await asyncio.to_thread(store_data.ensure_account_column)
+        await asyncio.to_thread(monitor.store.load)
+        await monitor.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,214 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import place_orders
+from binance_ops import LONG_TP_VAL, LONG_SL_VAL, SHORT_TP_VAL, SHORT_SL_VAL, TRAIL_PERCENT, ACTIVATION_BUFFER
+from exchange import Position
+
+FEE_RATE = 0.0004           # Taker fee per side; break-even = entry ± both sides' fees
+DECISION_EVERY = 5          # Ticks between trailing-stop evaluations (the polling loop runs every 5s on 1s marks)
+
+DEFAULT_PARAMS = {
+    "trail_perc": TRAIL_PERCENT,
+    "activation_buffer": ACTIVATION_BUFFER,
+    "lower_trigger": place_orders.LOWER_TRIGGER,
+    "wide_trigger": None,       # Price change (%) from which wide_trail_perc replaces trail_perc
+    "wide_trail_perc": None,    # (the "0.75 above 1%" widening; not applied by the live loop)
+    "long_levels": (LONG_SL_VAL, LONG_TP_VAL),
+    "short_levels": (SHORT_SL_VAL, SHORT_TP_VAL),
+}
+
+_series = {}    # Worker-process copy of the price series, set once by _init_worker()
+
+
+###---- Price series: {symbol: np.array of mark prices, one per tick}
+def load_recording(path):
+    """Mark prices from a `stream_monitor.py --record` file (markPriceUpdate events)."""
+    prices = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            message = json.loads(line)["msg"]
+            data = message.get("data", message)
+            for event in data if isinstance(data, list) else [data]:
+                if event.get("e") == "markPriceUpdate":
+                    prices.setdefault(event["s"], []).append(float(event["p"]))
+    return {symbol: np.array(p) for symbol, p in prices.items() if len(p) > 1}
+
+
+def load_history(symbols, days=1, account=None):
+    """Mark prices recorded by position_history for the given symbols (of `account`, default the first one)."""
+    from datetime import datetime, timedelta
+    import position_history
+    since = datetime.now() - timedelta(days=days)
+    series = {}
+    for symbol in symbols:
+        rows = position_history.trajectory(symbol, since=since, account=account)
+        if len(rows) > 1:
+            series[symbol] = np.array([float(row[1]) for row in rows])
+    return series
+
+
+def synthetic_series(count, steps, volatility=0.001, drift=0.0, start=100.0, seed=0):
+    """Geometric random walks: `volatility` and `drift` are per tick."""
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(drift, volatility, size=(count, steps - 1))
+    paths = start * np.exp(np.concatenate([np.zeros((count, 1)), np.cumsum(returns, axis=1)], axis=1))
+    return {f"SYN{i:05d}": paths[i] for i in range(count)}
+
+
+###---- Simulated exchange: one position, one STOP_MARKET and one TAKE_PROFIT_MARKET per run
+class SimulatedExchange:
+    """Fills the stop or the take-profit at its trigger price the first tick the mark crosses it."""
+
+    def __init__(self, symbol, direction, entry, stop_loss, take_profit):
+        self.symbol = symbol
+        self.direction = direction
+        self.entry = entry
+        self.stop = stop_loss
+        self.stop_kind = "stop_loss"
+        self.take_profit = take_profit
+        self.stop_moves = 0
+
+    def move_stop(self, price, kind):
+        self.stop = price
+        self.stop_kind = kind
+        self.stop_moves += 1
+
+    def check_fill(self, mark):
+        """Exit (price, reason) triggered by this mark, or None."""
+        long = self.direction == "LONG"
+        if (mark <= self.stop) if long else (mark >= self.stop):
+            return self.stop, self.stop_kind
+        if (mark >= self.take_profit) if long else (mark <= self.take_profit):
+            return self.take_profit, "take_profit"
+        return None
+
+    def realized_pnl_perc(self, exit_price):
+        sign = 1 if self.direction == "LONG" else -1
+        return (sign * (exit_price - self.entry) / self.entry - 2 * FEE_RATE) * 100
+
+
+def simulate(symbol, prices, direction, params):
+    """Run one position through the live decision code; return (exit reason, realized PnL %, stop moves)."""
+    entry = float(prices[0])
+    sl_factor, tp_factor = params["long_levels"] if direction == "LONG" else params["short_levels"]
+    sign = 1 if direction == "LONG" else -1
+    break_even = entry * (1 + sign * 2 * FEE_RATE)
+    exchange = SimulatedExchange(symbol, direction, entry,
+                                 place_orders.exchange_info.round_price(symbol, entry * sl_factor, entry),
+                                 place_orders.exchange_info.round_price(symbol, entry * tp_factor, entry))
+    position = Position(symbol, float(sign), entry, entry, break_even, 0.0)
+    wide_trigger, wide_trail = params["wide_trigger"], params["wide_trail_perc"]
+
+    for tick, mark in enumerate(prices[1:], start=1):
+        mark = float(mark)
+        fill = exchange.check_fill(mark)
+        if fill is not None:
+            return fill[1], exchange.realized_pnl_perc(fill[0]), exchange.stop_moves
+        if tick % DECISION_EVERY or sign * (mark - entry) <= 0:
+            continue    # Trailing is only evaluated on decision ticks for positions in profit
+        trail = params["trail_perc"]
+        if wide_trigger is not None and sign * (mark - entry) / entry * 100 >= wide_trigger:
+            trail = wide_trail
+        position.mark_price = mark
+        decision = place_orders.evaluate_trailing_stop(position, exchange.stop, trail, params["activation_buffer"],
+                                                       params["lower_trigger"])
+        if decision["action"] is not None:
+            exchange.move_stop(decision["new_sl"], "breakeven" if decision["state"] == 12 else "trailing")
+    return "open", exchange.realized_pnl_perc(float(prices[-1])), exchange.stop_moves
+
+
+###---- Parameter grids and parallel runs
+def grid(**values):
+    """Every combination of the given parameter lists, on top of DEFAULT_PARAMS."""
+    names = list(values)
+    return [dict(DEFAULT_PARAMS, **dict(zip(names, combo))) for combo in itertools.product(*(values[n] for n in names))]
+
+
+def _init_worker(series):
+    global _series
+    _series = series
+
+
+def run_params(params, directions=("LONG", "SHORT")):
+    """Every series in both directions under one parameter set → aggregated report row."""
+    row = {"params": params, "trades": 0, "take_profit": 0, "stop_loss": 0, "breakeven": 0, "trailing": 0,
+           "open": 0, "pnl_total": 0.0, "wins": 0, "stop_moves": 0}
+    for symbol, prices in _series.items():
+        for direction in directions:
+            reason, pnl, moves = simulate(symbol, prices, direction, params)
+            row["trades"] += 1
+            row[reason] += 1
+            row["pnl_total"] += pnl
+            row["wins"] += pnl > 0
+            row["stop_moves"] += moves
+    row["pnl_avg"] = row["pnl_total"] / row["trades"] if row["trades"] else 0.0
+    return row
+
+
+def run_grid(series, param_sets, processes=None):
+    """One task per parameter set; the series are shipped to each worker once."""
+    if processes == 1:
+        _init_worker(series)
+        return [run_params(p) for p in param_sets]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(series,)) as pool:
+        return list(pool.map(run_params, param_sets, chunksize=max(1, len(param_sets) // (4 * (processes or os.cpu_count() or 1)))))
+
+
+def print_report(rows, top=20):
+    rows = sorted(rows, key=lambda r: r["pnl_total"], reverse=True)
+    print(f"{'trail':>6} {'activ':>6} {'lower':>6} {'wide':>10} | {'trades':>7} {'TP':>6} {'SL':>6} {'BE':>6} "
+          f"{'trail':>6} {'open':>6} {'win%':>6} {'pnl%':>10} {'avg%':>7}")
+    for r in rows[:top]:
+        p = r["params"]
+        wide = f"{p['wide_trail_perc']}@{p['wide_trigger']}" if p["wide_trigger"] is not None else "-"
+        print(f"{p['trail_perc']:>6} {p['activation_buffer']:>6} {p['lower_trigger']:>6} {wide:>10} | "
+              f"{r['trades']:>7} {r['take_profit']:>6} {r['stop_loss']:>6} {r['breakeven']:>6} {r['trailing']:>6} "
+              f"{r['open']:>6} {100 * r['wins'] / max(r['trades'], 1):>6.1f} {r['pnl_total']:>10.2f} {r['pnl_avg']:>7.3f}")
+
+
+def _floats(text):
+    return [float(v) for v in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay mark-price series through the trailing-stop logic over a parameter grid.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--recording", help="stream_monitor --record file")
+    source.add_argument("--history", help="Comma-separated symbols to read from position_history")
+    source.add_argument("--synthetic", type=int, help="Number of synthetic random-walk series")
+    parser.add_argument("--days", type=int, default=1, help="History window for --history")
+    parser.add_argument("--account", help="Account whose history --history reads")
+    parser.add_argument("--steps", type=int, default=3600, help="Ticks per synthetic series")
+    parser.add_argument("--volatility", type=float, default=0.001, help="Per-tick volatility of synthetic series")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trail", type=_floats, default=[TRAIL_PERCENT], help="e.g. 0.25,0.35,0.5")
+    parser.add_argument("--activation", type=_floats, default=[ACTIVATION_BUFFER])
+    parser.add_argument("--lower", type=_floats, default=[place_orders.LOWER_TRIGGER])
+    parser.add_argument("--wide", help="wide_trail_perc@wide_trigger options, e.g. 0.75@1.0 (add 'none' to compare without)")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.recording:
+        series = load_recording(args.recording)
+    elif args.history:
+        series = load_history(args.history.split(","), args.days, args.account)
+    else:
+        series = synthetic_series(args.synthetic, args.steps, args.volatility, seed=args.seed)
+
+    wide = [(None, None)]
+    if args.wide:
+        wide = [(None, None) if w == "none" else tuple(float(v) for v in w.split("@")) for w in args.wide.split(",")]
+    param_sets = [dict(p, wide_trail_perc=w[0], wide_trigger=w[1])
+                  for p in grid(trail_perc=args.trail, activation_buffer=args.activation, lower_trigger=args.lower)
+                  for w in wide]
+    print(f"[BACKTEST] {len(series)} series × 2 directions × {len(param_sets)} parameter sets")
+    print_report(run_grid(series, param_sets, args.processes), args.top)
@@ -0,0 +1,369 @@
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import binance_client
+import binance_ops
+import db_pool
+import exchange
+import exchange_info
+import logging_pipeline
+import place_orders
+import position_history
+import rate_limiter
+import scheduler
+import state_store
+import storage
+import store_data
+import fake_binance
+
+_real_connection = db_pool.connection
+
+
+class CountingCursor:
+    """Counts statements and rows written through a cursor; without a real cursor it stands in for the DB."""
+
+    def __init__(self, counts, cursor=None):
+        self._counts = counts
+        self._cursor = cursor
+
+    def _record(self, query, rows):
+        kind = query.lstrip().split(None, 1)[0].upper()
+        if kind in ("INSERT", "UPDATE", "DELETE", "REPLACE", "ALTER", "CREATE"):
+            self._counts["statements"] += 1
+            self._counts["rows"] += rows
+        else:
+            self._counts["reads"] += 1
+
+    def execute(self, query, params=()):
+        self._record(query, 1)
+        if self._cursor is not None:
+            return self._cursor.execute(query, params)
+
+    def executemany(self, query, seq):
+        seq = list(seq)
+        self._record(query, len(seq))
+        if self._cursor is not None:
+            return self._cursor.executemany(query, seq)
+
+    def fetchall(self):
+        return self._cursor.fetchall() if self._cursor is not None else []
+
+    def fetchone(self):
+        return self._cursor.fetchone() if self._cursor is not None else None
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+
+
+class _CountingConnection:
+    def __init__(self, counts, connection=None):
+        self._counts = counts
+        self._connection = connection
+
+    def cursor(self):
+        return CountingCursor(self._counts, self._connection.cursor() if self._connection is not None else None)
+
+    def commit(self):
+        self._counts["commits"] += 1
+        if self._connection is not None:
+            self._connection.commit()
+
+    def rollback(self):
+        if self._connection is not None:
+            self._connection.rollback()
+
+
+def install_db_counter(use_mysql):
+    """Route db_pool.connection() through counting wrappers (around the real pool, or around nothing)."""
+    counts = {"statements": 0, "rows": 0, "reads": 0, "commits": 0}
+
+    @contextlib.contextmanager
+    def connection():
+        if not use_mysql:
+            yield _CountingConnection(counts)
+            return
+        with _real_connection() as raw:
+            yield _CountingConnection(counts, raw)
+
+    db_pool.connection = connection
+    return counts
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def bench(positions, cycles, latency_ms, use_mysql):
+    """Run the binance_ops cycle against a fresh fake server; return first-cycle and steady-state figures."""
+    fake = fake_binance.FakeBinance(positions=positions, latency_ms=latency_ms)
+    server, base_url = fake_binance.serve(fake)
+    binance_client.set_client(binance_client.BinanceClient(base_url=base_url))
+    rate_limiter._limiter = rate_limiter.RateLimiter()
+    store_data.reset_sync_state()
+    counts = install_db_counter(use_mysql)
+    exchange_info.refresh()
+    store = state_store.StateStore()
+
+    samples = []
+    try:
+        for _ in range(cycles):
+            before_requests = fake.stats().get("requests", 0)
+            before_db = dict(counts)
+            start = time.perf_counter()
+            binance_ops.run_cycle(store)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            samples.append({"ms": elapsed_ms, "requests": fake.stats().get("requests", 0) - before_requests,
+                            "db_statements": counts["statements"] - before_db["statements"],
+                            "db_rows": counts["rows"] - before_db["rows"],
+                            "db_reads": counts["reads"] - before_db["reads"]})
+        if position_history.HISTORY_ENABLED:
+            position_history.get_writer().flush()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    steady = samples[1:] or samples
+    return {
+        "positions": positions, "first": samples[0],
+        "ms_mean": statistics.mean(s["ms"] for s in steady),
+        "ms_p50": _percentile([s["ms"] for s in steady], 0.5),
+        "ms_p95": _percentile([s["ms"] for s in steady], 0.95),
+        "requests": statistics.mean(s["requests"] for s in steady),
+        "db_statements": statistics.mean(s["db_statements"] for s in steady),
+        "db_rows": statistics.mean(s["db_rows"] for s in steady),
+        "db_reads": statistics.mean(s["db_reads"] for s in steady),
+        "server": fake.stats(),
+        "throttled_s": rate_limiter.get_limiter().get_stats()["delayed_seconds"],
+    }
+
+
+###---- positionRisk parse: json.loads of the whole body (the pre-records path) vs BinanceBackend.parse_positions
+def _parse_dicts(body):
+    parse = exchange.BinanceBackend.parse_position
+    return [parse(raw) for raw in json.loads(body) if float(raw['positionAmt']) != 0]
+
+
+def _measure(parse, body, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse(body)
+    us = (time.perf_counter() - start) / repeat * 1e6
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        result = parse(body)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"us": us, "peak_kib": peak / 1024, "retained_kib": retained / 1024, "rows": len(result)}
+
+
+def bench_parse(positions, idle_symbols, repeat):
+    """Allocation and time of one cycle's positionRisk parse, on a body with `idle_symbols` zero entries."""
+    fake = fake_binance.FakeBinance(positions=positions, idle_symbols=idle_symbols)
+    body = json.dumps(fake.position_risk({})[1], separators=(",", ":")).encode()
+    return {"positions": positions, "idle": idle_symbols, "body_kib": len(body) / 1024,
+            "dicts": _measure(_parse_dicts, body, repeat),
+            "records": _measure(exchange.BinanceBackend.parse_positions, body, repeat)}
+
+
+def print_parse_results(results):
+    print(f"{'positions':>9} {'idle':>5} {'body KiB':>8} | {'path':>7} {'us':>8} {'peak KiB':>9} {'kept KiB':>9} {'rows':>5}")
+    for r in results:
+        for path in ("dicts", "records"):
+            m = r[path]
+            print(f"{r['positions']:>9} {r['idle']:>5} {r['body_kib']:>8.1f} | {path:>7} {m['us']:>8.0f} "
+                  f"{m['peak_kib']:>9.1f} {m['retained_kib']:>9.1f} {m['rows']:>5}")
+
+
+###---- Stop-move latency: fixed 5s cycles vs the adaptive scheduler, marks stepping in wall time
+class StopLagProbe:
+    """
+    Steps the fake's marks every `step_seconds` and after each step notes when a position's stop fell
+    behind the one the trailing rule wants (a "replace"); the lag ends when the stop price changes.
+    """
+
+    def __init__(self, fake, step_seconds):
+        self.fake = fake
+        self.step_seconds = step_seconds
+        self.behind_since = {}      # symbol -> monotonic time the stop fell behind
+        self.stops = {}             # symbol -> stop price seen at the last step
+        self.lags = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.step_seconds):
+            with self.fake._lock:
+                self.fake._step_marks()
+                self._observe(time.monotonic())
+
+    def _observe(self, now):
+        stops = {o["symbol"]: float(o["stopPrice"]) for o in self.fake.orders.values() if o["type"] == "STOP_MARKET"}
+        for symbol, p in self.fake.positions.items():
+            stop = stops.get(symbol)
+            if stop != self.stops.get(symbol) and symbol in self.behind_since:
+                self.lags.append(now - self.behind_since.pop(symbol))
+            self.stops[symbol] = stop
+            amt, entry, mark = p["positionAmt"], p["entryPrice"], p["markPrice"]
+            if not amt or stop is None or amt * (mark - entry) <= 0:
+                self.behind_since.pop(symbol, None)
+                continue
+            position = exchange.Position(symbol, amt, entry, mark, p["breakEvenPrice"], amt * (mark - entry))
+            decision = place_orders.evaluate_trailing_stop(position, stop, binance_ops.TRAIL_PERCENT,
+                                                           binance_ops.ACTIVATION_BUFFER)
+            if decision["action"] == "replace":
+                self.behind_since.setdefault(symbol, now)
+            else:
+                self.behind_since.pop(symbol, None)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def bench_polling(positions, seconds, adaptive, step_seconds, volatility):
+    """Run the loop for `seconds` of wall time; return request weight per minute and stop-move lags."""
+    fake = fake_binance.FakeBinance(positions=positions, volatility=volatility, step_seconds=10 ** 9)
+    server, base_url = fake_binance.serve(fake)
+    binance_client.set_client(binance_client.BinanceClient(base_url=base_url))
+    rate_limiter._limiter = rate_limiter.RateLimiter()
+    store_data.reset_sync_state()
+    install_db_counter(False)
+    exchange_info.refresh()
+    store = state_store.StateStore()
+    polling = scheduler.SymbolScheduler(binance_ops.TRAIL_PERCENT, binance_ops.ACTIVATION_BUFFER) if adaptive else None
+    binance_ops.run_cycle(store, polling)       # Initial TP/SL, not part of the measure
+    fake.reset_stats()
+    try:
+        with StopLagProbe(fake, step_seconds) as probe:
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                started = time.monotonic()
+                binance_ops.run_cycle(store, polling)
+                if polling is not None:
+                    polling.run_until(min(end, started + scheduler.FULL_CYCLE_INTERVAL), store)
+                else:
+                    time.sleep(max(0.0, min(end, started + 5) - time.monotonic()))
+    finally:
+        server.shutdown()
+        server.server_close()
+    stats = fake.stats()
+    lags = probe.lags or [0.0]
+    if polling is not None:
+        print(f"[adaptive, {positions} positions] {polling.stats}")
+    return {"mode": "adaptive" if adaptive else "fixed 5s", "positions": positions,
+            "weight_per_min": stats.get("weight", 0) * 60 / seconds, "requests": stats.get("requests", 0),
+            "moves": len(probe.lags), "lag_p50": _percentile(lags, 0.5), "lag_p95": _percentile(lags, 0.95),
+            "lag_max": max(lags)}
+
+
+def print_polling_results(results):
+    print(f"{'mode':>9} {'positions':>9} | {'weight/min':>10} {'requests':>8} | {'moves':>5} {'lag p50 s':>9} "
+          f"{'lag p95 s':>9} {'lag max s':>9}")
+    for r in results:
+        print(f"{r['mode']:>9} {r['positions']:>9} | {r['weight_per_min']:>10.0f} {r['requests']:>8} | {r['moves']:>5} "
+              f"{r['lag_p50']:>9.2f} {r['lag_p95']:>9.2f} {r['lag_max']:>9.2f}")
+
+
+###---- Storage writes: sync_positions and single (non write-behind) writes on a backend
+def bench_storage(positions, cycles, backend):
+    """Mean time of one sync_positions (every mark changed) and of one sync_info / update_position_metrics."""
+    fake = fake_binance.FakeBinance(positions=positions)
+    records = exchange.BinanceBackend.parse_positions(json.dumps(fake.position_risk({})[1]))
+    storage.set_backend(backend)
+    store_data.reset_sync_state()
+    saved = store_data.MARK_WRITE_INTERVAL, store_data.WRITE_BEHIND
+    store_data.MARK_WRITE_INTERVAL, store_data.WRITE_BEHIND = 0, False
+    try:
+        store_data.ensure_account_column()
+        store_data.sync_positions(records)      # First sync inserts every row
+        sync_ms, single_us = [], []
+        for cycle in range(cycles):
+            for position in records:
+                position.set_mark(position.mark_price * (1.0001 if cycle % 2 else 0.9999))
+            start = time.perf_counter()
+            store_data.sync_positions(records)
+            sync_ms.append((time.perf_counter() - start) * 1000)
+            for position in records:
+                start = time.perf_counter()
+                store_data.sync_info(position.symbol, state=cycle % 7 + 1)
+                store_data.update_position_metrics(position.symbol, trailing_stop=position.mark_price, info="bench")
+                single_us.append((time.perf_counter() - start) / 2 * 1e6)
+    finally:
+        store_data.MARK_WRITE_INTERVAL, store_data.WRITE_BEHIND = saved
+        storage.set_backend(None)
+    return {"backend": backend.name, "positions": positions, "sync_ms": statistics.mean(sync_ms),
+            "sync_p95_ms": _percentile(sync_ms, 0.95), "write_us": statistics.mean(single_us),
+            "write_p95_us": _percentile(single_us, 0.95)}
+
+
+def print_storage_results(results):
+    print(f"{'backend':>7} {'positions':>9} | {'sync ms':>8} {'sync p95':>8} | {'write us':>8} {'write p95':>9}")
+    for r in results:
+        print(f"{r['backend']:>7} {r['positions']:>9} | {r['sync_ms']:>8.2f} {r['sync_p95_ms']:>8.2f} | "
+              f"{r['write_us']:>8.0f} {r['write_p95_us']:>9.0f}")
+
+
+def print_results(results):
+    print(f"{'positions':>9} | {'1st ms':>8} {'1st req':>7} | {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'req/cyc':>7} {'db stmt':>7} {'db rows':>7} {'db reads':>8} | {'fills':>5} {'throttled s':>11}")
+    for r in results:
+        print(f"{r['positions']:>9} | {r['first']['ms']:>8.1f} {r['first']['requests']:>7} | {r['ms_mean']:>8.1f} "
+              f"{r['ms_p50']:>8.1f} {r['ms_p95']:>8.1f} {r['requests']:>7.1f} {r['db_statements']:>7.1f} "
+              f"{r['db_rows']:>7.1f} {r['db_reads']:>8.1f} | {r['server'].get('fills', 0):>5} {r['throttled_s']:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cycle time, requests and DB writes per cycle of the monitor against fake_binance.")
+    parser.add_argument("--sizes", default="10,100,500", help="Position counts to benchmark")
+    parser.add_argument("--cycles", type=int, default=20, help="Cycles per size (the first one places every TP/SL)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Injected server latency per request")
+    parser.add_argument("--mysql", action="store_true", help="Write to the MySQL from Dat.db_config instead of only counting")
+    parser.add_argument("--verbose", action="store_true", help="Keep the monitor's own output")
+    parser.add_argument("--parse", action="store_true", help="Only the positionRisk parse micro-benchmark (allocation per cycle)")
+    parser.add_argument("--idle-symbols", type=int, default=500, help="Zero-amount positionRisk entries for --parse")
+    parser.add_argument("--repeat", type=int, default=200, help="Parses timed per size for --parse")
+    parser.add_argument("--polling", type=float, metavar="SECONDS",
+                        help="Only compare fixed 5s cycles with adaptive polling for this many seconds per size")
+    parser.add_argument("--step-seconds", type=float, default=0.25, help="Mark step period for --polling")
+    parser.add_argument("--volatility", type=float, default=0.0002, help="Mark volatility per step for --polling")
+    parser.add_argument("--storage", action="store_true",
+                        help="Only time storage writes on a temporary SQLite file (and on MySQL with --mysql)")
+    args = parser.parse_args()
+    if args.storage:
+        with tempfile.TemporaryDirectory() as directory:
+            backends = [lambda n: storage.SQLiteBackend(os.path.join(directory, f"bench_{n}.db"))]
+            if args.mysql:
+                backends.append(lambda n: storage.MySQLBackend())
+            print_storage_results([bench_storage(int(n), args.cycles, make(n))
+                                   for n in args.sizes.split(",") for make in backends])
+        raise SystemExit(0)
+    if args.polling:
+        exchange_info.CACHE_PATH = os.path.join(tempfile.gettempdir(), "fake_exchange_info_cache.json")
+        print_polling_results([bench_polling(int(n), args.polling, adaptive, args.step_seconds, args.volatility)
+                               for n in args.sizes.split(",") for adaptive in (False, True)])
+        raise SystemExit(0)
+    if args.parse:
+        print_parse_results([bench_parse(int(n), args.idle_symbols, args.repeat) for n in args.sizes.split(",")])
+        raise SystemExit(0)
+    if args.verbose:
+        logging_pipeline.configure(log_file=None)
+
+    # Keep the real exchangeInfo cache untouched
+    exchange_info.CACHE_PATH = os.path.join(tempfile.gettempdir(), "fake_exchange_info_cache.json")
+    results = [bench(int(n), args.cycles, args.latency_ms, args.mysql) for n in args.sizes.split(",")]
+    print_results(results)
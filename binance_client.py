@@ -0,0 +1,231 @@
+import hmac
+import hashlib
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import Dat
+import accounts
+import metrics
+import profiler
+import rate_limiter
+from endpoints import binance_api
+from logging_pipeline import get_logger
+
+# BINANCE_BASE_URL points the bot at another server (e.g. fake_binance.py for benchmarks)
+BASE_URL = os.environ.get('BINANCE_BASE_URL') or getattr(Dat, 'base_url', binance_api['BASE_URL'])
+
+log = get_logger(__name__)
+
+###---- Connection pool settings (override from Dat if present)
+POOL_CONNECTIONS = getattr(Dat, 'http_pool_connections', 4)      # Number of host pools kept alive
+POOL_MAXSIZE = getattr(Dat, 'http_pool_maxsize', 16)             # Sockets per host (>= concurrent callers, all accounts)
+CONNECT_TIMEOUT = getattr(Dat, 'http_connect_timeout', 3.05)
+READ_TIMEOUT = getattr(Dat, 'http_read_timeout', 10)
+RETRIES = getattr(Dat, 'http_retries', 3)
+BACKOFF_FACTOR = getattr(Dat, 'http_backoff_factor', 0.3)        # 0.3s, 0.6s, 1.2s ...
+RETRY_STATUS = (500, 502, 503, 504)
+RETRY_METHODS = frozenset(["GET", "DELETE"])                     # POST /order is not idempotent, never auto-retry it
+
+
+class RequestStats:
+    """Per-endpoint request count, errors and latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoint_stats = {}
+
+    def record(self, method, endpoint, elapsed_ms, error):
+        key = f"{method} {endpoint}"
+        with self._lock:
+            stats = self._endpoint_stats.get(key)
+            if stats is None:
+                stats = self._endpoint_stats[key] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            stats["count"] += 1
+            stats["errors"] += int(error)
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        metrics.inc("binance_requests_total", method=method, endpoint=endpoint)
+        metrics.observe("binance_request_seconds", elapsed_ms / 1000, method=method, endpoint=endpoint)
+        if error:
+            metrics.inc("binance_request_errors_total", method=method, endpoint=endpoint)
+
+    def endpoints(self):
+        with self._lock:
+            return {
+                key: dict(stats, avg_ms=round(stats["total_ms"] / stats["count"], 2) if stats["count"] else 0.0)
+                for key, stats in self._endpoint_stats.items()
+            }
+
+    def print_endpoints(self):
+        for key, s in sorted(self.endpoints().items()):
+            log.info("[HTTP]   %s: n=%s err=%s avg=%sms max=%sms", key, s['count'], s['errors'], s['avg_ms'],
+                     round(s['max_ms'], 2), extra={"endpoint": key, "count": s['count'], "errors": s['errors']})
+
+
+###---- HMAC-SHA256 over the exact query string that is sent
+def sign(secret, query_string):
+    return hmac.new(secret, query_string.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class Signer:
+    """sign() with the keyed HMAC state built once per secret; each signature works on a copy of it."""
+
+    __slots__ = ("_hmac",)
+
+    def __init__(self, secret):
+        self._hmac = hmac.new(secret, digestmod=hashlib.sha256)
+
+    def __call__(self, query_string):
+        mac = self._hmac.copy()
+        mac.update(query_string.encode('utf-8'))
+        return mac.hexdigest()
+
+
+def new_session():
+    """
+    Keep-alive session with the pool size above. Carries no API key and never retries on its own: a
+    resent signed query would carry a stale timestamp (-1021), so BinanceClient.request() retries instead.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class BinanceClient:
+    """
+    Signed Binance Futures REST client of one account on top of a pooled keep-alive session.
+    All REST calls should go through `request()` so they reuse the same TCP/TLS connections.
+    The API key travels per request, so several accounts can share one session (see get_client()).
+    """
+
+    def __init__(self, api_key=None, api_secret=None, base_url=BASE_URL, account=None, session=None):
+        account = account or accounts.current()
+        self.account = account.name
+        self.base_url = base_url
+        self.api_key = api_key or account.api_key
+        self._signer = Signer((api_secret or account.api_secret).encode('utf-8'))
+        self._headers = {"X-MBX-APIKEY": self.api_key}
+        self.session = session or new_session()
+        self.adapter = self.session.get_adapter(base_url)
+        self.timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+        self.stats = RequestStats()
+
+    def sign(self, query_string):
+        return self._signer(query_string)
+
+    def request(self, method, endpoint, params=None, signed=True, priority=None):
+        """
+        Send a (signed) request and return the `requests.Response`. Network errors are re-raised.
+        Each attempt first waits for the rate limiter (see rate_limiter.default_priority when priority is None)
+        and is signed with a fresh timestamp; GET/DELETE are retried on network errors and RETRY_STATUS.
+        """
+        params = dict(params or {})
+        limiter = rate_limiter.get_limiter()
+        if priority is None:
+            priority = rate_limiter.default_priority(method, endpoint)
+
+        coalesce_key = None
+        if method == "GET" and priority == rate_limiter.INFO:
+            coalesce_key = (self.account, endpoint, tuple(sorted(params.items())))
+            cached = limiter.recent_response(coalesce_key)
+            if cached is not None:
+                return cached
+        weight = rate_limiter.request_weight(method, endpoint, params)
+        is_order = endpoint in rate_limiter.ORDER_ENDPOINTS and method == "POST"
+        attempts = RETRIES + 1 if method in RETRY_METHODS else 1
+        for attempt in range(attempts):
+            limiter.acquire(weight, priority, is_order=is_order, account=self.account)
+            if signed:
+                params["timestamp"] = int(time.time() * 1000)
+                query_string = urlencode(params)
+                query_string = f"{query_string}&signature={self.sign(query_string)}"
+            else:
+                query_string = urlencode(params)
+            url = self.base_url + endpoint + (f"?{query_string}" if query_string else "")
+
+            start = time.perf_counter()
+            error = False
+            try:
+                with profiler.span(f"http {method} {endpoint}", params.get("symbol")):
+                    response = self.session.request(method, url, headers=self._headers, timeout=self.timeout)
+                error = response.status_code != 200
+                limiter.update_from_response(response.status_code, response.headers, self.account)
+            except (requests.ConnectionError, requests.Timeout):
+                error = True
+                if attempt == attempts - 1:
+                    raise
+                response = None
+            except requests.RequestException:
+                error = True
+                raise
+            finally:
+                self.stats.record(method, endpoint, (time.perf_counter() - start) * 1000, error)
+
+            if response is not None and (response.status_code not in RETRY_STATUS or attempt == attempts - 1):
+                if coalesce_key is not None and not error:
+                    limiter.remember_response(coalesce_key, response)
+                return response
+            time.sleep(BACKOFF_FACTOR * (2 ** attempt))
+
+    def get(self, endpoint, params=None, signed=True, priority=None):
+        return self.request("GET", endpoint, params, signed, priority)
+
+    def post(self, endpoint, params=None, signed=True, priority=None):
+        return self.request("POST", endpoint, params, signed, priority)
+
+    def delete(self, endpoint, params=None, signed=True, priority=None):
+        return self.request("DELETE", endpoint, params, signed, priority)
+
+    ###---- Counters
+    def connection_stats(self):
+        """New connections opened vs requests served by the pool (reused = requests - connections)."""
+        opened, served = 0, 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            served += pool.num_requests
+        return {"connections_opened": opened, "requests": served, "connections_reused": max(served - opened, 0)}
+
+    def get_stats(self):
+        return {"endpoints": self.stats.endpoints(), **self.connection_stats()}
+
+    def print_stats(self):
+        stats = self.connection_stats()
+        log.info("[HTTP] requests=%s new_conns=%s reused=%s", stats['requests'], stats['connections_opened'],
+                 stats['connections_reused'], extra=stats)
+        self.stats.print_endpoints()
+
+
+_clients = {}       # account name -> BinanceClient
+_session = None
+_clients_lock = threading.Lock()
+
+
+###---- One client per account, all on the process' shared session (one connection pool)
+def get_client():
+    """Client of the current account (accounts.use()), created on first use."""
+    account = accounts.current()
+    client = _clients.get(account.name)
+    if client is None:
+        global _session
+        with _clients_lock:
+            client = _clients.get(account.name)
+            if client is None:
+                if _session is None:
+                    _session = new_session()
+                client = _clients[account.name] = BinanceClient(account=account, session=_session)
+    return client
+
+
+def set_client(client):
+    """Use `client` for its account from now on (e.g. one pointed at fake_binance)."""
+    with _clients_lock:
+        _clients[client.account] = client
@@ -1,7 +1,24 @@
+import accounts
 import store_data
 import api_actions
 import place_orders
+import binance_client
+import open_orders
+import order_intents
+import db_pool
+import rate_limiter
+import risk_engine
+import scheduler as symbol_scheduler
+import exchange_info
+import metrics
+import position_history
+import profiler
+import read_api
+import state_store
+import storage
+import logging
 import time
+from logging_pipeline import configure as configure_logging, get_logger
 
 LONG_TP_VAL = 1.03
 LONG_SL_VAL = 0.98
@@ -10,87 +27,214 @@ SHORT_SL_VAL = 1.02
 TRAIL_PERCENT = 0.35
 ACTIVATION_BUFFER = 0.6
 
-########-----MAIN LOOP------#########
-if __name__ == "__main__":
+log = get_logger(__name__)
 
-    counter = 0
-    pnl_sum = 0
 
-    # ✅ Cache for TP/SL status to avoid repeated DB/API checks
-    tp_status_cache = {}
+###---- Per-position figures and initial SL/TP levels (shared with async_monitor)
+def position_levels(position):
+    """Figures of one exchange.Position and its initial SL/TP."""
+    entry = position.entry_price
+    amt = abs(position.amount)
+    pnl = position.unrealized_profit
+    volume = amt * entry
+    pnl_perc = round((pnl / volume) * 100, 2)
+    symbol = position.symbol
+    side = position.close_side
+
+    # --- Establish SL/TP parameters ---
+    if position.amount > 0:  # LONG
+        stop_loss = exchange_info.round_price(symbol, entry * LONG_SL_VAL, entry)
+        take_profit = exchange_info.round_price(symbol, entry * LONG_TP_VAL, entry)
+    else:  # SHORT
+        stop_loss = exchange_info.round_price(symbol, entry * SHORT_SL_VAL, entry)
+        take_profit = exchange_info.round_price(symbol, entry * SHORT_TP_VAL, entry)
+
+    return {"symbol": symbol, "entry": entry, "amt": amt, "pnl": pnl, "volume": volume,
+            "pnl_perc": pnl_perc, "side": side, "stop_loss": stop_loss, "take_profit": take_profit}
 
-    while True:
-        positions_info = api_actions.get_positions()
-        all_positions_buffer = []  # temporary list to store positions before DB commit
 
+########-----ONE MONITORING CYCLE------#########
+def run_cycle(store, scheduler=None):
+    """
+    Fetch positions and open orders, place missing TP/SL, trail stops and sync the DB. Returns the cycle's PnL.
+    A scheduler.SymbolScheduler is handed the fresh positions to check until the next cycle.
+    """
+    with metrics.timer("cycle_seconds", monitor="sync", account=accounts.current_name()), profiler.cycle():
+        return _run_cycle(store, scheduler)
+
+
+def _run_cycle(store, scheduler):
+    pnl_sum = 0
+    exchange_info.refresh_if_stale()
+    with metrics.timer("cycle_stage_seconds", stage="position_fetch"):
+        positions_info = api_actions.get_positions()
+    if positions_info is None:
+        # Fetch failed, which is not "every position closed": keep the store and the scheduler, retry next cycle
+        store_data.flush_pending()
+        return pnl_sum
+    # One openOrders call for every symbol; None → per-symbol fallback inside place_orders
+    with metrics.timer("cycle_stage_seconds", stage="open_orders_fetch"):
+        orders_snapshot = open_orders.fetch_snapshot() if positions_info else None
+
+    # --- TP/SL flags for every symbol: one DB query for the new or expired ones ---
+    closed = store.apply_positions(positions_info)
+    if closed:
+        log.info("[STATE] Positions closed since last cycle: %s", ", ".join(closed), extra={"symbols": closed})
+    with metrics.timer("cycle_stage_seconds", stage="state_refresh"):
+        reloaded = store.refresh([p.symbol for p in positions_info])
+    if reloaded:
+        log.info("[STATE] Reloaded TP/SL flags from DB for %s symbols", len(reloaded))
+    tp_flags = {p.symbol: store.tp_set(p.symbol) for p in positions_info}
+
+    # --- One vectorized pass: levels, SL/TP and trailing decisions for all symbols ---
+    existing_sl = {}
+    if orders_snapshot is not None:
+        for symbol in tp_flags:
+            existing_sl[symbol] = orders_snapshot.stop_price(symbol)
+        existing_sl = {s: sl for s, sl in existing_sl.items() if sl is not None}
+    with metrics.timer("cycle_stage_seconds", stage="decision_batch"):
+        batch = risk_engine.RiskBatch(positions_info, existing_sl, (LONG_SL_VAL, LONG_TP_VAL), (SHORT_SL_VAL, SHORT_TP_VAL),
+                                      TRAIL_PERCENT, ACTIVATION_BUFFER,
+                                      placing_initial={s for s, tp in tp_flags.items() if not tp and s not in existing_sl})
+
+    # --- Initial TP/SL as order intents, placed in batches before any trailing decision ---
+    # Types the exchange already has (crash or flag wipe after an earlier placement) are not re-posted
+    intents = order_intents.IntentQueue(orders_snapshot)
+    initial = {}    # symbol -> initial stop loss
+    for i, position in enumerate(positions_info):
+        symbol = position.symbol
+        if tp_flags[symbol]:
+            continue
+        levels = batch.levels(i)
+        initial[symbol] = levels['stop_loss']
+        log.info("Placing SL/TP for %s: SL=%s, TP=%s", symbol, levels['stop_loss'], levels['take_profit'],
+                 extra={"symbol": symbol, "stop_loss": levels['stop_loss'], "take_profit": levels['take_profit']})
+        for order_type, level in (("TAKE_PROFIT_MARKET", levels['take_profit']), ("STOP_MARKET", levels['stop_loss'])):
+            if not api_actions.has_existing_sl_tp(symbol, orders_snapshot, (order_type,)):
+                intents.submit(symbol, levels['side'], order_type, level)
+    if intents:
+        with metrics.timer("cycle_stage_seconds", stage="order_placement"):
+            intents.dispatch()
+    for symbol, stop_loss in initial.items():
+        store_data.mark_tp_sl_as_set(symbol, tp_set=1)
+        stop = orders_snapshot.stop_price(symbol) if orders_snapshot is not None else None
+        store.mark_tp_sl_set(symbol, stop if stop is not None else stop_loss)  # ✅ Update the store immediately
+
+    pnl_sum = float(batch.pnl.sum())
+    if log.isEnabledFor(logging.DEBUG):
+        for i, position in enumerate(positions_info):
+            levels = batch.levels(i)
+            symbol = levels['symbol']
+            log.debug("## %s - %s - Entry: %s, Amount: %s, PnL: %s (%%: %s), Volume: %s", symbol, position.direction,
+                      levels['entry'], levels['amt'], levels['pnl'], levels['pnl_perc'], levels['volume'],
+                      extra={"symbol": symbol, "entry": levels['entry'], "mark": position.mark_price,
+                             "pnl": levels['pnl'], "pnl_perc": levels['pnl_perc']})
+            if tp_flags[symbol]:
+                log.debug("Skipped %s — TP already active.", symbol, extra={"symbol": symbol})
+            if levels['pnl'] <= 0:
+                log.debug("[%s] Negative PnL, not setting Trailing Stop yet..", symbol, extra={"symbol": symbol, "pnl": levels['pnl']})
+
+    # --- Trailing Stop Management: only the rows the vectorized pass flagged reach the order layer ---
+    moved = []      # Symbols whose stop changed this cycle, read back from the snapshot after dispatch
+    if orders_snapshot is not None:
+        actions = batch.actions()
+        acting = {decision["symbol"] for decision in actions}
+        for symbol, state in batch.states():
+            store.set_state(symbol, state)
+            if symbol not in acting:
+                store_data.sync_info(symbol=symbol, state=state)    # apply_trailing_decision records the others
+        if actions:
+            with metrics.timer("cycle_stage_seconds", stage="order_placement"):
+                for decision in actions:
+                    place_orders.apply_trailing_decision(decision, orders_snapshot, intents)
+                    moved.append(decision["symbol"])
+    else:
         for position in positions_info:
-            symbol = position['symbol']
-            entry = float(position['entryPrice'])
-            mark = float(position["markPrice"])
-            amt = abs(float(position['positionAmt']))
-            pnl = float(position['unRealizedProfit'])
-            pnl_sum += pnl
-            volume = float(amt * entry)
-            pnl_perc = round(float((pnl / volume) * 100), 2)
-            rounding = 2 if entry > 0.999 else 5
-            position['positionDirection'] = ""
-
-            # --- Establish SL/TP parameters ---
-            if float(position['positionAmt']) > 0:  # LONG
-                side = "SELL"
-                position["positionDirection"] = "LONG"
-                stop_loss = round(entry * LONG_SL_VAL, rounding)
-                take_profit = round(entry * LONG_TP_VAL, rounding)
-            else:  # SHORT
-                side = "BUY"
-                position["positionDirection"] = "SHORT"
-                stop_loss = round(entry * SHORT_SL_VAL, rounding)
-                take_profit = round(entry * SHORT_TP_VAL, rounding)
-
-            print(f"\n## {symbol} - {position['positionDirection']} - Entry: {entry}, Amount: {amt}, PnL: {pnl} (%: {pnl_perc}), Volume: {volume}")
-
-            # --- TP/SL cache check ---
-            tp_exists = tp_status_cache.get(symbol, None)
-
-            if tp_exists is None:
-                # Not in cache → check DB once and store
-                status = store_data.check_tp_sl_status(symbol)
-                tp_exists = bool(status["tp_set"])
-                tp_status_cache[symbol] = tp_exists
-                print(f"[CACHE MISS] Checked DB for {symbol}: TP set = {tp_exists}")
-                print(tp_status_cache)
-            else:
-                print(f"[CACHE HIT] {symbol}: TP already cached = {tp_exists}")
-
-            # --- Place TP/SL only if not set ---
-            if not tp_exists:
-                print(f"Placing SL/TP for {symbol}: SL={stop_loss}, TP={take_profit}")
-                place_orders.place_take_profit(symbol, side, take_profit)
-                place_orders.place_stop_loss(symbol, side, stop_loss)
-                store_data.mark_tp_sl_as_set(symbol, tp_set=1)
-                tp_status_cache[symbol] = True  # ✅ Update cache immediately
-            else:
-                print(f"Skipped {symbol} — TP already active or cached.")
-
-            # --- Trailing Stop Management ---
-            if pnl > 0:
+            if position.unrealized_profit > 0:
                 place_orders.update_trailing_stop(position, trail_perc=TRAIL_PERCENT, activation_buffer=ACTIVATION_BUFFER)
-            else:
-                print("Negative PnL, not setting Trailing Stop yet..")
+    all_positions_buffer = list(positions_info)     # Bulk DB sync of every position
 
-            # Append position for bulk DB sync
-            all_positions_buffer.append(position)
+    # --- New stops from the trailing decisions, in batches ---
+    if intents:
+        with metrics.timer("cycle_stage_seconds", stage="order_placement"):
+            intents.dispatch()
+    for symbol in moved:
+        store.set_stop(symbol, orders_snapshot.stop_price(symbol))
 
-        # ✅ Perform one single DB sync for all positions collected
+    if scheduler is not None:
+        scheduler.reset(positions_info, orders_snapshot)
+
+    # ✅ Per-cycle mark/PnL/stop/state history, appended in the background
+    position_history.record_positions(all_positions_buffer, store)
+    read_api.publish(all_positions_buffer, store, pnl_sum)     # Dashboards read the cycle from memory, not from the DB
+
+    # ✅ Perform one single DB sync for all positions collected
+    with metrics.timer("cycle_stage_seconds", stage="db_sync"):
         if all_positions_buffer:
             store_data.sync_positions(all_positions_buffer)
+        else:
+            store_data.flush_pending()
+    return pnl_sum
+
+
+def print_account_stats(store, scheduler=None):
+    """Stats of the current account: its state store, Binance client and adaptive scheduler."""
+    store.print_stats()
+    binance_client.get_client().print_stats()
+    if scheduler is not None:
+        scheduler.print_stats()
+
+
+def print_shared_stats():
+    """Stats of what every account shares: DB pool, sync counters, replication, history writer, rate limiter."""
+    db_pool.print_stats()
+    store_data.print_sync_stats()
+    storage.print_stats()
+    if position_history.HISTORY_ENABLED:
+        position_history.get_writer().print_stats()
+    rate_limiter.get_limiter().print_stats()
+    place_orders.print_replace_stats()
+    order_intents.print_stats()
+    if read_api.ENABLED:
+        read_api.get_snapshots().print_stats()
+
+
+def print_stats(store, scheduler=None):
+    print_account_stats(store, scheduler)
+    print_shared_stats()
+
+
+########-----MAIN LOOP------#########
+if __name__ == "__main__":
+
+    counter = 0
+    configure_logging()
+    metrics.start_server()     # Only when Dat.metrics_enabled
+    read_api.start_server()    # Only when Dat.read_api_enabled
+    profiler.install_signal_handler()     # kill -USR2 <pid> profiles the next profiler.PROFILE_CYCLES cycles
+
+    # ✅ In-memory TP/SL flags, stops and states, bulk-loaded from the DB (replaces tp_status_cache)
+    store = state_store.StateStore()
+    store_data.ensure_account_column()
+    store.load()
+
+    # ✅ Tick sizes from the on-disk exchangeInfo cache (fetched only if missing or stale)
+    exchange_info.load()
+
+    # ✅ Between full cycles, symbols near a trailing threshold are re-checked on their own schedule
+    scheduler = symbol_scheduler.SymbolScheduler(TRAIL_PERCENT, ACTIVATION_BUFFER) if symbol_scheduler.ADAPTIVE_POLLING else None
+
+    while True:
+        started = time.monotonic()
+        pnl_sum = run_cycle(store, scheduler)
 
-        # ✅ Cache auto-refresh every 30 min
-        if counter % 30 == 0:  # 15s × 120 = 30 min
-            print("\n[Cache Refresh] Clearing TP/SL status cache.")
-            tp_status_cache.clear()
+        # ✅ Periodic stats (store entries expire on their own after state_store.ENTRY_TTL)
+        if counter % 30 == 0:
+            print_stats(store, scheduler)
 
         counter += 1
-        print(f"Total unrealized PnL this cycle: {round(pnl_sum, 2)} \n")
-        pnl_sum = 0
-        time.sleep(5)
+        log.info("Total unrealized PnL this cycle: %s", round(pnl_sum, 2), extra={"pnl_sum": round(pnl_sum, 2)})
+        if scheduler is not None:
+            scheduler.run_until(started + symbol_scheduler.FULL_CYCLE_INTERVAL, store)
+        else:
+            time.sleep(5)
@@ -0,0 +1,146 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import pooling
+
+import Dat
+from logging_pipeline import get_logger
+
+DB_CONFIG = getattr(Dat, 'db_config', {})     # Not needed with Dat.storage_backend = "sqlite" and no replication
+log = get_logger(__name__)
+
+###---- Pool settings (override from Dat if present)
+POOL_NAME = "trading_monitor"
+MAX_POOL_SIZE = 32                                                 # mysql.connector's limit
+POOL_SIZE = min(MAX_POOL_SIZE, getattr(Dat, 'db_pool_size', 5))
+ACQUIRE_TIMEOUT = getattr(Dat, 'db_acquire_timeout', 5.0)          # Seconds to wait for a free connection
+HEALTH_CHECK_IDLE = getattr(Dat, 'db_health_check_idle', 30.0)     # Ping connections idle longer than this
+
+_pool = None
+_pool_lock = threading.Lock()
+_last_used = {}     # id(raw connection) -> monotonic time it went back to the pool
+_stats_lock = threading.Lock()
+_stats = {"acquired": 0, "acquire_total_ms": 0.0, "acquire_max_ms": 0.0, "waits": 0, "reconnects": 0, "pool_resets": 0}
+
+
+def _create_pool():
+    return pooling.MySQLConnectionPool(
+        pool_name=POOL_NAME,
+        pool_size=POOL_SIZE,
+        pool_reset_session=False,   # No session state is used; skip the extra reset round-trip
+        **DB_CONFIG
+    )
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _create_pool()
+    return _pool
+
+
+def configure(size):
+    """Set the pool size (capped at MAX_POOL_SIZE); a pool already built with another size is rebuilt on next acquire."""
+    global POOL_SIZE, _pool
+    with _pool_lock:
+        POOL_SIZE = min(MAX_POOL_SIZE, size)
+        if _pool is not None and _pool.pool_size != POOL_SIZE:
+            _pool = None
+
+
+def reset_pool():
+    """Drop the current pool (e.g. after the server went away); the next acquire builds a new one."""
+    global _pool
+    with _pool_lock:
+        _pool = None
+    with _stats_lock:
+        _stats["pool_resets"] += 1
+
+
+def _health_check(connection):
+    """Ping connections that sat idle long enough to have been dropped by the server."""
+    raw_id = id(connection._cnx)
+    idle_since = _last_used.get(raw_id)
+    if idle_since is None or time.monotonic() - idle_since > HEALTH_CHECK_IDLE:
+        try:
+            connection.ping(reconnect=True, attempts=2, delay=0.2)
+        except mysql.connector.Error:
+            reconnected = False
+            try:
+                connection.reconnect(attempts=2, delay=0.2)
+                reconnected = True
+            finally:
+                if not reconnected:
+                    connection.close()      # Hand it back to the pool, or every failed reconnect leaks a slot
+            with _stats_lock:
+                _stats["reconnects"] += 1
+
+
+def _acquire():
+    start = time.perf_counter()
+    deadline = start + ACQUIRE_TIMEOUT
+    waited = False
+    reset_done = False
+    while True:
+        try:
+            connection = _get_pool().get_connection()
+            _health_check(connection)
+            break
+        except pooling.PoolError:
+            # Pool exhausted → wait for another thread to release a connection
+            if time.perf_counter() >= deadline:
+                raise
+            waited = True
+            time.sleep(0.01)
+        except (mysql.connector.InterfaceError, mysql.connector.OperationalError):
+            # Server unreachable or connection broken → rebuild the pool once, then give up
+            if reset_done:
+                raise
+            reset_done = True
+            reset_pool()
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _stats_lock:
+        _stats["acquired"] += 1
+        _stats["acquire_total_ms"] += elapsed_ms
+        _stats["acquire_max_ms"] = max(_stats["acquire_max_ms"], elapsed_ms)
+        _stats["waits"] += int(waited)
+    return connection
+
+
+###---- Borrow a pooled connection
+@contextmanager
+def connection():
+    """
+    Yield a pooled MySQL connection and return it to the pool afterwards.
+    Uncommitted work is rolled back if the block raises.
+    """
+    cnx = _acquire()
+    try:
+        yield cnx
+    except Exception:
+        try:
+            cnx.rollback()
+        except mysql.connector.Error:
+            pass
+        raise
+    finally:
+        _last_used[id(cnx._cnx)] = time.monotonic()
+        cnx.close()     # Pooled connection: close() hands it back to the pool
+
+
+def get_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["acquire_avg_ms"] = round(stats["acquire_total_ms"] / stats["acquired"], 3) if stats["acquired"] else 0.0
+    return stats
+
+
+def print_stats():
+    s = get_stats()
+    log.info("[DB] acquired=%s avg=%sms max=%sms waits=%s reconnects=%s pool_resets=%s", s['acquired'],
+             s['acquire_avg_ms'], round(s['acquire_max_ms'], 3), s['waits'], s['reconnects'], s['pool_resets'], extra=s)
@@ -3,5 +3,10 @@ binance_api = {
     "POSITION_ENDPOINT": "/fapi/v2/positionRisk",
     "ORDER_ENDPOINT": "/fapi/v1/order",
     "OPEN_ORDERS_ENDPOINT": "/fapi/v1/openOrders",
-    "ALL_OPEN_ORDERS_ENDPOINT": "/fapi/v1/allOpenOrders"
-}
\ No newline at end of file
+    "ALL_OPEN_ORDERS_ENDPOINT": "/fapi/v1/allOpenOrders",
+    "BATCH_ORDERS_ENDPOINT": "/fapi/v1/batchOrders",
+    "LISTEN_KEY_ENDPOINT": "/fapi/v1/listenKey",
+    "EXCHANGE_INFO_ENDPOINT": "/fapi/v1/exchangeInfo",
+    "PREMIUM_INDEX_ENDPOINT": "/fapi/v1/premiumIndex",
+    "WS_BASE_URL": "wss://fstream.binance.com"
+}
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import re
+import threading
+from dataclasses import dataclass
+
+import accounts
+import binance_client
+from endpoints import binance_api
+from logging_pipeline import get_logger
+from rate_limiter import PROTECTIVE
+
+POSITION_ENDPOINT = binance_api['POSITION_ENDPOINT']
+ORDER_ENDPOINT = binance_api['ORDER_ENDPOINT']
+OPEN_ORDERS_ENDPOINT = binance_api['OPEN_ORDERS_ENDPOINT']
+BATCH_ORDERS_ENDPOINT = binance_api['BATCH_ORDERS_ENDPOINT']
+PREMIUM_INDEX_ENDPOINT = binance_api['PREMIUM_INDEX_ENDPOINT']
+MAX_BATCH_CANCEL = 10   # orderIdList limit of DELETE /fapi/v1/batchOrders
+MAX_BATCH_PLACE = 5     # batchOrders limit of POST /fapi/v1/batchOrders
+DUPLICATE_CLIENT_ID = -4116     # newClientOrderId already used by an open order
+ORDER_KINDS = {"STOP_MARKET": "SL", "TAKE_PROFIT_MARKET": "TP"}
+
+# positionRisk is a flat array of flat objects, one per symbol, most of them with a zero amount
+_POSITION_AMOUNT = re.compile(rb'"positionAmt"\s*:\s*"([^"]*)"')
+
+log = get_logger(__name__)
+
+
+###---- Typed records: exchange JSON is parsed once, the decision logic only reads attributes
+@dataclass(slots=True)
+class Position:
+    symbol: str
+    amount: float               # Signed: > 0 LONG, < 0 SHORT
+    entry_price: float
+    mark_price: float
+    break_even_price: float
+    unrealized_profit: float
+    leverage: float = 0.0
+    liquidation_price: float = 0.0
+    margin_type: str = "cross"
+    position_side: str = "BOTH"
+    update_time: int = 0        # ms
+    exchange: str = "BINANCE"
+
+    @property
+    def direction(self):
+        return "LONG" if self.amount > 0 else "SHORT" if self.amount < 0 else "NEUTRAL"
+
+    @property
+    def close_side(self):
+        """Side of the orders that close this position."""
+        return "SELL" if self.amount > 0 else "BUY"
+
+    def set_mark(self, mark_price):
+        self.mark_price = mark_price
+        self.unrealized_profit = self.amount * (mark_price - self.entry_price)
+
+
+@dataclass(slots=True)
+class Order:
+    symbol: str
+    order_id: int
+    type: str
+    side: str = ""
+    stop_price: float = 0.0
+    client_order_id: str = ""
+    status: str = "NEW"
+
+
+def client_order_id(symbol, order_type, stop_price):
+    """
+    Deterministic newClientOrderId of a close order: the same symbol, type and stop level always give the
+    same id, so a re-sent order is refused as a duplicate (-4116) instead of being placed twice.
+    Binance only requires it to be unique among open orders, so the id is free again once the order is gone.
+    """
+    digest = hashlib.blake2b(f"{symbol}|{order_type}|{float(stop_price):.10g}".encode(), digest_size=12).hexdigest()
+    return f"tm{ORDER_KINDS.get(order_type, 'XX')}-{digest}"
+
+
+class ExchangeBackend:
+    """
+    What the monitors need from an exchange. Backends return Position/Order records, so the
+    decision logic (binance_ops, risk_engine, place_orders) does not depend on the exchange.
+    """
+
+    name = None
+
+    def get_positions(self):
+        """Open (non-zero) positions, or None if the request failed (an empty list means no open position)."""
+        raise NotImplementedError
+
+    def get_open_orders(self, symbol=None):
+        """Open orders of one symbol or of all of them, or None if the request failed."""
+        raise NotImplementedError
+
+    def get_mark_prices(self, symbol=None):
+        """{symbol: mark price} of one symbol or of every symbol, or {} if the request failed."""
+        raise NotImplementedError
+
+    def place_close_order(self, symbol, side, order_type, stop_price, priority=None, client_order_id=None):
+        """Place a closePosition STOP_MARKET / TAKE_PROFIT_MARKET: (Order, None) or (None, error body)."""
+        raise NotImplementedError
+
+    def place_close_orders(self, requests, priority=None):
+        """
+        Place several close orders (records with symbol, side, type, stop_price and client_order_id);
+        one (Order, None) or (None, error body) per request, in order. Backends batch them if they can.
+        """
+        return [self.place_close_order(r.symbol, r.side, r.type, r.stop_price, priority, r.client_order_id)
+                for r in requests]
+
+    def cancel_orders(self, symbol, order_ids):
+        """Cancel orders by id; return the ids the exchange confirmed."""
+        raise NotImplementedError
+
+
+class BinanceBackend(ExchangeBackend):
+    """USDⓈ-M futures over the account's BinanceClient (shared session, rate limiter, signing)."""
+
+    name = "BINANCE"
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or binance_client.get_client()
+
+    ###---- JSON → records (also used by the aiohttp client and the stream monitor)
+    @staticmethod
+    def parse_position(raw):
+        return Position(
+            symbol=raw['symbol'], amount=float(raw['positionAmt']), entry_price=float(raw['entryPrice']),
+            mark_price=float(raw['markPrice']), break_even_price=float(raw['breakEvenPrice']),
+            unrealized_profit=float(raw['unRealizedProfit']), leverage=float(raw['leverage']),
+            liquidation_price=float(raw['liquidationPrice']), margin_type=raw['marginType'],
+            position_side=raw['positionSide'], update_time=int(raw['updateTime']), exchange="BINANCE",
+        )
+
+    @classmethod
+    def parse_positions(cls, body):
+        """
+        positionRisk response body (bytes) → Position records of the open positions, in one pass.
+        Only the positionAmt values are scanned in the raw bytes; the objects of zero-amount entries
+        (most of the body) are never decoded. Entries are flat objects, so `{`/`}` around the match bound them.
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        open_objects = []
+        for match in _POSITION_AMOUNT.finditer(body):
+            if float(match.group(1)) == 0:
+                continue
+            start = body.rfind(b"{", 0, match.start())
+            open_objects.append(body[start:body.index(b"}", match.end()) + 1])
+        if not open_objects:
+            return []
+        return [cls.parse_position(raw) for raw in json.loads(b"[" + b",".join(open_objects) + b"]")]
+
+    @staticmethod
+    def parse_order(raw):
+        return Order(symbol=raw['symbol'], order_id=raw['orderId'], type=raw.get('type', ""), side=raw.get('side', ""),
+                     stop_price=float(raw.get('stopPrice') or 0.0), client_order_id=raw.get('clientOrderId', ""),
+                     status=raw.get('status', "NEW"))
+
+    @staticmethod
+    def close_order_params(symbol, side, order_type, stop_price, client_order_id=None):
+        params = {
+            "symbol": symbol,
+            "side": side,
+            "type": order_type,
+            "stopPrice": stop_price,
+            "closePosition": "true"
+        }
+        if client_order_id:
+            params["newClientOrderId"] = client_order_id
+        return params
+
+    ###---- ExchangeBackend
+    def get_positions(self):
+        response = self.client.get(POSITION_ENDPOINT)
+        if response.status_code != 200:
+            log.error("Error fetching positions: %s, Message: %s", response.status_code, response.text,
+                      extra={"status": response.status_code})
+            return None
+        return self.parse_positions(response.content)
+
+    def get_open_orders(self, symbol=None):
+        response = self.client.get(OPEN_ORDERS_ENDPOINT, {"symbol": symbol} if symbol else None)
+        if response.status_code != 200:
+            log.error("Error fetching open orders%s: %s, Message: %s", f" for {symbol}" if symbol else "",
+                      response.status_code, response.text, extra={"symbol": symbol, "status": response.status_code})
+            return None
+        return [self.parse_order(raw) for raw in response.json()]
+
+    def get_mark_prices(self, symbol=None):
+        response = self.client.get(PREMIUM_INDEX_ENDPOINT, {"symbol": symbol} if symbol else None, signed=False)
+        if response.status_code != 200:
+            log.error("Error fetching mark prices%s: %s, Message: %s", f" for {symbol}" if symbol else "",
+                      response.status_code, response.text, extra={"symbol": symbol, "status": response.status_code})
+            return {}
+        body = response.json()
+        return {raw['symbol']: float(raw['markPrice']) for raw in ([body] if symbol else body)}
+
+    def place_close_order(self, symbol, side, order_type, stop_price, priority=None, client_order_id=None):
+        if priority is None and order_type == "STOP_MARKET":
+            priority = PROTECTIVE
+        response = self.client.post(ORDER_ENDPOINT, self.close_order_params(symbol, side, order_type, stop_price, client_order_id),
+                                    priority=priority)
+        body = response.json()
+        if response.status_code != 200:
+            return None, body
+        return self.parse_order(body), None
+
+    def place_close_orders(self, requests, priority=None):
+        results = []
+        for start in range(0, len(requests), MAX_BATCH_PLACE):
+            chunk = requests[start:start + MAX_BATCH_PLACE]
+            if len(chunk) == 1:
+                results += super().place_close_orders(chunk, priority)
+                continue
+            chunk_priority = priority
+            if chunk_priority is None and any(r.type == "STOP_MARKET" for r in chunk):
+                chunk_priority = PROTECTIVE
+            batch = [{k: str(v) for k, v in self.close_order_params(r.symbol, r.side, r.type, r.stop_price,
+                                                                     r.client_order_id).items()} for r in chunk]
+            response = self.client.post(BATCH_ORDERS_ENDPOINT, {"batchOrders": json.dumps(batch)}, priority=chunk_priority)
+            body = response.json()
+            if response.status_code != 200:
+                results += [(None, body)] * len(chunk)
+                continue
+            results += [(self.parse_order(r), None) if "orderId" in r else (None, r) for r in body]
+        return results
+
+    def cancel_orders(self, symbol, order_ids):
+        cancelled = []
+        for start in range(0, len(order_ids), MAX_BATCH_CANCEL):
+            chunk = order_ids[start:start + MAX_BATCH_CANCEL]
+            if len(chunk) == 1:
+                res = self.client.delete(ORDER_ENDPOINT, {"symbol": symbol, "orderId": chunk[0]}, priority=PROTECTIVE)
+                results = [res.json()] if res.status_code == 200 else []
+            else:
+                res = self.client.delete(BATCH_ORDERS_ENDPOINT, {"symbol": symbol, "orderIdList": json.dumps(chunk)},
+                                         priority=PROTECTIVE)
+                results = res.json() if res.status_code == 200 else []
+            if res.status_code != 200:
+                log.error("[%s] Cancel of %s failed: %s", symbol, chunk, res.text, extra={"symbol": symbol})
+            cancelled += [r["orderId"] for r in results if "orderId" in r]
+        return cancelled
+
+
+###---- Backend registry: Dat.accounts entries pick theirs with "exchange" (default BINANCE)
+BACKENDS = {"BINANCE": BinanceBackend}
+
+_backends = {}      # account name -> backend instance
+_backends_lock = threading.Lock()
+
+
+def register_backend(name, backend_class):
+    BACKENDS[name] = backend_class
+
+
+def get_backend():
+    """Backend of the current account."""
+    account = accounts.current()
+    backend = _backends.get(account.name)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(account.name)
+            if backend is None:
+                backend = _backends[account.name] = BACKENDS[account.exchange]()
+    return backend
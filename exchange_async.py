@@ -0,0 +1,227 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+import accounts
+import binance_client
+from endpoints import binance_api
+from exchange import BATCH_ORDERS_ENDPOINT, MAX_BATCH_CANCEL, MAX_BATCH_PLACE, OPEN_ORDERS_ENDPOINT, ORDER_ENDPOINT, \
+    POSITION_ENDPOINT, BinanceBackend
+from logging_pipeline import get_logger
+from rate_limiter import PROTECTIVE
+import rate_limiter
+
+LISTEN_KEY_ENDPOINT = binance_api['LISTEN_KEY_ENDPOINT']
+UNKNOWN_OUTCOME = -1007     # Code reported for a request that got no response (timeout, connection lost)
+
+log = get_logger(__name__)
+
+
+class AsyncExchangeBackend:
+    """
+    exchange.ExchangeBackend for the asyncio monitors: same Position/Order records and failure values,
+    awaitable calls. Used with `async with`, which opens and closes its connections.
+    """
+
+    name = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def get_positions(self):
+        """Open (non-zero) positions, or None if the request failed (an empty list means no open position)."""
+        raise NotImplementedError
+
+    async def get_open_orders(self, symbol=None):
+        """Open orders of one symbol or of all of them, or None if the request failed."""
+        raise NotImplementedError
+
+    async def place_close_order(self, symbol, side, order_type, stop_price, priority=None, client_order_id=None):
+        """Place a closePosition STOP_MARKET / TAKE_PROFIT_MARKET: (Order, None) or (None, error body)."""
+        raise NotImplementedError
+
+    async def place_close_orders(self, requests, priority=None):
+        """Several close orders, one (Order, None) or (None, error body) per request, in order."""
+        return [await self.place_close_order(r.symbol, r.side, r.type, r.stop_price, priority, r.client_order_id)
+                for r in requests]
+
+    async def cancel_orders(self, symbol, order_ids):
+        """Cancel orders by id; return the ids the exchange confirmed."""
+        raise NotImplementedError
+
+    ###---- User-data stream (stream_monitor)
+    async def create_user_stream(self):
+        """Key of a new user-data stream, or None if the request failed."""
+        raise NotImplementedError
+
+    async def keepalive_user_stream(self, key):
+        """Extend the user-data stream's life; False if the request failed."""
+        raise NotImplementedError
+
+    def print_stats(self):
+        pass
+
+
+class AsyncBinanceBackend(AsyncExchangeBackend):
+    """USDⓈ-M futures over aiohttp, with BinanceClient's signing, pool size, timeouts, GET/DELETE retries and rate limiter."""
+
+    name = "BINANCE"
+
+    def __init__(self, api_key=None, api_secret=None, base_url=binance_client.BASE_URL, account=None):
+        account = account or accounts.current()
+        self.account = account.name
+        self.base_url = base_url
+        self.api_key = api_key or account.api_key
+        self._signer = binance_client.Signer((api_secret or account.api_secret).encode('utf-8'))
+        self.session = None
+        self.stats = binance_client.RequestStats()
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=binance_client.POOL_MAXSIZE, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(connect=binance_client.CONNECT_TIMEOUT, sock_read=binance_client.READ_TIMEOUT)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                             headers={"X-MBX-APIKEY": self.api_key})
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def request(self, method, endpoint, params=None, priority=None, raw=False, signed=True):
+        """
+        (Signed) request → (status, parsed JSON or text; the body bytes if raw), paced by the shared rate
+        limiter. Each attempt is signed with a fresh timestamp; status is None when no response came back.
+        """
+        limiter = rate_limiter.get_limiter()
+        if priority is None:
+            priority = rate_limiter.default_priority(method, endpoint)
+        weight = rate_limiter.request_weight(method, endpoint, params)
+        is_order = endpoint in rate_limiter.ORDER_ENDPOINTS and method == "POST"
+        attempts = binance_client.RETRIES + 1 if method in binance_client.RETRY_METHODS else 1
+        for attempt in range(attempts):
+            await limiter.acquire_async(weight, priority, is_order, self.account)
+            params_ = dict(params or {})
+            if signed:
+                params_["timestamp"] = int(time.time() * 1000)
+                query_string = urlencode(params_)
+                query_string = f"{query_string}&signature={self._signer(query_string)}"
+            else:
+                query_string = urlencode(params_)
+            url = self.base_url + endpoint + (f"?{query_string}" if query_string else "")
+            start = time.perf_counter()
+            status, body = None, None
+            try:
+                async with self.session.request(method, url) as response:
+                    status = response.status
+                    limiter.update_from_response(status, response.headers, self.account)
+                    body = await response.read() if raw else await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                body = str(e)
+            self.stats.record(method, endpoint, (time.perf_counter() - start) * 1000, status != 200)
+            if status is not None and status not in binance_client.RETRY_STATUS:
+                return status, body
+            if attempt < attempts - 1:
+                await asyncio.sleep(binance_client.BACKOFF_FACTOR * (2 ** attempt))
+        return status, body
+
+    @staticmethod
+    def _error(status, body):
+        """Error body of a failed order request; no response at all means the outcome is unknown."""
+        return body if status is not None else {"code": UNKNOWN_OUTCOME, "msg": body}
+
+    ###---- AsyncExchangeBackend
+    async def get_positions(self):
+        status, body = await self.request("GET", POSITION_ENDPOINT, raw=True)
+        if status != 200:
+            log.error("Error fetching positions: %s, Message: %s", status, body, extra={"status": status})
+            return None
+        return BinanceBackend.parse_positions(body)
+
+    async def get_open_orders(self, symbol=None):
+        status, body = await self.request("GET", OPEN_ORDERS_ENDPOINT, {"symbol": symbol} if symbol else None)
+        if status != 200:
+            log.error("Error fetching open orders%s: %s, Message: %s", f" for {symbol}" if symbol else "", status, body,
+                      extra={"symbol": symbol, "status": status})
+            return None
+        return [BinanceBackend.parse_order(raw) for raw in body]
+
+    async def place_close_order(self, symbol, side, order_type, stop_price, priority=None, client_order_id=None):
+        if priority is None and order_type == "STOP_MARKET":
+            priority = PROTECTIVE
+        status, body = await self.request("POST", ORDER_ENDPOINT, BinanceBackend.close_order_params(
+            symbol, side, order_type, stop_price, client_order_id), priority)
+        if status != 200:
+            return None, self._error(status, body)
+        return BinanceBackend.parse_order(body), None
+
+    async def place_close_orders(self, requests, priority=None):
+        results = []
+        for start in range(0, len(requests), MAX_BATCH_PLACE):
+            chunk = requests[start:start + MAX_BATCH_PLACE]
+            if len(chunk) == 1:
+                results += await super().place_close_orders(chunk, priority)
+                continue
+            chunk_priority = priority
+            if chunk_priority is None and any(r.type == "STOP_MARKET" for r in chunk):
+                chunk_priority = PROTECTIVE
+            batch = [{k: str(v) for k, v in BinanceBackend.close_order_params(r.symbol, r.side, r.type, r.stop_price,
+                                                                               r.client_order_id).items()} for r in chunk]
+            status, body = await self.request("POST", BATCH_ORDERS_ENDPOINT, {"batchOrders": json.dumps(batch)},
+                                              chunk_priority)
+            if status != 200:
+                results += [(None, self._error(status, body))] * len(chunk)
+                continue
+            results += [(BinanceBackend.parse_order(r), None) if "orderId" in r else (None, r) for r in body]
+        return results
+
+    async def cancel_orders(self, symbol, order_ids):
+        cancelled = []
+        for start in range(0, len(order_ids), MAX_BATCH_CANCEL):
+            chunk = order_ids[start:start + MAX_BATCH_CANCEL]
+            if len(chunk) == 1:
+                status, body = await self.request("DELETE", ORDER_ENDPOINT, {"symbol": symbol, "orderId": chunk[0]},
+                                                  PROTECTIVE)
+                results = [body] if status == 200 else []
+            else:
+                status, body = await self.request("DELETE", BATCH_ORDERS_ENDPOINT,
+                                                  {"symbol": symbol, "orderIdList": json.dumps(chunk)}, PROTECTIVE)
+                results = body if status == 200 else []
+            if status != 200:
+                log.error("[%s] Cancel of %s failed: %s", symbol, chunk, body, extra={"symbol": symbol})
+            cancelled += [r["orderId"] for r in results if "orderId" in r]
+        return cancelled
+
+    async def create_user_stream(self):
+        status, body = await self.request("POST", LISTEN_KEY_ENDPOINT, signed=False)
+        if status != 200:
+            log.error("Error creating listenKey: %s, Message: %s", status, body, extra={"status": status})
+            return None
+        return body["listenKey"]
+
+    async def keepalive_user_stream(self, key):
+        status, body = await self.request("PUT", LISTEN_KEY_ENDPOINT, signed=False)
+        if status != 200:
+            log.warning("listenKey keepalive failed: %s, Message: %s", status, body, extra={"status": status})
+        return status == 200
+
+    def print_stats(self):
+        self.stats.print_endpoints()
+
+
+###---- Backend registry: same names as exchange.BACKENDS (Dat.accounts "exchange", default BINANCE)
+BACKENDS = {"BINANCE": AsyncBinanceBackend}
+
+
+def register_backend(name, backend_class):
+    BACKENDS[name] = backend_class
+
+
+def create_backend(account=None):
+    """Async backend of `account` (default the current one), to be opened with `async with`."""
+    account = account or accounts.current()
+    return BACKENDS[account.exchange](account=account)
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_DOWN
+
+import Dat
+from binance_client import get_client
+from endpoints import binance_api
+from logging_pipeline import get_logger
+
+EXCHANGE_INFO_ENDPOINT = binance_api['EXCHANGE_INFO_ENDPOINT']
+CACHE_PATH = getattr(Dat, 'exchange_info_cache', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exchange_info_cache.json'))
+CACHE_TTL = getattr(Dat, 'exchange_info_ttl', 6 * 3600)    # Filters rarely change; refresh a few times a day
+
+_lock = threading.Lock()
+_filters = {}           # symbol -> {"tick_size": Decimal, "step_size": Decimal, "min_notional": Decimal}
+_fetched_at = 0.0
+log = get_logger(__name__)
+
+
+def legacy_tick(entry):
+    """The old `rounding = 2 if entry > 0.999 else 5` rule, as a tick size (symbols missing from exchangeInfo)."""
+    return Decimal("0.01") if entry > 0.999 else Decimal("0.00001")
+
+
+###---- Parse /fapi/v1/exchangeInfo
+def _parse(payload):
+    filters = {}
+    for s in payload.get("symbols", []):
+        by_type = {f["filterType"]: f for f in s.get("filters", [])}
+        filters[s["symbol"]] = {
+            "tick_size": Decimal(by_type.get("PRICE_FILTER", {}).get("tickSize", "0.01")),
+            "step_size": Decimal(by_type.get("LOT_SIZE", {}).get("stepSize", "0.001")),
+            "min_notional": Decimal(by_type.get("MIN_NOTIONAL", {}).get("notional", "0")),
+        }
+    return filters
+
+
+def _save(filters, fetched_at):
+    data = {"fetched_at": fetched_at,
+            "symbols": {sym: {k: str(v) for k, v in f.items()} for sym, f in filters.items()}}
+    tmp_path = CACHE_PATH + ".tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp_path, CACHE_PATH)
+
+
+def _load_from_disk():
+    try:
+        with open(CACHE_PATH) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None, 0.0
+    filters = {sym: {k: Decimal(v) for k, v in f.items()} for sym, f in data.get("symbols", {}).items()}
+    return filters, float(data.get("fetched_at", 0))
+
+
+def refresh():
+    """Fetch exchangeInfo now and persist it. Keeps the previous filters if the request fails."""
+    global _filters, _fetched_at
+    response = get_client().get(EXCHANGE_INFO_ENDPOINT, signed=False)
+    if response.status_code != 200:
+        log.error("Error fetching exchangeInfo: %s, Message: %s", response.status_code, response.text)
+        return False
+    filters, fetched_at = _parse(response.json()), time.time()
+    with _lock:
+        _filters, _fetched_at = filters, fetched_at
+    try:
+        _save(filters, fetched_at)
+    except OSError as e:
+        log.warning("Could not persist exchangeInfo cache: %s", e)
+    log.info("[EXCHANGE INFO] Loaded filters for %s symbols", len(filters))
+    return True
+
+
+def load():
+    """Startup: use the on-disk cache while it is fresh, otherwise fetch it."""
+    global _filters, _fetched_at
+    filters, fetched_at = _load_from_disk()
+    if filters and time.time() - fetched_at < CACHE_TTL:
+        with _lock:
+            _filters, _fetched_at = filters, fetched_at
+        log.info("[EXCHANGE INFO] Using cached filters for %s symbols", len(filters))
+        return
+    if not refresh() and filters:
+        with _lock:
+            _filters, _fetched_at = filters, fetched_at      # Stale beats nothing
+        log.warning("[EXCHANGE INFO] Using stale on-disk filters")
+
+
+def refresh_if_stale():
+    if time.time() - _fetched_at >= CACHE_TTL:
+        refresh()
+
+
+def invalidate():
+    """Force a refresh on the next refresh_if_stale() (e.g. after a precision rejection)."""
+    global _fetched_at
+    _fetched_at = 0.0
+
+
+###---- Lookups (no I/O: unknown symbols fall back to the legacy rule)
+def symbol_filters(symbol):
+    return _filters.get(symbol)
+
+
+def tick_size(symbol, entry):
+    f = _filters.get(symbol)
+    return f["tick_size"] if f else legacy_tick(entry)
+
+
+def round_price(symbol, price, entry=None):
+    """Nearest multiple of the symbol's tick size, as a float with a clean decimal representation."""
+    tick = tick_size(symbol, price if entry is None else entry)
+    return float((Decimal(str(price)) / tick).to_integral_value(ROUND_HALF_EVEN) * tick)
+
+
+def round_quantity(symbol, quantity):
+    """Round a quantity down to the symbol's step size."""
+    f = _filters.get(symbol)
+    step = f["step_size"] if f else Decimal("0.001")
+    return float((Decimal(str(quantity)) / step).to_integral_value(ROUND_DOWN) * step)
+
+
+def meets_min_notional(symbol, quantity, price):
+    f = _filters.get(symbol)
+    return f is None or Decimal(str(quantity)) * Decimal(str(price)) >= f["min_notional"]
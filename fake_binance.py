@@ -0,0 +1,370 @@
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import Dat
+import rate_limiter
+from endpoints import binance_api
+
+RECV_WINDOW = 5000      # ms, Binance's default recvWindow
+
+ERRORS = {
+    "bad_key": (401, -2015, "Invalid API-key, IP, or permissions for action."),
+    "bad_signature": (400, -1022, "Signature for this request is not valid."),
+    "bad_timestamp": (400, -1021, "Timestamp for this request is outside of the recvWindow."),
+    "unknown_order": (400, -2011, "Unknown order sent."),
+    "duplicate_client_id": (400, -4116, "ClientOrderId is duplicated."),
+    "bad_precision": (400, -4014, "Price not increased by tick size."),
+    "missing_param": (400, -1102, "Mandatory parameter was not sent, was empty/null, or malformed."),
+    "internal": (503, -1001, "Internal error; unable to process your request. Please try again."),
+    "rate_limited": (429, -1003, "Too many requests; please use the websocket for live updates."),
+    "not_found": (404, -5000, "Path not found."),
+}
+
+
+class FakeBinance:
+    """
+    In-memory futures account: synthetic positions whose mark prices random-walk on every positionRisk
+    call, and close-position orders that fill (closing the position) when the mark crosses them.
+    """
+
+    def __init__(self, positions=100, idle_symbols=0, volatility=0.002, respawn=True, seed=0,
+                 api_key=Dat.BinK, api_secret=Dat.BinS, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, rate_limit_rate=0.0, step_seconds=None):
+        self.api_key = api_key
+        self._secret = api_secret.encode('utf-8')
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.volatility = volatility
+        self.step_seconds = step_seconds    # None: marks step on every price read; else once per step_seconds of wall time
+        self._last_step = time.monotonic()
+        self.respawn = respawn
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_order_id = 1
+        self._weights = deque()         # (time, weight) of the last minute
+        self._orders_sent = deque()     # time of each order placement of the last minute
+        self.positions = {}             # symbol -> position dict (floats)
+        self.orders = {}                # orderId -> order dict
+        self.client_ids = set()         # clientOrderId of the open orders (Binance: unique among open orders)
+        self.counters = {}
+        for i in range(positions):
+            self._open_position(f"FAKE{i:04d}USDT")
+        for i in range(idle_symbols):
+            self.positions[f"IDLE{i:04d}USDT"] = self._flat_position(f"IDLE{i:04d}USDT")
+
+    ###---- Synthetic positions
+    def _flat_position(self, symbol):
+        return {"symbol": symbol, "positionAmt": 0.0, "entryPrice": 0.0, "breakEvenPrice": 0.0, "markPrice": 1.0,
+                "leverage": 10, "marginType": "cross", "positionSide": "BOTH", "updateTime": 0}
+
+    def _open_position(self, symbol):
+        entry = round(10 ** self._rng.uniform(-1, 4), 2 if self._rng.random() < 0.7 else 4)
+        entry = max(entry, 0.01)
+        amt = round(self._rng.uniform(10, 1000) / entry, 3) or 0.001
+        amt = amt if self._rng.random() < 0.5 else -amt
+        fee = 0.0008 if amt > 0 else -0.0008
+        self.positions[symbol] = {
+            "symbol": symbol, "positionAmt": amt, "entryPrice": entry, "breakEvenPrice": entry * (1 + fee),
+            "markPrice": entry, "leverage": self._rng.choice([5, 10, 20]), "marginType": "cross",
+            "positionSide": "BOTH", "updateTime": int(time.time() * 1000),
+        }
+
+    def _tick_size(self, symbol):
+        p = self.positions.get(symbol)
+        return 0.01 if p is None or p["entryPrice"] == 0 or p["entryPrice"] > 0.999 else 0.0001
+
+    def _move_marks(self):
+        steps = 1
+        if self.step_seconds:
+            now = time.monotonic()
+            steps = min(100, int((now - self._last_step) / self.step_seconds))
+            self._last_step += steps * self.step_seconds
+        for _ in range(steps):
+            self._step_marks()
+
+    def _step_marks(self):
+        by_symbol = {}
+        for order in self.orders.values():
+            by_symbol.setdefault(order["symbol"], []).append(order)
+        for symbol, p in self.positions.items():
+            if p["positionAmt"] == 0:
+                continue
+            p["markPrice"] = round(p["markPrice"] * (1 + self._rng.gauss(0, self.volatility)), 6)
+            self._trigger_orders(symbol, p["markPrice"], by_symbol.get(symbol, ()))
+
+    def _trigger_orders(self, symbol, mark, orders):
+        p = self.positions[symbol]
+        long = p["positionAmt"] > 0
+        for order in orders:
+            stop = float(order["stopPrice"])
+            if order["type"] == "STOP_MARKET":
+                hit = mark <= stop if long else mark >= stop
+            else:
+                hit = mark >= stop if long else mark <= stop
+            if hit:
+                self._count("fills")
+                for o in orders:
+                    del self.orders[o["orderId"]]
+                    self.client_ids.discard(o["clientOrderId"])
+                if self.respawn:
+                    self._open_position(symbol)
+                else:
+                    self.positions[symbol] = self._flat_position(symbol)
+                return
+
+    def _position_json(self, p):
+        amt, entry, mark = p["positionAmt"], p["entryPrice"], p["markPrice"]
+        return {"symbol": p["symbol"], "positionAmt": f"{amt}", "entryPrice": f"{entry}",
+                "breakEvenPrice": f"{p['breakEvenPrice']}", "markPrice": f"{mark}",
+                "unRealizedProfit": f"{amt * (mark - entry)}", "liquidationPrice": "0",
+                "leverage": f"{p['leverage']}", "maxNotionalValue": "1000000", "marginType": p["marginType"],
+                "isolatedMargin": "0.00000000", "isAutoAddMargin": "false", "positionSide": p["positionSide"],
+                "notional": f"{amt * mark}", "isolatedWallet": "0", "updateTime": p["updateTime"]}
+
+    ###---- Endpoints (called with the lock held)
+    def position_risk(self, params):
+        self._move_marks()
+        return 200, [self._position_json(p) for p in self.positions.values()]
+
+    def premium_index(self, params):
+        """Mark prices; like positionRisk, every read moves them one step."""
+        self._move_marks()
+        symbol = params.get("symbol")
+        if symbol is not None and symbol not in self.positions:
+            return 400, {"code": -1121, "msg": "Invalid symbol."}
+        marks = [{"symbol": s, "markPrice": f"{p['markPrice']}", "time": int(time.time() * 1000)}
+                 for s, p in self.positions.items() if symbol is None or s == symbol]
+        return 200, marks[0] if symbol else marks
+
+    def open_orders(self, params):
+        symbol = params.get("symbol")
+        return 200, [o for o in self.orders.values() if symbol is None or o["symbol"] == symbol]
+
+    def new_order(self, params):
+        for name in ("symbol", "side", "type"):
+            if name not in params:
+                return self._error("missing_param")
+        client_id = params.get("newClientOrderId") or f"fake_{self._next_order_id}"
+        if client_id in self.client_ids:
+            return self._error("duplicate_client_id")
+        stop = params.get("stopPrice", "0")
+        tick = self._tick_size(params["symbol"])
+        if abs(float(stop) / tick - round(float(stop) / tick)) > 1e-6:
+            return self._error("bad_precision")
+        order = {"orderId": self._next_order_id, "symbol": params["symbol"], "status": "NEW",
+                 "clientOrderId": client_id, "price": "0", "avgPrice": "0", "origQty": "0", "executedQty": "0",
+                 "type": params["type"], "side": params["side"], "stopPrice": stop,
+                 "closePosition": params.get("closePosition") == "true", "workingType": "CONTRACT_PRICE",
+                 "timeInForce": "GTC", "reduceOnly": True, "updateTime": int(time.time() * 1000)}
+        self._next_order_id += 1
+        self.orders[order["orderId"]] = order
+        self.client_ids.add(client_id)
+        self._orders_sent.append(time.monotonic())
+        return 200, order
+
+    def new_batch(self, params):
+        """Up to 5 orders; every entry succeeds or fails on its own, as on Binance."""
+        batch = json.loads(params.get("batchOrders", "[]"))
+        if not batch or len(batch) > 5:
+            return self._error("missing_param")
+        return 200, [self.new_order(order)[1] for order in batch]
+
+    def _cancel(self, symbol, order_id=None, client_id=None):
+        for oid, order in self.orders.items():
+            if order["symbol"] == symbol and (oid == order_id or (client_id and order["clientOrderId"] == client_id)):
+                del self.orders[oid]
+                self.client_ids.discard(order["clientOrderId"])
+                return dict(order, status="CANCELED")
+        return None
+
+    def cancel_order(self, params):
+        order = self._cancel(params.get("symbol"), int(params["orderId"]) if "orderId" in params else None,
+                             params.get("origClientOrderId"))
+        return (200, order) if order else self._error("unknown_order")
+
+    def cancel_batch(self, params):
+        results = []
+        for order_id in json.loads(params.get("orderIdList", "[]")):
+            order = self._cancel(params.get("symbol"), int(order_id))
+            status, body = (200, order) if order else self._error("unknown_order")
+            results.append(body)
+        return 200, results
+
+    def cancel_all(self, params):
+        for order in [o for o in self.orders.values() if o["symbol"] == params.get("symbol")]:
+            del self.orders[order["orderId"]]
+            self.client_ids.discard(order["clientOrderId"])
+        return 200, {"code": 200, "msg": "The operation of cancel all open order is done."}
+
+    def exchange_info(self, params):
+        symbols = [{"symbol": s, "filters": [
+            {"filterType": "PRICE_FILTER", "tickSize": f"{self._tick_size(s):.4f}"},
+            {"filterType": "LOT_SIZE", "stepSize": "0.001"},
+            {"filterType": "MIN_NOTIONAL", "notional": "5"}]} for s in self.positions]
+        return 200, {"timezone": "UTC", "symbols": symbols}
+
+    def listen_key(self, params):
+        return 200, {"listenKey": "fakeListenKey"}
+
+    ###---- Request plumbing
+    def _error(self, name):
+        status, code, msg = ERRORS[name]
+        return status, {"code": code, "msg": msg}
+
+    def _count(self, key, amount=1):
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def verify(self, headers, raw_query, params):
+        """Binance signed-endpoint checks: API key header, HMAC-SHA256 of the query, recvWindow."""
+        if headers.get("X-MBX-APIKEY") != self.api_key:
+            return "bad_key"
+        payload, sep, signature = raw_query.rpartition("&signature=")
+        if not sep:
+            return "bad_signature"
+        expected = hmac.new(self._secret, payload.encode('utf-8'), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            return "bad_signature"
+        window = int(params.get("recvWindow", RECV_WINDOW))
+        if abs(time.time() * 1000 - int(params.get("timestamp", 0))) > window:
+            return "bad_timestamp"
+        return None
+
+    def used_weight(self, weight):
+        now = time.monotonic()
+        self._weights.append((now, weight))
+        while self._weights and now - self._weights[0][0] > 60:
+            self._weights.popleft()
+        while self._orders_sent and now - self._orders_sent[0] > 60:
+            self._orders_sent.popleft()
+        return sum(w for _, w in self._weights)
+
+    def handle(self, method, path, raw_query, headers):
+        """Return (status, body, extra headers) for one request."""
+        delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000)
+        params = dict(parse_qsl(raw_query, keep_blank_values=True))
+        route = ROUTES.get((method, path))
+        with self._lock:
+            self._count("requests")
+            self._count(f"{method} {path}")
+            weight = rate_limiter.request_weight(method, path, params)
+            self._count("weight", weight)
+            used = self.used_weight(weight)
+            extra = {"X-MBX-USED-WEIGHT-1M": str(used)}
+            if route is None:
+                return (*self._error("not_found"), extra)
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate:
+                self._count("injected_429")
+                return (*self._error("rate_limited"), dict(extra, **{"Retry-After": "1"}))
+            if roll < self.rate_limit_rate + self.error_rate:
+                self._count("injected_errors")
+                return (*self._error("internal"), extra)
+            handler, signed = route
+            if signed:
+                problem = self.verify(headers, raw_query, params)
+                if problem:
+                    self._count(problem)
+                    return (*self._error(problem), extra)
+            status, body = handler(self, params)
+            if path in rate_limiter.ORDER_ENDPOINTS and method == "POST":
+                extra["X-MBX-ORDER-COUNT-1M"] = str(len(self._orders_sent))
+                extra["X-MBX-ORDER-COUNT-10S"] = str(sum(1 for t in self._orders_sent if time.monotonic() - t < 10))
+            return status, body, extra
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, open_positions=sum(1 for p in self.positions.values() if p["positionAmt"]),
+                        open_orders=len(self.orders))
+
+    def reset_stats(self):
+        with self._lock:
+            self.counters = {}
+
+
+ROUTES = {
+    ("GET", binance_api['POSITION_ENDPOINT']): (FakeBinance.position_risk, True),
+    ("GET", binance_api['OPEN_ORDERS_ENDPOINT']): (FakeBinance.open_orders, True),
+    ("POST", binance_api['ORDER_ENDPOINT']): (FakeBinance.new_order, True),
+    ("POST", binance_api['BATCH_ORDERS_ENDPOINT']): (FakeBinance.new_batch, True),
+    ("DELETE", binance_api['ORDER_ENDPOINT']): (FakeBinance.cancel_order, True),
+    ("DELETE", binance_api['BATCH_ORDERS_ENDPOINT']): (FakeBinance.cancel_batch, True),
+    ("DELETE", binance_api['ALL_OPEN_ORDERS_ENDPOINT']): (FakeBinance.cancel_all, True),
+    ("GET", binance_api['EXCHANGE_INFO_ENDPOINT']): (FakeBinance.exchange_info, False),
+    ("GET", binance_api['PREMIUM_INDEX_ENDPOINT']): (FakeBinance.premium_index, False),
+    ("POST", binance_api['LISTEN_KEY_ENDPOINT']): (FakeBinance.listen_key, False),
+    ("PUT", binance_api['LISTEN_KEY_ENDPOINT']): (FakeBinance.listen_key, False),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # Keep-alive, like fapi.binance.com
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes; avoid the delayed-ACK stall
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        raw_query = url.query
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length).decode('utf-8')
+            raw_query = f"{raw_query}&{body}" if raw_query else body
+        status, body, extra = self.server.exchange.handle(self.command, url.path, raw_query, self.headers)
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in extra.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_DELETE = do_PUT = _dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(exchange, host="127.0.0.1", port=0):
+    """Start the server in a daemon thread; returns (server, base_url). port=0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.exchange = exchange
+    threading.Thread(target=server.serve_forever, name="fake-binance", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for fapi.binance.com (set BINANCE_BASE_URL to its URL).")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--positions", type=int, default=100)
+    parser.add_argument("--idle-symbols", type=int, default=0, help="Extra zero-amount entries in positionRisk")
+    parser.add_argument("--volatility", type=float, default=0.002, help="Mark-price volatility per step")
+    parser.add_argument("--step-seconds", type=float, help="Step marks once per this many seconds (default: on every read)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    args = parser.parse_args()
+
+    fake = FakeBinance(positions=args.positions, idle_symbols=args.idle_symbols, volatility=args.volatility,
+                       latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                       rate_limit_rate=args.rate_limit_rate, step_seconds=args.step_seconds)
+    server, url = serve(fake, port=args.port)
+    print(f"[FAKE BINANCE] {args.positions} positions at {url}  (export BINANCE_BASE_URL={url})")
+    try:
+        while True:
+            time.sleep(30)
+            print(f"[FAKE BINANCE] {fake.stats()}")
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import json
+
+import websockets
+
+
+###---- Load a recording made with `stream_monitor.py --record`
+def load_recording(path):
+    """Each line: {"t": seconds since start, "stream": "user" | "market", "msg": <message as received>}."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayServer:
+    """
+    Local stand-in for fstream.binance.com: `/ws/<listenKey>` replays the recorded user-data messages,
+    `/stream?streams=...` the market messages, each with the recorded timing divided by `speed`.
+    """
+
+    def __init__(self, recording, speed=1.0, loop_forever=False):
+        self.recording = recording
+        self.speed = speed
+        self.loop_forever = loop_forever
+
+    async def handler(self, websocket, path=None):
+        if path is None:    # websockets >= 13 passes only the connection
+            path = websocket.request.path
+        stream = "user" if path.startswith("/ws/") else "market"
+        messages = [m for m in self.recording if m["stream"] == stream]
+        print(f"[FAKE-WS] {stream} client connected ({len(messages)} messages to replay)")
+        while True:
+            previous = 0.0
+            for message in messages:
+                await asyncio.sleep(max(message["t"] - previous, 0) / self.speed)
+                previous = message["t"]
+                await websocket.send(json.dumps(message["msg"]))
+            if not self.loop_forever:
+                break
+        await websocket.wait_closed()
+
+
+async def serve(recording_path, host, port, speed, loop_forever):
+    server = ReplayServer(load_recording(recording_path), speed, loop_forever)
+    async with websockets.serve(server.handler, host, port):
+        print(f"[FAKE-WS] Replaying {recording_path} on ws://{host}:{port} (speed x{speed})")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded Binance futures WebSocket messages locally.")
+    parser.add_argument("recording", help="JSONL file written by stream_monitor.py --record")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier")
+    parser.add_argument("--loop", action="store_true", help="Start the recording again when it ends")
+    args = parser.parse_args()
+    asyncio.run(serve(args.recording, args.host, args.port, args.speed, args.loop))
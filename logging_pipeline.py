@@ -0,0 +1,137 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import Dat
+import accounts
+
+###---- Settings (override from Dat if present)
+LOG_LEVEL = getattr(Dat, 'log_level', 'INFO')
+LOG_FILE = getattr(Dat, 'log_file', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'trading_monitor.log'))
+LOG_MAX_BYTES = getattr(Dat, 'log_max_bytes', 20 * 1024 * 1024)
+LOG_BACKUPS = getattr(Dat, 'log_backups', 5)
+LOG_CONSOLE = getattr(Dat, 'log_console', True)
+# Keep 1 of every N records per message template at these levels (per-symbol, per-tick messages)
+LOG_SAMPLE_EVERY = getattr(Dat, 'log_sample_every', {"DEBUG": 10})
+
+ROOT_LOGGER = "trading_monitor"
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and goes into the JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_configured = False
+_config_lock = threading.Lock()
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the structured fields passed via `extra=`."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Let through 1 of every N records of the same message template at the sampled levels."""
+
+    def __init__(self, every_by_level):
+        super().__init__()
+        self.every = {logging.getLevelName(level) if isinstance(level, str) else level: n
+                      for level, n in every_by_level.items()}
+        self._seen = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        every = self.every.get(record.levelno)
+        if not every or every <= 1:
+            return True
+        key = (record.name, record.msg)
+        count = self._seen.get(key, 0)
+        self._seen[key] = count + 1
+        if count % every == 0:
+            return True
+        self.dropped += 1
+        return False
+
+
+class AccountFilter(logging.Filter):
+    """Tag each record with the account it was logged for (runs in the logging thread, see accounts.use())."""
+
+    def filter(self, record):
+        if not hasattr(record, "account"):
+            record.account = accounts.current_name()
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    """Enqueue the record untouched: formatting happens on the listener thread, not in the loop."""
+
+    def prepare(self, record):
+        return record
+
+
+def configure(level=LOG_LEVEL, log_file=LOG_FILE, console=LOG_CONSOLE, console_format="%(message)s"):
+    """
+    Route the `trading_monitor` loggers through a queue to a rotating JSON file (and the console).
+    Records carry an `account` field; multi-account runs put it in `console_format` too.
+    """
+    global _configured, _listener
+    with _config_lock:
+        if _configured:
+            return
+        handlers = []
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+            file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(logging.Formatter(console_format))
+            handlers.append(console_handler)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_EVERY))
+        queue_handler.addFilter(AccountFilter())
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+        _configured = True
+
+
+def shutdown():
+    """Drain the queue and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name):
+    """
+    `log = get_logger(__name__)`: a child of the trading_monitor logger. Entry points call configure();
+    until then only warnings and errors reach stderr (e.g. backtest workers, benchmarks).
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -0,0 +1,182 @@
+import bisect
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import Dat
+from logging_pipeline import get_logger
+
+###---- Settings (override from Dat if present)
+ENABLED = getattr(Dat, 'metrics_enabled', False)
+METRICS_HOST = getattr(Dat, 'metrics_host', '127.0.0.1')
+METRICS_PORT = getattr(Dat, 'metrics_port', 9108)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "cycle_seconds": "Duration of a full monitoring cycle.",
+    "cycle_stage_seconds": "Duration of each stage of a monitoring cycle.",
+    "binance_request_seconds": "Binance REST request latency by endpoint.",
+    "binance_requests_total": "Binance REST requests by endpoint.",
+    "binance_request_errors_total": "Binance REST requests that failed or returned a non-200 status.",
+    "db_query_seconds": "Time spent in store_data/position_history DB functions.",
+    "db_queries_total": "Calls of store_data/position_history DB functions.",
+    "symbol_checks_total": "Between-cycle checks of one symbol by the adaptive scheduler.",
+    "poll_interval_seconds": "Check interval the adaptive scheduler gave a symbol.",
+}
+
+log = get_logger(__name__)
+_lock = threading.Lock()
+_counters = {}      # (name, labels) -> value
+_histograms = {}    # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+###---- Recording (every entry point returns immediately when disabled)
+def inc(name, amount=1, **labels):
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(SECONDS_BUCKETS, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(SECONDS_BUCKETS) + 1) + [0.0]
+        histogram[index] += 1
+        histogram[-1] += value
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """`with metrics.timer("cycle_stage_seconds", stage="db_sync"):` — a shared no-op when disabled."""
+    return _Timer(name, labels) if ENABLED else _NULL_TIMER
+
+
+def timed(label=None, name="db_query_seconds", counter="db_queries_total"):
+    """Decorator: time and count each call, labelled with `label` or the function name."""
+    def decorator(func):
+        function = label or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, function=function)
+                inc(counter, function=function)
+        return wrapper
+    return decorator
+
+
+###---- Prometheus text exposition
+def _escape(value):
+    """Label value as the text format requires: backslash, double quote and newline escaped."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render():
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+    lines = []
+    for kind, series in (("counter", counters), ("histogram", histograms)):
+        for name in sorted({n for n, _ in series}):
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(series.items()):
+                if metric != name:
+                    continue
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(SECONDS_BUCKETS + ("+Inf",), value[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {value[-1]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve /metrics from a daemon thread. Does nothing when metrics are disabled."""
+    if not ENABLED:
+        return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("[METRICS] Serving http://%s:%s/metrics", host, server.server_address[1])
+    return server
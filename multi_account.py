@@ -0,0 +1,103 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Dat
+import accounts
+import binance_ops
+import db_pool
+import exchange_info
+import metrics
+import profiler
+import read_api
+import scheduler as symbol_scheduler
+import state_store
+import store_data
+from logging_pipeline import configure as configure_logging, get_logger
+
+###---- Runner settings (override from Dat if present)
+CYCLE_INTERVAL = getattr(Dat, 'cycle_interval', 5)         # Seconds between cycle starts of each account
+STATS_CYCLES = 30                                          # Cycles between stats prints, as in the sync loop
+ERROR_BACKOFF_MAX = 60                                     # Longest pause after consecutive failed cycles
+
+log = get_logger(__name__)
+
+
+###---- One account's monitoring loop (runs in its own worker thread)
+def run_account(account, stop):
+    """
+    binance_ops.run_cycle() for `account` every CYCLE_INTERVAL seconds (scheduler.FULL_CYCLE_INTERVAL with
+    adaptive polling, positions being polled and symbols near a threshold checked in between) until `stop` is set.
+    """
+    with accounts.use(account):
+        store = state_store.StateStore()
+        store.load()
+        scheduler = None
+        if symbol_scheduler.ADAPTIVE_POLLING:
+            scheduler = symbol_scheduler.SymbolScheduler(binance_ops.TRAIL_PERCENT, binance_ops.ACTIVATION_BUFFER)
+        counter, failures = 0, 0
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                pnl_sum = binance_ops.run_cycle(store, scheduler)
+                failures = 0
+            except Exception:
+                # One account failing must not take the others down
+                failures += 1
+                log.exception("Cycle failed (%s in a row)", failures, extra={"failures": failures})
+                stop.wait(min(CYCLE_INTERVAL * 2 ** failures, ERROR_BACKOFF_MAX))
+                continue
+
+            if counter % STATS_CYCLES == 0:
+                binance_ops.print_account_stats(store, scheduler)
+            counter += 1
+            log.info("Total unrealized PnL this cycle: %s", round(pnl_sum, 2), extra={"pnl_sum": round(pnl_sum, 2)})
+            if scheduler is not None:
+                scheduler.run_until(started + symbol_scheduler.FULL_CYCLE_INTERVAL, store, stop)
+            else:
+                stop.wait(max(0.0, CYCLE_INTERVAL - (time.monotonic() - started)))
+
+
+def run(account_list, stop=None):
+    """Monitor every account in `account_list` concurrently; the HTTP session, DB pool and rate limiter are shared."""
+    stop = stop or threading.Event()
+    # One pooled DB connection per account worker, plus the history writer and a spare
+    db_pool.configure(max(db_pool.POOL_SIZE, len(account_list) + 2))
+    store_data.ensure_account_column()
+    exchange_info.load()
+
+    with ThreadPoolExecutor(max_workers=len(account_list), thread_name_prefix="account") as pool:
+        workers = {pool.submit(run_account, account, stop): account for account in account_list}
+        log.info("[ACCOUNTS] Monitoring %s accounts: %s", len(account_list), ", ".join(a.name for a in account_list))
+        try:
+            while not stop.wait(CYCLE_INTERVAL * STATS_CYCLES):
+                binance_ops.print_shared_stats()
+                for future, account in workers.items():
+                    if future.done() and future.exception() is not None:
+                        log.error("[ACCOUNTS] Worker of %s stopped: %r", account.name, future.exception(),
+                                  extra={"account": account.name})
+        except KeyboardInterrupt:
+            log.info("[ACCOUNTS] Stopping")
+        finally:
+            stop.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor several Binance accounts (Dat.accounts) from one process.")
+    parser.add_argument("--accounts", help="Comma-separated account names to run (default: all in Dat.accounts)")
+    args = parser.parse_args()
+
+    configure_logging(console_format="[%(account)s] %(message)s")
+    metrics.start_server()     # Only when Dat.metrics_enabled
+    read_api.start_server()    # Only when Dat.read_api_enabled
+    profiler.install_signal_handler()     # kill -USR2 <pid> profiles the next cycles of every account
+
+    account_list = accounts.load_accounts()
+    if args.accounts:
+        wanted = args.accounts.split(",")
+        unknown = set(wanted) - {a.name for a in account_list}
+        if unknown:
+            parser.error(f"Unknown accounts: {', '.join(sorted(unknown))}")
+        account_list = [a for a in account_list if a.name in wanted]
+    run(account_list)
@@ -0,0 +1,61 @@
+from exchange import get_backend
+from logging_pipeline import get_logger
+
+PROTECTIVE_TYPES = ("STOP_MARKET", "TAKE_PROFIT_MARKET")
+log = get_logger(__name__)
+
+
+class OpenOrdersSnapshot:
+    """
+    Open orders (exchange.Order) of every symbol, fetched once per cycle and indexed as {symbol: {type: [orders]}}.
+    Orders we place or cancel during the cycle are applied locally so the view stays consistent.
+    """
+
+    def __init__(self, orders=()):
+        self._by_symbol = {}
+        for order in orders:
+            self.add(order)
+
+    def orders(self, symbol, order_type=None):
+        by_type = self._by_symbol.get(symbol, {})
+        if order_type is not None:
+            return list(by_type.get(order_type, ()))
+        return [order for orders in by_type.values() for order in orders]
+
+    def stop_price(self, symbol, order_type="STOP_MARKET"):
+        """stop_price of the first order of this type, or None."""
+        orders = self._by_symbol.get(symbol, {}).get(order_type)
+        return orders[0].stop_price if orders else None
+
+    def has_sl_tp(self, symbol, order_types=PROTECTIVE_TYPES):
+        by_type = self._by_symbol.get(symbol, {})
+        return any(by_type.get(order_type) for order_type in order_types)
+
+    def has_client_order_id(self, symbol, client_order_id):
+        return any(o.client_order_id == client_order_id for o in self.orders(symbol))
+
+    def add(self, order):
+        """Register an order (openOrders entry, placed order or stream event); known order ids are ignored."""
+        if order is None:
+            return
+        by_type = self._by_symbol.setdefault(order.symbol, {})
+        orders = by_type.setdefault(order.type, [])
+        if all(o.order_id != order.order_id for o in orders):
+            orders.append(order)
+
+    def remove(self, symbol, order_id):
+        by_type = self._by_symbol.get(symbol, {})
+        for order_type, orders in by_type.items():
+            by_type[order_type] = [o for o in orders if o.order_id != order_id]
+
+    def __len__(self):
+        return sum(len(orders) for by_type in self._by_symbol.values() for orders in by_type.values())
+
+
+###---- One unfiltered openOrders call for all symbols
+def fetch_snapshot():
+    """Return an OpenOrdersSnapshot, or None if the request failed (callers fall back to per-symbol lookups)."""
+    orders = get_backend().get_open_orders()
+    if orders is None:
+        return None
+    return OpenOrdersSnapshot(orders)
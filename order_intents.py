@@ -0,0 +1,143 @@
+import asyncio
+import threading
+from dataclasses import dataclass
+
+import Dat
+import exchange
+import place_orders
+import profiler
+from logging_pipeline import get_logger
+
+###---- Dispatch settings (override from Dat if present)
+DISPATCH_ATTEMPTS = getattr(Dat, 'intent_dispatch_attempts', 2)   # Sends of one intent when the outcome is unknown
+RETRY_CODES = (-1001, -1007)    # Internal error / timeout, execution status unknown: same id, safe to re-send
+
+log = get_logger(__name__)
+
+_stats_lock = threading.Lock()
+intent_stats = {"submitted": 0, "collapsed": 0, "already_open": 0, "placed": 0, "adopted": 0, "rejected": 0,
+                "retried": 0, "batches": 0}
+
+
+@dataclass(slots=True)
+class OrderIntent:
+    """A close order the decision code wants; client_order_id is derived from symbol, type and stop level."""
+    symbol: str
+    side: str
+    type: str
+    stop_price: float
+    client_order_id: str
+    attempts: int = 0
+
+
+def _count(**counts):
+    with _stats_lock:
+        for key, n in counts.items():
+            intent_stats[key] += n
+
+
+class IntentQueue:
+    """
+    Orders emitted by one cycle's decisions, placed by dispatch() (dispatch_async() in the asyncio monitors)
+    in exchange batches.
+    Identical pending intents collapse into one and intents whose order is already open (same
+    newClientOrderId in the snapshot) are dropped, so every request places an order we still need.
+    Because the id is deterministic, an intent whose outcome is unknown is simply sent again.
+    """
+
+    def __init__(self, snapshot=None):
+        self.snapshot = snapshot
+        self._pending = {}      # client_order_id -> OrderIntent, in submission order
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, symbol, side, order_type, stop_price):
+        """Queue a closePosition order; return its intent, or None if that exact order is already open."""
+        client_order_id = exchange.client_order_id(symbol, order_type, stop_price)
+        intent = self._pending.get(client_order_id)
+        if intent is not None:
+            _count(submitted=1, collapsed=1)
+            return intent
+        if self.snapshot is not None and self.snapshot.has_client_order_id(symbol, client_order_id):
+            _count(submitted=1, already_open=1)
+            return None
+        intent = self._pending[client_order_id] = OrderIntent(symbol, side, order_type, stop_price, client_order_id)
+        _count(submitted=1)
+        return intent
+
+    def _next_batch(self):
+        intents = list(self._pending.values())
+        self._pending.clear()
+        for intent in intents:
+            intent.attempts += 1
+        _count(batches=-(-len(intents) // exchange.MAX_BATCH_PLACE))
+        return intents
+
+    def _requeue(self, intent, order, error):
+        """Queue an intent whose outcome is unknown for another send; False once it is settled."""
+        if order is None and isinstance(error, dict) and error.get("code") in RETRY_CODES \
+                and intent.attempts < DISPATCH_ATTEMPTS:
+            self._pending[intent.client_order_id] = intent
+            _count(retried=1)
+            return True
+        return False
+
+    @staticmethod
+    def _count_outcome(order, settled):
+        _count(**{"rejected" if settled is None else "placed" if order is not None else "adopted": 1})
+
+    @profiler.traced("order_dispatch")
+    def dispatch(self):
+        """Place every pending intent; return {client_order_id: exchange.Order or None}."""
+        placed = {}
+        while self._pending:
+            intents = self._next_batch()
+            try:
+                results = exchange.get_backend().place_close_orders(intents)
+            except OSError as e:     # requests.RequestException: nothing known about the batch
+                results = [(None, {"code": -1007, "msg": str(e)})] * len(intents)
+
+            for intent, (order, error) in zip(intents, results):
+                if self._requeue(intent, order, error):
+                    continue
+                settled = place_orders.settle_placement(intent.symbol, intent.type, intent.stop_price, order, error,
+                                                        self.snapshot, intent.client_order_id)
+                self._count_outcome(order, settled)
+                placed[intent.client_order_id] = settled
+        return placed
+
+    async def dispatch_async(self, backend):
+        """dispatch() for the asyncio monitors: sent on an exchange_async backend, DB writes in a worker thread."""
+        placed = {}
+        while self._pending:
+            intents = self._next_batch()
+            results = await backend.place_close_orders(intents)
+
+            for intent, (order, error) in zip(intents, results):
+                if self._requeue(intent, order, error):
+                    continue
+                settled = order
+                if place_orders.is_duplicate(order, error, intent.client_order_id):
+                    settled = place_orders.adopt_open_order(intent.symbol, intent.type, intent.stop_price,
+                                                            intent.client_order_id,
+                                                            await backend.get_open_orders(intent.symbol))
+                settled = place_orders.record_placement(intent.symbol, intent.type, intent.stop_price, settled, error,
+                                                        self.snapshot)
+                if settled is not None and intent.type == "TAKE_PROFIT_MARKET":
+                    await asyncio.to_thread(place_orders.record_take_profit, intent.symbol, intent.stop_price)
+                self._count_outcome(order, settled)
+                placed[intent.client_order_id] = settled
+        return placed
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(intent_stats)
+
+
+def print_stats():
+    s = get_stats()
+    log.info("[INTENTS] submitted=%s collapsed=%s already_open=%s placed=%s adopted=%s rejected=%s retried=%s batches=%s",
+             s['submitted'], s['collapsed'], s['already_open'], s['placed'], s['adopted'], s['rejected'], s['retried'],
+             s['batches'], extra=s)
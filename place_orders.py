@@ -1,93 +1,125 @@
-import requests
+import threading
 import time
-import api_actions
-from endpoints import binance_api
-import Dat
+import exchange_info
+import profiler
+from exchange import DUPLICATE_CLIENT_ID, client_order_id, get_backend
 from store_data import update_position_metrics, sync_info
+from logging_pipeline import get_logger
 
 ###---- Using this to trigger breakEven SL
 LOWER_TRIGGER = 0.35
 TOLERANCE = 0.0001  # 0.01% de margen para evitar duplicados por redondeo
-API_KEY = Dat.BinK
-API_SECRET = Dat.BinS
+PRECISION_ERRORS = (-1111, -4014)   # Price precision / not a multiple of tick size
 
-###----- Place Stop Loss
-def place_stop_loss(symbol, side, stop_loss_price):
-    headers = {"X-MBX-APIKEY": API_KEY}
-    sl_params = {
-        "symbol": symbol,
-        "side": side,
-        "type": "STOP_MARKET",
-        "stopPrice": stop_loss_price,
-        "closePosition": "true",
-        "timestamp": int(time.time() * 1000)
-    }
-    sl_params["signature"] = api_actions.create_signature(sl_params, API_SECRET)
-    sl_response = requests.post(binance_api['BASE_URL'] + binance_api['ORDER_ENDPOINT'], headers=headers, params=sl_params)
-    sl_res = sl_response.json()
-    print(f"---<< Stop Loss placed for {sl_params['symbol']} at {sl_params['stopPrice']}")
+log = get_logger(__name__)
 
+_window_lock = threading.Lock()
+unprotected_window_stats = {"replacements": 0, "failed": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
 
-###----- Place Take Profit
-def place_take_profit(symbol, side, take_profit_price):
-    headers = {"X-MBX-APIKEY": API_KEY}
-    tp_params = {
-        "symbol": symbol,
-        "side": side,
-        "type": "TAKE_PROFIT_MARKET",
-        "stopPrice": take_profit_price,
-        "closePosition": "true",
-        "timestamp": int(time.time() * 1000)
-    }
-    tp_params["signature"] = api_actions.create_signature(tp_params, API_SECRET)
-    tp_response = requests.post(binance_api['BASE_URL'] + binance_api['ORDER_ENDPOINT'],
-                                headers=headers, params=tp_params)
-    tp_res = tp_response.json()
-    update_position_metrics(symbol=tp_params['symbol'], take_profit=tp_params['stopPrice'], info='TP set')   # Update DB
-    print(f">>--- Take Profit placed for {tp_params['symbol']} at {tp_params['stopPrice']}")
-
-
-def update_trailing_stop(position, trail_perc, activation_buffer):
+
+###----- Report rejected orders; precision errors mean our exchangeInfo filters are out of date
+def report_rejection(symbol, order_type, stop_price, body):
+    log.warning("[%s] %s at %s rejected: %s", symbol, order_type, stop_price, body,
+                extra={"symbol": symbol, "order_type": order_type, "stop_price": stop_price})
+    if isinstance(body, dict) and body.get("code") in PRECISION_ERRORS:
+        exchange_info.invalidate()
+
+
+###----- Outcome of one close order (direct placement or order_intents dispatch)
+def is_duplicate(order, error, client_id):
+    """The exchange refused the order because one with the same newClientOrderId is already open."""
+    return order is None and bool(client_id) and isinstance(error, dict) and error.get("code") == DUPLICATE_CLIENT_ID
+
+
+def adopt_open_order(symbol, order_type, stop_price, client_id, open_orders):
+    """The order of open_orders (the symbol's open orders, None if unknown) carrying client_id, or None."""
+    order = next((o for o in open_orders or () if o.client_order_id == client_id), None)
+    if order is not None:
+        log.info("[%s] %s at %s already open (%s), adopted", symbol, order_type, stop_price, client_id,
+                 extra={"symbol": symbol, "order_type": order_type, "stop_price": stop_price})
+    return order
+
+
+def record_placement(symbol, order_type, stop_price, order, error, snapshot=None):
+    """Log the outcome and add the order to the snapshot; the DB side of a take profit is record_take_profit()."""
+    if order is None:
+        report_rejection(symbol, order_type, stop_price, error)
+        return None
+    if snapshot is not None:
+        snapshot.add(order)
+    if order_type == "TAKE_PROFIT_MARKET":
+        log.info(">>--- Take Profit placed for %s at %s", symbol, stop_price,
+                 extra={"symbol": symbol, "order_type": order_type, "stop_price": stop_price})
+    else:
+        log.info("---<< Stop Loss placed for %s at %s", symbol, stop_price,
+                 extra={"symbol": symbol, "order_type": order_type, "stop_price": stop_price})
+    return order
+
+
+def record_take_profit(symbol, stop_price):
+    update_position_metrics(symbol=symbol, take_profit=stop_price, info='TP set')   # Update DB
+
+
+def settle_placement(symbol, order_type, stop_price, order, error, snapshot=None, client_id=None):
     """
-    Dynamically adjusts trailing stops as profit increases.
-    - First SL is placed at breakeven when price_change ∈ (0.25%, activation_buffer)
-    - After activation_buffer, SL trails mark price by trail_perc.
+    exchange.Order of the placed order, or None if it was rejected. A duplicate newClientOrderId means
+    an earlier send of this same order went through (timeout, crash), so the open order is adopted.
     """
-    symbol = position["symbol"]
-    entry = float(position["entryPrice"])
-    mark = float(position["markPrice"])
-    amt = float(position["positionAmt"])
-    pnl = float(position["unRealizedProfit"])
-    direction = position["positionDirection"]
-    break_even = float(position["breakEvenPrice"])
-    side = "SELL" if direction == "LONG" else "BUY"
-    rounding = 2 if entry > 0.999 else 5
+    if is_duplicate(order, error, client_id):
+        order = adopt_open_order(symbol, order_type, stop_price, client_id, get_backend().get_open_orders(symbol))
+    order = record_placement(symbol, order_type, stop_price, order, error, snapshot)
+    if order is not None and order_type == "TAKE_PROFIT_MARKET":
+        record_take_profit(symbol, stop_price)
+    return order
 
-    # --- Fetch all open orders first (so existing_sl is defined early)
-    timestamp = int(time.time() * 1000)
-    params = {"symbol": symbol, "timestamp": timestamp}
-    params["signature"] = api_actions.create_signature(params, API_SECRET)
-    headers = {"X-MBX-APIKEY": API_KEY}
-    response = requests.get(binance_api['BASE_URL'] + binance_api['OPEN_ORDERS_ENDPOINT'], headers=headers, params=params)
-    if response.status_code != 200:
-        print(f"[{symbol}] Failed to fetch open orders: {response.text}")
-        return
-    open_orders = response.json()
 
-    # Identify existing Stop Loss (if any)
-    existing_sl = next((float(o["stopPrice"]) for o in open_orders if o["type"] == "STOP_MARKET"), None)
-    print(f"Existing SL: {existing_sl}")
+def _place_close_order(symbol, side, order_type, stop_price, snapshot):
+    """exchange.Order of the placed order, or None if it was rejected."""
+    client_id = client_order_id(symbol, order_type, stop_price)
+    order, error = get_backend().place_close_order(symbol, side, order_type, stop_price, client_order_id=client_id)
+    return settle_placement(symbol, order_type, stop_price, order, error, snapshot, client_id)
+
+
+###----- Place Stop Loss
+@profiler.traced()
+def place_stop_loss(symbol, side, stop_loss_price, snapshot=None):
+    return _place_close_order(symbol, side, "STOP_MARKET", stop_loss_price, snapshot)
+
+
+###----- Place Take Profit
+def place_take_profit(symbol, side, take_profit_price, snapshot=None):
+    return _place_close_order(symbol, side, "TAKE_PROFIT_MARKET", take_profit_price, snapshot)
+
+
+###----- Trailing stop decision (no I/O, shared by the sync loop and the async engine)
+def evaluate_trailing_stop(position, existing_sl, trail_perc, activation_buffer, lower_trigger=LOWER_TRIGGER):
+    """
+    Decide what to do with the stop of one exchange.Position given its current SL (or None).
+    Returns a dict with:
+    - action: None, "place" (no SL to remove) or "replace" (cancel existing STOP_MARKET first)
+    - new_sl, side, info: what to place and what to record in trading_positions
+    - state: code for position_state (14 BE exists, 12 BE set, 13 waiting, 10 SL optimal, 9 SL moved)
+    lower_trigger only differs from LOWER_TRIGGER in backtests.
+    """
+    entry = position.entry_price
+    mark = position.mark_price
+    direction = position.direction
+    break_even = position.break_even_price
+    side = position.close_side
+    symbol = position.symbol
 
     # --- Calculate price change (%)
     price_change = ((mark - entry) / entry) * 100 if direction == "LONG" else ((entry - mark) / entry) * 100
-    print(f"[{symbol}] ΔPrice: {price_change:.2f}% | Mark: {mark} | BreakEven: {break_even}")
+    decision = {"symbol": symbol, "side": side, "direction": direction, "price_change": price_change,
+                "mark": mark, "break_even": break_even, "existing_sl": existing_sl,
+                "action": None, "new_sl": None, "info": None, "state": None}
 
-    # --- Step 1: BREAKEVEN window trigger (LOWER_TRIGGER % < Price % < activation_buffer %)
+    # --- Step 1: BREAKEVEN window trigger (lower_trigger % < Price % < activation_buffer %)
     # Coloca un SL en break-even SOLO si:
     #  - No existe aún un SL, o
     #  - El SL existente está “peor” que el break-even, considerando la dirección,
     #  - Y el SL actual NO está ya en breakeven (dentro de margen de tolerancia)
-    
+
     if direction == "LONG":
         condition_sl_weaker = (existing_sl is None or existing_sl < break_even * (1 - TOLERANCE))
         condition_already_be = existing_sl and abs(existing_sl - break_even) / break_even < TOLERANCE
@@ -96,28 +128,19 @@ def update_trailing_stop(position, trail_perc, activation_buffer):
         condition_already_be = existing_sl and abs(existing_sl - break_even) / break_even < TOLERANCE
 
     if condition_already_be:
-        print(f"[{symbol}] Existing SL is already at breakeven ({existing_sl}), skipping re-placement.")
-        sync_info(symbol=symbol, state=14)  # opcional: nuevo código para "BE ya existe"
-        return
-
-    if condition_sl_weaker and LOWER_TRIGGER < price_change < activation_buffer:
-        new_sl = round(break_even, rounding)
-        print(f"[{symbol}] Dir={direction} | SL actual={existing_sl} | BE={break_even}")
-        print(f"[{symbol}] ΔPrice {price_change:.2f}% dentro de ventana ({LOWER_TRIGGER:.2f}–{activation_buffer:.2f}) → "
-            f"estableciendo SL inicial en breakeven {new_sl}")
-
-        place_stop_loss(symbol, side, new_sl)
-        update_position_metrics(symbol=symbol, trailing_stop=new_sl, info='Break even SL set')
-        sync_info(symbol=symbol, state=12)
-        return
+        decision["state"] = 14  # "BE ya existe"
+        return decision
 
+    if condition_sl_weaker and lower_trigger < price_change < activation_buffer:
+        decision.update(action="place", new_sl=exchange_info.round_price(symbol, break_even, entry),
+                        info='Break even SL set', state=12)
+        return decision
 
     # --- Step 2: Skip if below activation buffer
     ## Only Updates Logs - By this point break_even sl should already have been placed
     if price_change < activation_buffer:  # Example:  price_change = 0.3% < activation_buffer = 0.5%
-        print(f"[{symbol}] Profit < {activation_buffer}%, waiting before trailing activation.")
-        sync_info(symbol=symbol,state=13)
-        return
+        decision["state"] = 13
+        return decision
 
     ## -- TRAILING STOP
     # --- Step 3: Calculate new trailing SL once activation is reached
@@ -125,49 +148,164 @@ def update_trailing_stop(position, trail_perc, activation_buffer):
         new_sl = mark * (1 - trail_perc / 100)   # Ejemplo ETH, $4,000.00 * (1 - 0.35/100) = $4,014.00 -> new_sl
     else: # SHORT
         new_sl = mark * (1 + trail_perc / 100)
-    new_sl = round(new_sl, rounding)
-    # print(f"[{symbol}] Active trailing phase → new SL: {new_sl}")
-    sync_info(symbol=symbol,state=8)
+    new_sl = exchange_info.round_price(symbol, new_sl, entry)     # Symbol tick size (exchangeInfo)
+    decision["new_sl"] = new_sl
 
     # --- Step 4: Update only if improvement
     if existing_sl:
         if (direction == "LONG" and new_sl > existing_sl) or (direction == "SHORT" and new_sl < existing_sl):
-            # print(f"[{symbol}] Updating SL from {existing_sl} → {new_sl}")
-            cancel_stop_orders(symbol)
+            decision.update(action="replace", info='SL set', state=9)
         else:
-            # print(f"[{symbol}] SL already optimal ({existing_sl}), no update needed.")
-            sync_info(symbol=symbol,state=10)
-            return
-    # Trailing Stop Enhancement if pirce rises above 1%    
-    trail_perc = 0.75 if price_change >= 1.0 else trail_perc
+            decision["state"] = 10  # SL already optimal
+        return decision
 
     # --- Step 5: Place or update SL With the new better SL
-    ## By this point all other options have been used and Trailing Stop is being updated.
-    place_stop_loss(symbol, side, new_sl)
-    update_position_metrics(symbol=symbol, trailing_stop=new_sl, info='SL set')
-    sync_info(symbol=symbol,state=9)
+    decision.update(action="place", info='SL set', state=9)
+    return decision
+
+
+def print_trailing_decision(decision):
+    symbol = decision["symbol"]
+    fields = {"symbol": symbol, "state": decision["state"], "mark": decision["mark"], "break_even": decision["break_even"],
+              "existing_sl": decision["existing_sl"], "new_sl": decision["new_sl"], "price_change": decision["price_change"]}
+    log.debug("[%s] ΔPrice: %.2f%% | Mark: %s | BreakEven: %s | Existing SL: %s", symbol, decision['price_change'],
+              decision['mark'], decision['break_even'], decision['existing_sl'], extra=fields)
+    if decision["state"] == 14:
+        log.debug("[%s] Existing SL is already at breakeven (%s), skipping re-placement.", symbol,
+                  decision['existing_sl'], extra=fields)
+    elif decision["state"] == 12:
+        log.info("[%s] Dir=%s | SL actual=%s | BE=%s | ΔPrice %.2f%% dentro de ventana → estableciendo SL inicial en breakeven %s",
+                 symbol, decision['direction'], decision['existing_sl'], decision['break_even'], decision['price_change'],
+                 decision['new_sl'], extra=fields)
+    elif decision["state"] == 13:
+        log.debug("[%s] Profit below activation buffer, waiting before trailing activation.", symbol, extra=fields)
+
+
+@profiler.traced()
+def update_trailing_stop(position, trail_perc, activation_buffer, snapshot=None):
+    """
+    Dynamically adjusts trailing stops as profit increases.
+    - First SL is placed at breakeven when price_change ∈ (0.25%, activation_buffer)
+    - After activation_buffer, SL trails mark price by trail_perc.
+    - With a per-cycle OpenOrdersSnapshot, existing orders are read from it instead of the API.
+    """
+    symbol = position.symbol
+
+    # --- Fetch all open orders first (so existing_sl is defined early)
+    if snapshot is not None:
+        existing_sl = snapshot.stop_price(symbol)
+    else:
+        open_orders = get_backend().get_open_orders(symbol)
+        if open_orders is None:
+            return
+
+        # Identify existing Stop Loss (if any)
+        existing_sl = next((o.stop_price for o in open_orders if o.type == "STOP_MARKET"), None)
+
+    decision = evaluate_trailing_stop(position, existing_sl, trail_perc, activation_buffer)
+    return apply_trailing_decision(decision, snapshot)
+
+
+###----- Execute a trailing-stop decision (from evaluate_trailing_stop or risk_engine)
+@profiler.traced()
+def apply_trailing_decision(decision, snapshot=None, intents=None):
+    """
+    With an order_intents.IntentQueue, new stops are queued for its dispatch; replacements stay
+    immediate because the old stop must be cancelled first.
+    """
+    symbol = decision["symbol"]
+    print_trailing_decision(decision)
+
+    if decision["action"] == "replace":
+        replace_stop_loss(symbol, decision["side"], decision["new_sl"], snapshot)
+    elif decision["action"] == "place" and intents is not None:
+        intents.submit(symbol, decision["side"], "STOP_MARKET", decision["new_sl"])
+    elif decision["action"] == "place":
+        place_stop_loss(symbol, decision["side"], decision["new_sl"], snapshot)
+    if decision["action"] is not None:
+        update_position_metrics(symbol=symbol, trailing_stop=decision["new_sl"], info=decision["info"])
+    sync_info(symbol=symbol, state=decision["state"])
+    return decision
+
+
+###----- Cancel orders whose ids we already know (one request for up to 10 ids)
+def cancel_orders_by_id(symbol, order_ids):
+    """Return the ids the exchange confirmed as cancelled."""
+    return get_backend().cancel_orders(symbol, order_ids)
+
+
+def _known_stop_orders(symbol, snapshot):
+    if snapshot is not None:
+        return snapshot.orders(symbol, "STOP_MARKET")
+    open_orders = get_backend().get_open_orders(symbol)
+    if open_orders is None:
+        return None
+    return [o for o in open_orders if o.type == "STOP_MARKET"]
+
+
+###----- Unprotected window of stop replacements (old stop cancelled → new stop acknowledged)
+def record_unprotected_window(elapsed_ms, failed=False):
+    with _window_lock:
+        stats = unprotected_window_stats
+        stats["replacements"] += 1
+        stats["failed"] += int(failed)
+        stats["last_ms"] = elapsed_ms
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+
+def print_replace_stats():
+    with _window_lock:
+        s = dict(unprotected_window_stats)
+    avg = round(s["total_ms"] / s["replacements"], 2) if s["replacements"] else 0.0
+    log.info("[STOP] replacements=%s failed=%s unprotected avg=%sms max=%sms last=%sms", s['replacements'], s['failed'],
+             avg, round(s['max_ms'], 2), round(s['last_ms'], 2), extra=s)
+
+
+###----- Move a stop: cancel known ids, then place the new one right away
+@profiler.traced()
+def replace_stop_loss(symbol, side, stop_loss_price, snapshot=None):
+    """
+    Replace the symbol's STOP_MARKET with one at stop_loss_price in two requests: cancel by id
+    (ids from the snapshot) and place. The new stop cannot go in first because Binance accepts only
+    one closePosition stop per direction (-4130). If placing fails, it is retried once and otherwise
+    the previous stop price is restored.
+    """
+    old_stops = _known_stop_orders(symbol, snapshot)
+    if old_stops is None:
+        return None
+
+    start = time.perf_counter()
+    cancelled = cancel_orders_by_id(symbol, [o.order_id for o in old_stops]) if old_stops else []
+    for order_id in cancelled:
+        if snapshot is not None:
+            snapshot.remove(symbol, order_id)
+        log.info("[%s] Cancelled STOP_MARKET %s", symbol, order_id, extra={"symbol": symbol, "order_id": order_id})
+    if cancelled:
+        sync_info(symbol=symbol, state=11)
+
+    order = place_stop_loss(symbol, side, stop_loss_price, snapshot)
+    if order is None:
+        order = place_stop_loss(symbol, side, stop_loss_price, snapshot)
+    failed = order is None
+    if failed and old_stops:
+        log.error("[%s] !! New SL %s rejected, restoring %s", symbol, stop_loss_price, old_stops[0].stop_price,
+                  extra={"symbol": symbol, "stop_price": stop_loss_price})
+        place_stop_loss(symbol, side, old_stops[0].stop_price, snapshot)
+    if cancelled:
+        record_unprotected_window((time.perf_counter() - start) * 1000, failed)
+    return order
 
 
 ###----- Cancel all existing SLs for a symbol
-def cancel_stop_orders(symbol):
-    timestamp = int(time.time() * 1000)
-    headers = {"X-MBX-APIKEY": API_KEY}
-    params = {"symbol": symbol, "timestamp": timestamp}
-    params["signature"] = api_actions.create_signature(params, API_SECRET)
-
-    open_res = requests.get(binance_api['BASE_URL'] + binance_api['OPEN_ORDERS_ENDPOINT'], headers=headers, params=params)
-    if open_res.status_code != 200:
-        print(f"[{symbol}] Failed to fetch orders: {open_res.text}")
+@profiler.traced()
+def cancel_stop_orders(symbol, snapshot=None):
+    stop_orders = _known_stop_orders(symbol, snapshot)
+    if not stop_orders:
         return
 
-    for order in open_res.json():
-        if order["type"] == "STOP_MARKET":
-            cancel_params = {
-                "symbol": symbol,
-                "orderId": order["orderId"],
-                "timestamp": int(time.time() * 1000)
-            }
-            cancel_params["signature"] = api_actions.create_signature(cancel_params, API_SECRET)
-            cancel_res = requests.delete(binance_api['BASE_URL'] + binance_api['ORDER_ENDPOINT'], headers=headers, params=cancel_params)
-            print(f"[{symbol}] Cancelled STOP_MARKET {order['orderId']} → {cancel_res.json()}")
-            sync_info(symbol=symbol,state=11)
+    for order_id in cancel_orders_by_id(symbol, [o.order_id for o in stop_orders]):
+        if snapshot is not None:
+            snapshot.remove(symbol, order_id)
+        log.info("[%s] Cancelled STOP_MARKET %s", symbol, order_id, extra={"symbol": symbol, "order_id": order_id})
+        sync_info(symbol=symbol,state=11)
@@ -0,0 +1,143 @@
+import atexit
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import Dat
+import accounts
+import metrics
+import storage
+from logging_pipeline import get_logger
+
+###---- History settings (override from Dat if present)
+# Rows go to the storage backend (MySQL partitioned by day, or the SQLite file), which also applies
+# the retention of Dat.history_retention_days.
+HISTORY_ENABLED = getattr(Dat, 'history_enabled', True)
+FLUSH_INTERVAL = getattr(Dat, 'history_flush_interval', 10.0)      # Seconds between bulk inserts
+BATCH_SIZE = getattr(Dat, 'history_batch_size', 500)               # Rows per INSERT statement
+MAX_BUFFER = getattr(Dat, 'history_max_buffer', 50000)             # Oldest rows are dropped past this (DB down)
+MAINTENANCE_INTERVAL = 3600                                        # Seconds between retention runs
+
+log = get_logger(__name__)
+
+
+class HistoryWriter:
+    """
+    Buffers history rows in memory and appends them from a background thread in batches through the
+    storage backend, so the monitoring loop only pays for a deque append. Also runs the retention.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE, max_buffer=MAX_BUFFER):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._buffer = deque(maxlen=max_buffer)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._next_maintenance = 0.0
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "flushes": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="position-history", daemon=True)
+        self._thread.start()
+
+    def record(self, symbol, mark_price, unrealized_profit, stop_price=None, state=None, recorded_at=None, account=None):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.stats["dropped"] += 1
+        self._buffer.append((account or accounts.current_name(), symbol, recorded_at or datetime.now(),
+                             mark_price, unrealized_profit, stop_price, state))
+        self.stats["recorded"] += 1
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _drain(self):
+        rows = []
+        while self._buffer and len(rows) < self.batch_size:
+            rows.append(self._buffer.popleft())
+        return rows
+
+    @metrics.timed("history_flush")
+    def flush(self):
+        """Write everything buffered so far. On error the current batch is put back for the next attempt."""
+        with self._flush_lock:
+            backend = storage.get_backend()
+            try:
+                if time.monotonic() >= self._next_maintenance:
+                    backend.maintain_history()
+                    self._next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+                while self._buffer:
+                    rows = self._drain()
+                    try:
+                        backend.append_history(rows)
+                    except storage.DB_ERRORS:
+                        self._buffer.extendleft(reversed(rows))
+                        raise
+                    self.stats["written"] += len(rows)
+                self.stats["flushes"] += 1
+            except storage.DB_ERRORS as error:
+                self.stats["errors"] += 1
+                log.error("[HISTORY] Error writing history: %s", error)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._buffer:
+                self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        if self._buffer:
+            self.flush()
+
+    def print_stats(self):
+        s = self.stats
+        log.info("[HISTORY] recorded=%s written=%s buffered=%s dropped=%s flushes=%s errors=%s", s['recorded'],
+                 s['written'], len(self._buffer), s['dropped'], s['flushes'], s['errors'], extra=dict(s))
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = HistoryWriter()
+                atexit.register(_writer.close)
+    return _writer
+
+
+###---- Per-cycle recording (called by the monitors)
+def record_positions(positions, store=None, recorded_at=None):
+    """One history row per position of the current account, with stop and state code from the state store when given."""
+    if not HISTORY_ENABLED or not positions:
+        return
+    writer = get_writer()
+    recorded_at = recorded_at or datetime.now()
+    account = accounts.current_name()
+    for position in positions:
+        symbol = position.symbol
+        entry = store.get(symbol) if store is not None else None
+        writer.record(symbol, position.mark_price, position.unrealized_profit,
+                      entry["stop_price"] if entry else None, entry["state_code"] if entry else None, recorded_at, account)
+
+
+###---- Reading history back
+@metrics.timed()
+def trajectory(symbol, since=None, until=None, limit=None, account=None):
+    """Rows (recorded_at, mark_price, unrealized_profit, stop_price, state) of one symbol in time order."""
+    return storage.get_backend().trajectory(account or accounts.current_name(), symbol,
+                                            since or datetime.now() - timedelta(days=1),
+                                            until or datetime.now() + timedelta(seconds=1), limit)
+
+
+@metrics.timed()
+def cycle_pnl(since=None, until=None, account=None):
+    """(recorded_at, pnl_sum, positions) per cycle of one account: the totals binance_ops prints each cycle."""
+    return storage.get_backend().cycle_pnl(account or accounts.current_name(),
+                                           since or datetime.now() - timedelta(days=1),
+                                           until or datetime.now() + timedelta(seconds=1))
@@ -0,0 +1,263 @@
+import contextvars
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import Dat
+import accounts
+from logging_pipeline import get_logger
+
+###---- Settings (override from Dat if present)
+# Start a session with `kill -USR2 <pid>` or by creating the control file (its content, if any, is the
+# number of cycles to profile). Nothing is sampled or traced outside a session.
+PROFILE_DIR = getattr(Dat, 'profile_dir', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'profiles'))
+PROFILE_CONTROL_FILE = getattr(Dat, 'profile_control_file', os.path.join(PROFILE_DIR, 'profile.request'))
+PROFILE_SIGNAL = getattr(Dat, 'profile_signal', 'SIGUSR2')
+PROFILE_CYCLES = getattr(Dat, 'profile_cycles', 5)                 # Cycles per session
+SAMPLE_INTERVAL = getattr(Dat, 'profile_sample_interval', 0.005)   # Seconds between stack samples (200 Hz)
+MAX_STACK_DEPTH = 64
+
+log = get_logger(__name__)
+
+_trace = contextvars.ContextVar("profile_trace", default=None)     # Span list of the cycle running in this context
+_session = None
+_session_lock = threading.Lock()
+_requested = 0      # Cycles asked for by the signal handler, picked up at the next cycle start
+
+
+###---- Stack sampling: frames of the cycle threads, folded into "root;outer;...;inner" → count
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename).rsplit('.', 1)[0]}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class Sampler:
+    """
+    Wall-clock sampler: a daemon thread reads sys._current_frames() every SAMPLE_INTERVAL, only for
+    the threads running a cycle (rooted at "cycle:<account>"), so idle waits between cycles are not
+    counted. Time in HTTP, MySQL or SQLite shows up as socket / driver frames, Python time as the
+    monitor's own frames.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.cycle_threads = {}     # thread ident -> account name
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.cycle_threads:
+                continue
+            for ident, frame in sys._current_frames().items():
+                account = self.cycle_threads.get(ident)
+                if account is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(f"cycle:{account}")
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        """One `stack count` line per distinct stack: the input of flamegraph.pl and speedscope."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+###---- Profiling session: sampler plus span trace across the next N cycles
+class ProfileSession:
+    """
+    Cycles enter() the session and hand their record to write_cycle(). Once N cycles are recorded no new
+    cycle enters, and the files are closed by whichever cycle still in flight (other accounts) finishes last.
+    """
+
+    def __init__(self, cycles, directory=PROFILE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, time.strftime("profile-%Y%m%d-%H%M%S"))
+        self.collapsed_path = prefix + ".collapsed"
+        self.trace_path = prefix + ".trace.jsonl"
+        self.remaining = cycles
+        self.cycles = 0
+        self.active = 0         # Cycles in flight
+        self.finished = False
+        self.sampler = Sampler()
+        self._trace_file = open(self.trace_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.sampler.start()
+
+    def enter(self):
+        """A cycle starts: False once the session has its N cycles."""
+        with self._lock:
+            if self.finished:
+                return False
+            self.active += 1
+            return True
+
+    def write_cycle(self, record):
+        """Record a cycle that entered; True when it was the last one in flight of a finished session."""
+        with self._lock:
+            self._trace_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._trace_file.flush()
+            self.cycles += 1
+            self.remaining -= 1
+            self.active -= 1
+            self.finished = self.finished or self.remaining <= 0
+            return self.finished and self.active == 0
+
+    def close(self):
+        self.sampler.stop()
+        self.sampler.write_collapsed(self.collapsed_path)
+        self._trace_file.close()
+        log.info("[PROFILE] %s cycles, %s samples → %s, %s", self.cycles, self.sampler.samples, self.collapsed_path,
+                 self.trace_path, extra={"cycles": self.cycles, "samples": self.sampler.samples,
+                                         "collapsed": self.collapsed_path, "trace": self.trace_path})
+
+
+def request(cycles=PROFILE_CYCLES):
+    """Profile the next `cycles` cycles (safe from a signal handler: only sets a number)."""
+    global _requested
+    _requested = cycles
+
+
+def _read_control_file():
+    try:
+        with open(PROFILE_CONTROL_FILE, encoding="utf-8") as f:
+            content = f.read().strip()
+        os.remove(PROFILE_CONTROL_FILE)
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        log.error("[PROFILE] Cannot read %s: %s", PROFILE_CONTROL_FILE, e)
+        return 0
+    return int(content) if content.isdigit() else PROFILE_CYCLES
+
+
+def _start_requested():
+    """At a cycle start: open a session if the signal or the control file asked for one."""
+    global _session, _requested
+    cycles, _requested = _requested, 0
+    if not cycles and os.path.exists(PROFILE_CONTROL_FILE):
+        cycles = _read_control_file()
+    if not cycles:
+        return
+    with _session_lock:
+        if _session is None:
+            _session = ProfileSession(cycles)
+            log.info("[PROFILE] Profiling the next %s cycles", cycles, extra={"cycles": cycles})
+
+
+def install_signal_handler():
+    """Start a session on PROFILE_SIGNAL (main thread only; ignored where the signal does not exist)."""
+    signum = getattr(signal, PROFILE_SIGNAL, None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signum, lambda *_: request())
+    return True
+
+
+###---- Per-cycle trace: spans of the traced functions, with the symbol they worked on
+@contextmanager
+def cycle():
+    """`with profiler.cycle():` around one monitoring cycle; traces and samples it while a session is open."""
+    if _requested or os.path.exists(PROFILE_CONTROL_FILE):
+        _start_requested()
+    session = _session
+    if session is None or not session.enter():
+        yield
+        return
+
+    account = accounts.current_name()
+    ident = threading.get_ident()
+    spans = []
+    token = _trace.set(spans)
+    session.sampler.cycle_threads[ident] = account
+    started_at, start = time.time(), time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _trace.reset(token)
+        session.sampler.cycle_threads.pop(ident, None)
+        symbols = {}
+        for entry in spans:
+            entry["start_ms"] = round(entry["start_ms"] - start * 1000, 3)      # Offset from the cycle start
+            if entry["symbol"]:
+                per_symbol = symbols.setdefault(entry["symbol"], {})
+                per_symbol[entry["name"]] = round(per_symbol.get(entry["name"], 0.0) + entry["ms"], 3)
+        last = session.write_cycle({"account": account, "started_at": round(started_at, 3), "ms": round(elapsed_ms, 3),
+                                    "spans": spans, "symbols": symbols})
+        if session.finished:
+            _detach(session)
+        if last:
+            session.close()
+
+
+def _detach(session):
+    """Let the next request open a new session."""
+    global _session
+    with _session_lock:
+        if _session is session:
+            _session = None
+
+
+def _symbol_of(args, kwargs):
+    value = kwargs.get("symbol", kwargs.get("position", kwargs.get("decision", args[0] if args else None)))
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return value.get("symbol")
+    return getattr(value, "symbol", None)
+
+
+@contextmanager
+def span(name, symbol=None):
+    """Time a block into the current cycle's trace; a no-op outside a profiled cycle."""
+    spans = _trace.get()
+    if spans is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        spans.append({"name": name, "symbol": symbol, "start_ms": start * 1000, "ms": round((end - start) * 1000, 3)})
+
+
+def traced(name=None):
+    """Decorator: a span per call, named `name` or after the function, tagged with the symbol it handles."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            spans = _trace.get()
+            if spans is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                spans.append({"name": span_name, "symbol": _symbol_of(args, kwargs), "start_ms": start * 1000,
+                              "ms": round((end - start) * 1000, 3)})
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+import asyncio
+import threading
+import time
+
+import Dat
+from logging_pipeline import get_logger
+
+###---- Binance futures limits (per IP for weight, per account for orders)
+WEIGHT_LIMIT_1M = getattr(Dat, 'weight_limit_1m', 2400)
+ORDER_LIMIT_10S = getattr(Dat, 'order_limit_10s', 300)
+ORDER_LIMIT_1M = getattr(Dat, 'order_limit_1m', 1200)
+
+###---- Priorities: lower value = more important
+PROTECTIVE = 0      # Stop-loss placement / replacement: never held back by our own budget
+NORMAL = 1          # Position fetch, take-profit placement
+INFO = 2            # Open-orders lookups and other informational reads
+
+# Share of the 1-minute weight budget each priority may consume before it is delayed
+PRIORITY_CEILING = {PROTECTIVE: 1.0, NORMAL: 0.9, INFO: 0.75}
+
+# Request weight per endpoint (https://developers.binance.com/docs/derivatives/usds-margined-futures)
+ENDPOINT_WEIGHT = {
+    "/fapi/v2/positionRisk": 5,
+    "/fapi/v1/openOrders": 1,           # 40 without symbol, see request_weight()
+    "/fapi/v1/order": 1,
+    "/fapi/v1/allOpenOrders": 1,
+    "/fapi/v1/batchOrders": 5,
+    "/fapi/v1/listenKey": 1,
+    "/fapi/v1/exchangeInfo": 1,
+    "/fapi/v1/premiumIndex": 1,         # 10 without symbol
+}
+ORDER_ENDPOINTS = ("/fapi/v1/order", "/fapi/v1/batchOrders")
+COALESCE_TTL = 1.0      # Seconds an INFO GET result can be reused when the budget is tight
+ORDER_RESERVE = 10      # Orders per window kept for PROTECTIVE placements
+
+log = get_logger(__name__)
+
+
+def request_weight(method, endpoint, params=None):
+    params = params or {}
+    if endpoint == "/fapi/v1/openOrders" and "symbol" not in params:
+        return 40
+    if endpoint == "/fapi/v1/premiumIndex" and "symbol" not in params:
+        return 10
+    if endpoint == "/fapi/v1/batchOrders" and method == "DELETE":
+        return 1
+    return ENDPOINT_WEIGHT.get(endpoint, 1)
+
+
+def default_priority(method, endpoint):
+    if endpoint in ORDER_ENDPOINTS and method in ("POST", "DELETE"):
+        return NORMAL
+    if endpoint == "/fapi/v2/positionRisk":
+        return NORMAL
+    return INFO
+
+
+class RateLimiter:
+    """
+    Token bucket over the 1-minute request weight, corrected by the X-MBX-USED-WEIGHT-1M header
+    of every response. Low-priority requests wait when the budget nears its ceiling so protective
+    ones still get through; a 429/418 Retry-After blocks everyone until it passes.
+    """
+
+    def __init__(self, weight_limit=WEIGHT_LIMIT_1M):
+        self.weight_limit = weight_limit
+        self.tokens = float(weight_limit)
+        self.refill_rate = weight_limit / 60.0
+        self._updated = time.monotonic()
+        self._banned_until = 0.0
+        self._lock = threading.Lock()
+        self.used_weight_1m = 0
+        self._order_counts = {}     # account -> [count_10s, count_1m, monotonic time last seen]
+        self.counters = {"requests": 0, "delayed": 0, "delayed_seconds": 0.0, "coalesced": 0,
+                         "rate_limited_429": 0, "banned_418": 0}
+        self._recent = {}       # (endpoint, params) -> (monotonic time, response) for INFO coalescing
+
+    def _refill(self, now):
+        self.tokens = min(self.weight_limit, self.tokens + (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def reserve(self, weight, priority, is_order=False, account=None):
+        """Take `weight` tokens if this priority may; otherwise return the seconds to wait (nothing taken)."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._banned_until:
+                return self._banned_until - now
+            if is_order and priority != PROTECTIVE and self.order_budget_left(account) <= ORDER_RESERVE:
+                return 1.0
+            self._refill(now)
+            floor = self.weight_limit * (1 - PRIORITY_CEILING[priority])
+            if self.tokens - weight >= floor or priority == PROTECTIVE:
+                self.tokens -= weight
+                self.counters["requests"] += 1
+                return 0.0
+            return (floor + weight - self.tokens) / self.refill_rate
+
+    def acquire(self, weight, priority, is_order=False, account=None):
+        """Block until the request may be sent."""
+        waited = 0.0
+        while True:
+            delay = self.reserve(weight, priority, is_order, account)
+            if delay <= 0:
+                break
+            time.sleep(delay)
+            waited += delay
+        self._count_delay(waited)
+
+    async def acquire_async(self, weight, priority, is_order=False, account=None):
+        waited = 0.0
+        while True:
+            delay = self.reserve(weight, priority, is_order, account)
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+            waited += delay
+        self._count_delay(waited)
+
+    def _count_delay(self, waited):
+        if waited:
+            with self._lock:
+                self.counters["delayed"] += 1
+                self.counters["delayed_seconds"] += waited
+
+    ###---- Feed back what the exchange says we used (weight is per IP, order counts per account)
+    def update_from_response(self, status, headers, account=None):
+        with self._lock:
+            used = headers.get("X-MBX-USED-WEIGHT-1M")
+            if used is not None:
+                self.used_weight_1m = int(used)
+                self.tokens = min(self.tokens, self.weight_limit - self.used_weight_1m)
+            count_10s, count_1m = headers.get("X-MBX-ORDER-COUNT-10S"), headers.get("X-MBX-ORDER-COUNT-1M")
+            if count_10s is not None or count_1m is not None:
+                counts = self._order_counts.setdefault(account, [0, 0, 0.0])
+                if count_10s is not None:
+                    counts[0] = int(count_10s)
+                if count_1m is not None:
+                    counts[1] = int(count_1m)
+                counts[2] = time.monotonic()
+            if status in (429, 418):
+                retry_after = float(headers.get("Retry-After") or 60)
+                self._banned_until = max(self._banned_until, time.monotonic() + retry_after)
+                self.tokens = 0.0
+                self.counters["rate_limited_429" if status == 429 else "banned_418"] += 1
+                log.warning("[RATE] HTTP %s from Binance, pausing requests for %ss", status, retry_after,
+                            extra={"status": status, "retry_after": retry_after})
+
+    def order_budget_left(self, account=None):
+        """Orders `account` has left in the tighter window; counts older than their window no longer apply."""
+        count_10s, count_1m, seen_at = self._order_counts.get(account, (0, 0, 0.0))
+        age = time.monotonic() - seen_at
+        left_10s = ORDER_LIMIT_10S - (count_10s if age < 10 else 0)
+        left_1m = ORDER_LIMIT_1M - (count_1m if age < 60 else 0)
+        return min(left_10s, left_1m)
+
+    ###---- Coalescing of informational GETs
+    def recent_response(self, key):
+        """Response of an identical INFO request made less than COALESCE_TTL ago, if the budget is tight."""
+        with self._lock:
+            entry = self._recent.get(key)
+            tight = self.tokens < self.weight_limit * (1 - PRIORITY_CEILING[NORMAL])
+            if entry and tight and time.monotonic() - entry[0] < COALESCE_TTL:
+                self.counters["coalesced"] += 1
+                return entry[1]
+        return None
+
+    def remember_response(self, key, response):
+        with self._lock:
+            now = time.monotonic()
+            self._recent = {k: v for k, v in self._recent.items() if now - v[0] < COALESCE_TTL}
+            self._recent[key] = (now, response)
+
+    def get_stats(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            # Busiest account's order counts
+            return dict(self.counters, tokens=round(self.tokens, 1), used_weight_1m=self.used_weight_1m,
+                        order_count_10s=max((c[0] for c in self._order_counts.values()), default=0),
+                        order_count_1m=max((c[1] for c in self._order_counts.values()), default=0))
+
+    def print_stats(self):
+        s = self.get_stats()
+        log.info("[RATE] used_weight_1m=%s tokens=%s orders_10s=%s delayed=%s (%ss) coalesced=%s 429=%s 418=%s",
+                 s['used_weight_1m'], s['tokens'], s['order_count_10s'], s['delayed'], round(s['delayed_seconds'], 2),
+                 s['coalesced'], s['rate_limited_429'], s['banned_418'], extra=s)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+###---- One limiter per process (weight limits are per IP)
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
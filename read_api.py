@@ -0,0 +1,190 @@
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import Dat
+import accounts
+from logging_pipeline import get_logger
+
+###---- Settings (override from Dat if present)
+ENABLED = getattr(Dat, 'read_api_enabled', False)
+READ_API_HOST = getattr(Dat, 'read_api_host', '127.0.0.1')
+READ_API_PORT = getattr(Dat, 'read_api_port', 9109)
+KEEPALIVE_SECONDS = getattr(Dat, 'read_api_keepalive', 15.0)   # SSE comment line sent when no delta came in this long
+STREAM_QUEUE = 256      # Deltas buffered per /events client; a client that falls further behind is disconnected
+
+log = get_logger(__name__)
+
+
+def _position_row(position, entry):
+    """What a dashboard shows for one position: exchange.Position fields plus the bot's stop, state and flags."""
+    return {
+        "direction": position.direction, "amount": position.amount, "entry_price": position.entry_price,
+        "mark_price": position.mark_price, "break_even_price": position.break_even_price,
+        "unrealized_profit": position.unrealized_profit, "liquidation_price": position.liquidation_price,
+        "leverage": position.leverage, "update_time": position.update_time,
+        "stop_price": entry["stop_price"] if entry else None, "state": entry["state_code"] if entry else None,
+        "tp_set": entry["tp_set"] if entry else None, "sl_set": entry["sl_set"] if entry else None,
+    }
+
+
+def _sse(event, seq, payload):
+    return f"event: {event}\nid: {seq}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class _Subscriber:
+    __slots__ = ("account", "events", "closed")
+
+    def __init__(self, account):
+        self.account = account
+        self.events = queue.Queue(maxsize=STREAM_QUEUE)
+        self.closed = False
+
+
+class CycleSnapshots:
+    """
+    Last cycle of every account as the monitor saw it (positions, PnL total, stops, state codes), kept in
+    memory for the read API. publish() replaces an account's snapshot and fans the delta out to the
+    /events subscribers, encoded once; readers never wait on the monitor or touch the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._accounts = {}         # account -> {"account", "cycle", "cycle_at", "pnl_total", "positions": {symbol: row}}
+        self._subscribers = set()
+        self._encoded = (None, None, None)      # (seq, account filter, JSON bytes) of the last /snapshot served
+        self.seq = 0
+        self.stats = {"published": 0, "deltas": 0, "served": 0, "subscribers": 0, "disconnected": 0}
+
+    def publish(self, account, positions, store=None, pnl_total=None, cycle_at=None):
+        rows = {p.symbol: _position_row(p, store.get(p.symbol) if store is not None else None) for p in positions}
+        with self._lock:
+            previous = self._accounts.get(account)
+            old_rows = previous["positions"] if previous else {}
+            changed = {symbol: row for symbol, row in rows.items() if old_rows.get(symbol) != row}
+            removed = [symbol for symbol in old_rows if symbol not in rows]
+            self.seq += 1
+            snapshot = {
+                "account": account, "cycle": previous["cycle"] + 1 if previous else 1,
+                "cycle_at": cycle_at or time.time(),
+                "pnl_total": pnl_total if pnl_total is not None else sum(p.unrealized_profit for p in positions),
+                "positions": rows,
+            }
+            self._accounts[account] = snapshot
+            self.stats["published"] += 1
+            subscribers = [s for s in self._subscribers if s.account in (None, account)]
+            if not subscribers:
+                return
+            delta = dict(snapshot, seq=self.seq, positions=changed, removed=removed)
+            message = _sse("delta", self.seq, json.dumps(delta, separators=(",", ":")))
+            for subscriber in subscribers:
+                try:
+                    subscriber.events.put_nowait(message)
+                except queue.Full:
+                    subscriber.closed = True
+                    self._subscribers.discard(subscriber)
+                    self.stats["disconnected"] += 1
+            self.stats["deltas"] += 1
+
+    def _view(self, account=None):
+        accounts_view = self._accounts if account is None else {a: s for a, s in self._accounts.items() if a == account}
+        return {"seq": self.seq, "accounts": accounts_view}
+
+    def snapshot_json(self, account=None):
+        """Every account's last cycle (or one account's) as JSON bytes, re-encoded only after a publish."""
+        with self._lock:
+            seq, encoded_account, encoded = self._encoded
+            if seq != self.seq or encoded_account != account:
+                encoded = json.dumps(self._view(account), separators=(",", ":")).encode("utf-8")
+                self._encoded = (self.seq, account, encoded)
+            self.stats["served"] += 1
+            return encoded
+
+    def subscribe(self, account=None):
+        """A subscriber whose first event is the full snapshot; no delta published after it is missed."""
+        subscriber = _Subscriber(account)
+        with self._lock:
+            subscriber.events.put_nowait(_sse("snapshot", self.seq, json.dumps(self._view(account), separators=(",", ":"))))
+            self._subscribers.add(subscriber)
+            self.stats["subscribers"] += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def print_stats(self):
+        s = dict(self.stats, streaming=len(self._subscribers), seq=self.seq)
+        log.info("[READ API] published=%s deltas=%s served=%s streaming=%s disconnected=%s", s['published'],
+                 s['deltas'], s['served'], s['streaming'], s['disconnected'], extra=s)
+
+
+_snapshots = CycleSnapshots()
+
+
+def get_snapshots():
+    return _snapshots
+
+
+def publish(positions, store=None, pnl_total=None):
+    """End of a cycle of the current account: replace its snapshot. Does nothing when the read API is disabled."""
+    if not ENABLED:
+        return
+    _snapshots.publish(accounts.current_name(), positions, store, pnl_total)
+
+
+###---- HTTP: GET /snapshot (JSON) and GET /events (server-sent events: snapshot, then deltas)
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        account = parse_qs(url.query).get("account", [None])[0]
+        if url.path == "/snapshot":
+            payload = _snapshots.snapshot_json(account)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        elif url.path == "/events":
+            self._stream(account)
+        else:
+            self.send_error(404)
+
+    def _stream(self, account):
+        subscriber = _snapshots.subscribe(account)
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while not subscriber.closed:
+                try:
+                    message = subscriber.events.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    message = b": keepalive\n\n"
+                self.wfile.write(message)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            _snapshots.unsubscribe(subscriber)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host=READ_API_HOST, port=READ_API_PORT):
+    """Serve /snapshot and /events from a daemon thread. Does nothing when the read API is disabled."""
+    if not ENABLED:
+        return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="read-api", daemon=True).start()
+    log.info("[READ API] Serving http://%s:%s/snapshot and /events", host, server.server_address[1])
+    return server
@@ -0,0 +1,114 @@
+import numpy as np
+
+import exchange_info
+from place_orders import LOWER_TRIGGER, TOLERANCE
+
+###---- Action codes of the vectorized pass
+NO_ACTION, PLACE, REPLACE = 0, 1, 2
+ACTION_NAMES = {NO_ACTION: None, PLACE: "place", REPLACE: "replace"}
+ACTION_INFO = {12: 'Break even SL set', 9: 'SL set'}
+
+
+def _round(values, ticks, decimals):
+    """Nearest multiple of each symbol's tick size (exchange_info.round_price, element-wise)."""
+    return np.round(np.round(values / ticks) * ticks, decimals)
+
+
+class RiskBatch:
+    """
+    Every open position of one cycle parsed once into arrays, with SL/TP levels and the trailing-stop
+    decision of place_orders.evaluate_trailing_stop computed for all symbols in one vectorized pass.
+    """
+
+    def __init__(self, positions, existing_sl, long_levels, short_levels, trail_perc, activation_buffer,
+                 placing_initial=()):
+        """
+        positions: exchange.Position records (open positions only)
+        existing_sl: {symbol: stopPrice} of the current STOP_MARKET orders
+        long_levels / short_levels: (sl_factor, tp_factor) applied to the entry price
+        placing_initial: symbols whose initial SL/TP is placed this cycle; their trailing
+                         decision starts from that SL, as a fresh open-orders lookup would
+        """
+        n = len(positions)
+        self.symbols = [p.symbol for p in positions]
+        fields = np.array([(p.entry_price, p.mark_price, p.amount, p.unrealized_profit, p.break_even_price)
+                           for p in positions], dtype=np.float64).reshape(n, 5)
+        self.entry, self.mark, amt, self.pnl, self.break_even = fields.T
+        self.is_long = amt > 0
+        self.amt = np.abs(amt)
+        self.existing_sl = np.array([existing_sl.get(s, np.nan) for s in self.symbols], dtype=np.float64)
+
+        # --- Per-position figures and initial SL/TP (binance_ops.position_levels)
+        self.volume = self.amt * self.entry
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.pnl_perc = np.round(self.pnl / self.volume * 100, 2)
+        ticks = [exchange_info.tick_size(s, e) for s, e in zip(self.symbols, self.entry)]
+        self.ticks = np.array([float(t) for t in ticks], dtype=np.float64)
+        self.decimals = max([-t.normalize().as_tuple().exponent for t in ticks] + [0])
+        sl_factor = np.where(self.is_long, long_levels[0], short_levels[0])
+        tp_factor = np.where(self.is_long, long_levels[1], short_levels[1])
+        self.stop_loss = self._round(self.entry * sl_factor)
+        self.take_profit = self._round(self.entry * tp_factor)
+
+        if placing_initial:
+            initial = np.array([s in placing_initial for s in self.symbols], dtype=bool)
+            self.existing_sl = np.where(initial, self.stop_loss, self.existing_sl)
+
+        self._evaluate_trailing(trail_perc, activation_buffer)
+
+    def _round(self, values):
+        return _round(values, self.ticks, self.decimals)
+
+    def _evaluate_trailing(self, trail_perc, activation_buffer):
+        long, sl, be = self.is_long, self.existing_sl, self.break_even
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.price_change = np.where(long, self.mark - self.entry, self.entry - self.mark) / self.entry * 100
+            # `existing_sl and ...` in the scalar code: a 0.0 stop counts as no stop
+            has_sl = ~np.isnan(sl) & (sl != 0)
+            sl_weaker = np.isnan(sl) | np.where(long, sl < be * (1 - TOLERANCE), sl > be * (1 + TOLERANCE))
+            already_be = has_sl & (np.abs(sl - be) / be < TOLERANCE)
+        be_window = sl_weaker & (LOWER_TRIGGER < self.price_change) & (self.price_change < activation_buffer)
+        waiting = self.price_change < activation_buffer
+        trail_sl = self._round(np.where(long, self.mark * (1 - trail_perc / 100), self.mark * (1 + trail_perc / 100)))
+        improves = np.where(long, trail_sl > sl, trail_sl < sl)
+
+        # Same precedence as the early returns of evaluate_trailing_stop
+        conditions = [already_be, be_window, waiting, has_sl & improves, has_sl]
+        self.state = np.select(conditions, [14, 12, 13, 9, 10], default=9)
+        self.action = np.select(conditions, [NO_ACTION, PLACE, NO_ACTION, REPLACE, NO_ACTION], default=PLACE)
+        self.new_sl = np.select(conditions, [np.nan, self._round(be), np.nan, trail_sl, trail_sl],
+                                default=trail_sl)
+        self.trailing_active = self.pnl > 0      # Trailing is only managed for positions in profit
+
+    def levels(self, i):
+        """Row i in the shape of binance_ops.position_levels()."""
+        return {"symbol": self.symbols[i], "entry": float(self.entry[i]), "amt": float(self.amt[i]),
+                "pnl": float(self.pnl[i]), "volume": float(self.volume[i]), "pnl_perc": float(self.pnl_perc[i]),
+                "side": "SELL" if self.is_long[i] else "BUY",
+                "stop_loss": float(self.stop_loss[i]), "take_profit": float(self.take_profit[i])}
+
+    def decision(self, i):
+        """Row i in the shape of place_orders.evaluate_trailing_stop(), or None when trailing is not active."""
+        if not self.trailing_active[i]:
+            return None
+        state = int(self.state[i])
+        action = int(self.action[i])
+        sl = self.existing_sl[i]
+        new_sl = self.new_sl[i]
+        return {"symbol": self.symbols[i], "side": "SELL" if self.is_long[i] else "BUY",
+                "direction": "LONG" if self.is_long[i] else "SHORT", "price_change": float(self.price_change[i]),
+                "mark": float(self.mark[i]), "break_even": float(self.break_even[i]),
+                "existing_sl": None if np.isnan(sl) else float(sl),
+                "action": ACTION_NAMES[action], "new_sl": None if np.isnan(new_sl) else float(new_sl),
+                "info": ACTION_INFO.get(state) if action != NO_ACTION else None, "state": state}
+
+    def actions(self):
+        """Compact list for the order layer: decision() of the trailing rows that place or replace a stop."""
+        return [self.decision(i) for i in np.flatnonzero(self.trailing_active & (self.action != NO_ACTION))]
+
+    def states(self):
+        """(symbol, state code) of every row whose trailing is active, with or without an action."""
+        return [(self.symbols[i], int(self.state[i])) for i in np.flatnonzero(self.trailing_active)]
+
+    def __len__(self):
+        return len(self.symbols)
@@ -0,0 +1,247 @@
+import heapq
+import time
+from dataclasses import replace
+
+import Dat
+import metrics
+import place_orders
+from exchange import get_backend
+from logging_pipeline import get_logger
+
+###---- Adaptive polling settings (override from Dat if present)
+ADAPTIVE_POLLING = getattr(Dat, 'adaptive_polling', True)
+# Between full cycles (positionRisk + openOrders + every decision) a positionRisk poll keeps the fixed 5 s
+# cadence: a new position still gets its initial SL/TP within 5 s, and the polled marks feed the due checks.
+FULL_CYCLE_INTERVAL = getattr(Dat, 'full_cycle_interval', 30)      # Seconds between full cycles when polling adaptively
+POSITION_POLL_INTERVAL = getattr(Dat, 'position_poll_interval', 5)  # Seconds between positionRisk polls (weight 5)
+MIN_INTERVAL = getattr(Dat, 'poll_min_interval', 0.5)              # Seconds between checks of a symbol at a threshold
+MAX_INTERVAL = getattr(Dat, 'poll_max_interval', 30.0)             # Longest wait between checks of an idle symbol
+MIN_VOLATILITY = getattr(Dat, 'poll_min_volatility', 0.05)        # %/√s assumed for symbols not observed moving faster
+VOLATILITY_SIGMAS = 3.0     # A symbol is checked again before a move of this many sigmas could reach a threshold
+VOLATILITY_SMOOTHING = 0.3  # Weight of the newest observation in a symbol's variance estimate
+POLL_WEIGHT_PER_MIN = getattr(Dat, 'poll_weight_per_min', 120)     # Request weight the between-cycle checks may use
+ALL_MARKS_MIN = 10      # From this many due symbols on, one premiumIndex for all (weight 10) beats one per symbol
+
+log = get_logger(__name__)
+
+
+###---- Distance to the next decision of place_orders.evaluate_trailing_stop
+def threshold_distance(position, existing_sl, trail_perc, activation_buffer, lower_trigger=place_orders.LOWER_TRIGGER):
+    """
+    % the mark has to move before the trailing decision of `position` can place or move a stop: the
+    break-even window (lower_trigger), activation_buffer and the price at which the trailing SL would
+    beat existing_sl. Crossing the entry only changes the logged state, so it is not a threshold.
+    """
+    entry, mark = position.entry_price, position.mark_price
+    sign = 1 if position.amount > 0 else -1
+    levels = [entry * (1 + sign * lower_trigger / 100), entry * (1 + sign * activation_buffer / 100)]
+    if existing_sl:
+        levels.append(existing_sl / (1 - trail_perc / 100) if sign > 0 else existing_sl / (1 + trail_perc / 100))
+    return min(abs(level - mark) for level in levels) / mark * 100
+
+
+def poll_interval(distance_pct, volatility=0.0):
+    """Seconds before a random walk of `volatility` (%/√s) reaches distance_pct with VOLATILITY_SIGMAS of margin."""
+    sigma = VOLATILITY_SIGMAS * max(MIN_VOLATILITY, volatility)
+    return min(MAX_INTERVAL, max(MIN_INTERVAL, (distance_pct / sigma) ** 2))
+
+
+class SymbolScheduler:
+    """
+    Between full cycles, re-checks each open position when its mark may have reached a decision
+    threshold: symbols close to one are checked every MIN_INTERVAL, idle ones back off up to MAX_INTERVAL.
+    Every POSITION_POLL_INTERVAL a positionRisk poll looks for opened or closed positions (either one
+    ends the wait for the next full cycle) and its marks check the due symbols for free. In between,
+    checks read mark prices (premiumIndex, weight 1 per symbol or 10 for all) and run the same
+    trailing-stop decision; they stay inside POLL_WEIGHT_PER_MIN, earliest due first.
+    Intervals scale with the square of the distance over each symbol's observed volatility (%/√s).
+    """
+
+    def __init__(self, trail_perc, activation_buffer, weight_per_min=POLL_WEIGHT_PER_MIN):
+        self.trail_perc = trail_perc
+        self.activation_buffer = activation_buffer
+        self.refill_rate = weight_per_min / 60.0
+        self.capacity = max(float(ALL_MARKS_MIN), weight_per_min / 6.0)    # 10 seconds of budget
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self.positions = {}     # symbol -> own copy of the exchange.Position, marks updated by the checks
+        self.snapshot = None
+        self.full_cycle_needed = False
+        self._heap = []         # (due, symbol)
+        self._seen = {}         # symbol -> (mark, monotonic time) of the last mark read
+        self._variance = {}     # symbol -> smoothed (mark change %)² per second
+        self._next_positions_poll = time.monotonic() + POSITION_POLL_INTERVAL
+        self.stats = {"checks": 0, "mark_requests": 0, "weight": 0, "actions": 0, "deferred": 0, "stops_reached": 0,
+                      "position_polls": 0, "positions_changed": 0}
+
+    def reset(self, positions, snapshot):
+        """Schedule every open position from the marks of a full cycle (no open-orders snapshot → no checks)."""
+        self.snapshot = snapshot
+        self.positions = {p.symbol: replace(p) for p in positions} if snapshot is not None else {}
+        self.full_cycle_needed = False
+        self._heap = []
+        now = time.monotonic()
+        self._next_positions_poll = now + POSITION_POLL_INTERVAL
+        self._variance = {s: v for s, v in self._variance.items() if s in self.positions}
+        self._seen = {s: v for s, v in self._seen.items() if s in self.positions}
+        for position in self.positions.values():
+            self._observe(position.symbol, position.mark_price, now)
+            self._schedule(position, now)
+
+    def _observe(self, symbol, mark, now):
+        seen = self._seen.get(symbol)
+        self._seen[symbol] = (mark, now)
+        if seen is None or now <= seen[1] or not seen[0]:
+            return
+        observed = ((mark - seen[0]) / seen[0] * 100) ** 2 / (now - seen[1])
+        previous = self._variance.get(symbol)
+        self._variance[symbol] = observed if previous is None else previous + VOLATILITY_SMOOTHING * (observed - previous)
+
+    def _schedule(self, position, now):
+        distance = threshold_distance(position, self.snapshot.stop_price(position.symbol),
+                                      self.trail_perc, self.activation_buffer)
+        interval = poll_interval(distance, self._variance.get(position.symbol, 0.0) ** 0.5)
+        metrics.observe("poll_interval_seconds", interval)
+        heapq.heappush(self._heap, (now + interval, position.symbol))
+
+    def next_due(self):
+        return self._heap[0][0] if self._heap else None
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def _fetch_marks(self, symbols):
+        backend = get_backend()
+        if len(symbols) >= ALL_MARKS_MIN:
+            self.tokens -= 10
+            self.stats["weight"] += 10
+            self.stats["mark_requests"] += 1
+            return backend.get_mark_prices()
+        marks = {}
+        for symbol in symbols:
+            marks.update(backend.get_mark_prices(symbol))
+        self.tokens -= len(symbols)
+        self.stats["weight"] += len(symbols)
+        self.stats["mark_requests"] += len(symbols)
+        return marks
+
+    def _affordable(self, due, now):
+        """Due symbols the budget allows a mark request for; the others are pushed back."""
+        if len(due) < ALL_MARKS_MIN:
+            # Symbols falling due within the next second come along when that makes one request for all cheaper
+            soon = sum(1 for due_at, symbol in self._heap if due_at <= now + 1.0 and symbol in self.positions)
+            all_marks = len(due) + soon >= ALL_MARKS_MIN
+        else:
+            all_marks = True
+        if all_marks and self.tokens >= 10:
+            # One request returns every mark: check every tracked symbol, due or not
+            self._heap = []
+            return list(self.positions)
+        # Single checks keep one all-marks request in reserve, so deferred symbols are swept together
+        reserve = 10 if len(self.positions) >= ALL_MARKS_MIN else 0
+        affordable = 0 if all_marks else max(0, min(len(due), int(self.tokens - reserve)))
+        checked, deferred = due[:affordable], due[affordable:]
+        retry_at = now + max(1.0, (10 if all_marks or reserve else 1) - self.tokens) / self.refill_rate
+        for symbol in deferred:
+            heapq.heappush(self._heap, (retry_at, symbol))
+        self.stats["deferred"] += len(deferred)
+        return checked
+
+    def poll(self, store, marks=None):
+        """
+        Check the due symbols the budget allows; the rest are pushed back. With `marks` already read
+        (positionRisk poll) every due symbol is checked without a request. Returns the symbols checked.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            symbol = heapq.heappop(self._heap)[1]
+            if symbol in self.positions:
+                due.append(symbol)
+        if not due:
+            return []
+
+        if marks is not None:
+            checked = due
+        else:
+            checked = self._affordable(due, now)
+        if not checked:
+            return []
+
+        with metrics.timer("cycle_stage_seconds", stage="symbol_checks"):
+            if marks is None:
+                marks = self._fetch_marks(checked)
+            for symbol in checked:
+                self._check(symbol, marks.get(symbol), store, now)
+        return checked
+
+    def _check(self, symbol, mark, store, now):
+        position = self.positions[symbol]
+        self.stats["checks"] += 1
+        metrics.inc("symbol_checks_total")
+        if mark is not None:
+            position.set_mark(mark)
+            self._observe(symbol, mark, now)
+        existing_sl = self.snapshot.stop_price(symbol)
+        if existing_sl and (position.mark_price <= existing_sl if position.amount > 0 else position.mark_price >= existing_sl):
+            # The stop has probably filled and closed the position: only a full cycle can tell
+            del self.positions[symbol]
+            self.stats["stops_reached"] += 1
+            self.full_cycle_needed = True
+            return
+        if position.unrealized_profit > 0:
+            decision = place_orders.evaluate_trailing_stop(position, existing_sl, self.trail_perc, self.activation_buffer)
+            if decision["action"] is not None:
+                place_orders.apply_trailing_decision(decision, self.snapshot)
+                store.set_state(symbol, decision["state"])
+                store.set_stop(symbol, self.snapshot.stop_price(symbol))
+                self.stats["actions"] += 1
+        self._schedule(position, now)
+
+    def poll_positions(self, store):
+        """positionRisk poll: a new or closed position asks for a full cycle, otherwise its marks check the due symbols."""
+        self._next_positions_poll = time.monotonic() + POSITION_POLL_INTERVAL
+        self.stats["position_polls"] += 1
+        with metrics.timer("cycle_stage_seconds", stage="position_poll"):
+            positions = get_backend().get_positions()
+        if positions is None:
+            return []       # Failed fetch: keep checking what we track
+        fresh = {p.symbol: p for p in positions}
+        if fresh.keys() != self.positions.keys():
+            # Initial SL/TP, closed-position cleanup and the open-orders snapshot all need a full cycle
+            self.stats["positions_changed"] += 1
+            self.full_cycle_needed = True
+            return []
+        self.positions.update(fresh)
+        return self.poll(store, {symbol: p.mark_price for symbol, p in fresh.items()})
+
+    def run_until(self, deadline, store, stop=None):
+        """
+        Check symbols as they fall due and poll positions every POSITION_POLL_INTERVAL until `deadline`
+        (time.monotonic()), a needed full cycle or `stop`.
+        """
+        while not self.full_cycle_needed:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            if now >= self._next_positions_poll:
+                self.poll_positions(store)
+                continue
+            due = self.next_due()
+            wake = min(deadline, self._next_positions_poll, deadline if due is None else due)
+            if wake > now:
+                if stop is not None:
+                    if stop.wait(wake - now):
+                        return
+                else:
+                    time.sleep(wake - now)
+                continue
+            self.poll(store)
+
+    def print_stats(self):
+        s = dict(self.stats, tracked=len(self.positions), tokens=round(self.tokens, 1))
+        log.info("[SCHEDULER] tracked=%s checks=%s mark_requests=%s weight=%s actions=%s deferred=%s stops_reached=%s "
+                 "position_polls=%s positions_changed=%s", s['tracked'], s['checks'], s['mark_requests'], s['weight'],
+                 s['actions'], s['deferred'], s['stops_reached'], s['position_polls'], s['positions_changed'], extra=s)
@@ -0,0 +1,164 @@
+import threading
+import time
+
+import store_data
+from logging_pipeline import get_logger
+
+ENTRY_TTL = 150     # Seconds before an entry's DB flags are re-read (the old cache was wiped every 30 cycles of 5s)
+
+log = get_logger(__name__)
+
+
+class SymbolState:
+    """What the bot knows about one symbol. `version` changes on every update or invalidation."""
+    __slots__ = ("symbol", "position", "tp_set", "sl_set", "stop_price", "state_code", "version", "expires_at")
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.position = None
+        self.tp_set = None          # None = unknown, read from the DB on the next refresh
+        self.sl_set = None
+        self.stop_price = None
+        self.state_code = None
+        self.version = 0
+        self.expires_at = 0.0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class StateStore:
+    """
+    Per-symbol position, TP/SL flags, current stop price and last state code, replacing the old
+    tp_status_cache. Flags come from MySQL in bulk (one query at startup, one per refresh for every
+    expired or invalidated entry) instead of one check_tp_sl_status() per symbol.
+    """
+
+    def __init__(self, ttl=ENTRY_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = {"db_loads": 0, "symbols_loaded": 0, "invalidations": 0, "closed": 0}
+
+    def _entry(self, symbol):
+        entry = self._entries.get(symbol)
+        if entry is None:
+            entry = self._entries[symbol] = SymbolState(symbol)
+        return entry
+
+    def _touch(self, entry):
+        entry.version += 1
+
+    ###---- Loading from MySQL
+    def load(self, symbols=None):
+        """Bulk-load flags for all active positions (startup) or for the given symbols."""
+        with self._lock:
+            versions = {s: self._entries[s].version for s in self._entries} if symbols is not None else {}
+        rows = store_data.load_position_states(symbols)
+        now = time.monotonic()
+        with self._lock:
+            self.stats["db_loads"] += 1
+            self.stats["symbols_loaded"] += len(rows)
+            for symbol in (symbols if symbols is not None else rows):
+                entry = self._entry(symbol)
+                if symbol in versions and entry.version != versions[symbol]:
+                    continue    # Changed while the query ran; our newer in-memory state wins
+                row = rows.get(symbol, {"tp_set": 0, "sl_set": 0, "trailing_stop": None, "state": None})
+                entry.tp_set = bool(row["tp_set"])
+                entry.sl_set = bool(row["sl_set"])
+                if entry.stop_price is None and row["trailing_stop"]:
+                    entry.stop_price = float(row["trailing_stop"])
+                if entry.state_code is None:
+                    entry.state_code = row["state"]
+                entry.expires_at = now + self.ttl
+                self._touch(entry)
+
+    def refresh(self, symbols):
+        """Re-read, in one query, the symbols whose flags are unknown or expired."""
+        now = time.monotonic()
+        with self._lock:
+            stale = [s for s in symbols
+                     if s not in self._entries or self._entries[s].tp_set is None or self._entries[s].expires_at <= now]
+        if stale:
+            self.load(stale)
+        return stale
+
+    ###---- Positions and closed-position detection
+    def apply_positions(self, positions):
+        """Record this cycle's open positions; return the symbols that were open before and are gone now."""
+        open_symbols = {p.symbol for p in positions}
+        with self._lock:
+            for position in positions:
+                entry = self._entry(position.symbol)
+                entry.position = position
+            closed = [s for s in self._entries if s not in open_symbols]
+            for symbol in closed:
+                del self._entries[symbol]
+            self.stats["closed"] += len(closed)
+        return closed
+
+    def remove(self, symbol):
+        with self._lock:
+            if self._entries.pop(symbol, None) is not None:
+                self.stats["closed"] += 1
+
+    ###---- Updates from the bot's own actions
+    def tp_set(self, symbol):
+        entry = self._entries.get(symbol)
+        return None if entry is None else entry.tp_set
+
+    def mark_tp_sl_set(self, symbol, stop_price=None):
+        with self._lock:
+            entry = self._entry(symbol)
+            entry.tp_set = entry.sl_set = True
+            if stop_price is not None:
+                entry.stop_price = stop_price
+            entry.expires_at = time.monotonic() + self.ttl
+            self._touch(entry)
+
+    def set_stop(self, symbol, stop_price):
+        with self._lock:
+            entry = self._entry(symbol)
+            entry.stop_price = stop_price
+            self._touch(entry)
+
+    def set_state(self, symbol, state_code):
+        with self._lock:
+            entry = self._entry(symbol)
+            if entry.state_code != state_code:
+                entry.state_code = state_code
+                self._touch(entry)
+
+    ###---- Exchange events
+    def invalidate(self, symbol):
+        """Forget DB-derived flags (e.g. our TP/SL was cancelled or filled outside the bot)."""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None:
+                entry.tp_set = entry.sl_set = None
+                entry.expires_at = 0.0
+                self._touch(entry)
+                self.stats["invalidations"] += 1
+
+    def apply_order_event(self, symbol, order_type, status, stop_price=None):
+        """ORDER_TRADE_UPDATE: track our stop; a TP that disappears without filling invalidates the flags."""
+        if order_type == "STOP_MARKET":
+            if status == "NEW":
+                self.set_stop(symbol, float(stop_price))
+            elif status in ("CANCELED", "EXPIRED", "FILLED"):
+                self.set_stop(symbol, None)
+        elif order_type == "TAKE_PROFIT_MARKET" and status in ("CANCELED", "EXPIRED"):
+            self.invalidate(symbol)
+
+    ###---- Reads
+    def get(self, symbol):
+        entry = self._entries.get(symbol)
+        return None if entry is None else entry.as_dict()
+
+    def symbols(self):
+        return list(self._entries)
+
+    def print_stats(self):
+        s = self.stats
+        log.info("[STATE] symbols=%s db_loads=%s loaded=%s invalidations=%s closed=%s", len(self._entries),
+                 s['db_loads'], s['symbols_loaded'], s['invalidations'], s['closed'], extra=dict(s))
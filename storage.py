@@ -0,0 +1,762 @@
+import atexit
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+import Dat
+import accounts
+import db_pool
+import metrics
+from logging_pipeline import get_logger
+
+###---- Storage settings (override from Dat if present)
+# Dat.storage_backend = "sqlite" keeps the position tables in an embedded file (no DB server needed);
+# with Dat.storage_replicate = True every write is also forwarded to the MySQL of Dat.db_config.
+STORAGE_BACKEND = getattr(Dat, 'storage_backend', 'mysql')
+STORAGE_REPLICATE = getattr(Dat, 'storage_replicate', False)
+SQLITE_PATH = getattr(Dat, 'sqlite_path', 'trading_monitor.db')
+SQLITE_BUSY_TIMEOUT = getattr(Dat, 'sqlite_busy_timeout', 5.0)     # Seconds a writer waits for another one
+REPLICATION_INTERVAL = getattr(Dat, 'replication_interval', 2.0)   # Seconds between batches sent to MySQL
+REPLICATION_BATCH = getattr(Dat, 'replication_batch', 200)         # Write operations per MySQL transaction
+REPLICATION_MAX_BACKLOG = getattr(Dat, 'replication_max_backlog', 50000)    # Oldest operations are dropped past this
+HISTORY_RETENTION_DAYS = getattr(Dat, 'history_retention_days', 30)        # position_history days kept
+HISTORY_PARTITIONS_AHEAD = 3                                               # Future daily MySQL partitions kept ready
+
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+METRIC_COLUMNS = ("trailing_stop", "take_profit", "volume", "change_", "info")
+TP_SL_COLUMNS = ("tp_set", "sl_set")
+HISTORY_COLUMNS = "(account, symbol, recorded_at, mark_price, unrealized_profit, stop_price, state)"
+
+log = get_logger(__name__)
+
+
+def _group_metrics(account, pending):
+    """{symbol: {column: value}} → {sorted column tuple: [row values + (account, symbol)]}, one statement per key."""
+    groups = {}
+    for symbol, columns in pending.items():
+        key = tuple(sorted(columns))
+        if not set(key) <= set(METRIC_COLUMNS):
+            raise ValueError(f"Unknown metric columns {key}")
+        groups.setdefault(key, []).append(tuple(columns[c] for c in key) + (account, symbol))
+    return groups
+
+
+class StorageBackend:
+    """
+    What store_data needs from a database. Every call names its account; the rows of write_sync
+    are store_data._position_row() tuples. Writes are operations (name, args) that apply() runs in
+    one transaction, so a replicator can forward them to another backend in batches.
+    """
+
+    name = None
+
+    def ensure_schema(self):
+        raise NotImplementedError
+
+    def apply(self, operations):
+        """Run [(name, args)] write operations in one transaction."""
+        raise NotImplementedError
+
+    ###---- Reads
+    def active_symbols(self, account):
+        """Symbols with position_status = 1."""
+        raise NotImplementedError
+
+    def tp_sl_status(self, account, symbol):
+        """(tp_set, sl_set) of a symbol, or None without a row."""
+        raise NotImplementedError
+
+    def load_states(self, account, symbols=None):
+        """(symbol, tp_set, sl_set, trailing_stop, take_profit, state) rows of the active positions or of `symbols`."""
+        raise NotImplementedError
+
+    ###---- Writes
+    def write_sync(self, account, upserts, mark_updates, closed_symbols, pending_metrics, pending_states):
+        self.apply([("sync", (account, upserts, mark_updates, closed_symbols, pending_metrics, pending_states))])
+
+    def update_metrics(self, account, symbol, columns):
+        self.apply([("sync", (account, [], [], (), {symbol: columns}, {}))])
+
+    def set_tp_sl(self, account, symbol, columns):
+        self.apply([("tp_sl", (account, symbol, columns))])
+
+    def write_state(self, account, symbol, state):
+        self.apply([("sync", (account, [], [], (), {}, {symbol: state}))])
+
+    ###---- Position history (append-only, one row per account and symbol per cycle)
+    def append_history(self, rows):
+        """(account, symbol, recorded_at, mark_price, unrealized_profit, stop_price, state) rows, in one transaction."""
+        self.apply([("history", (rows,))])
+
+    def maintain_history(self, now=None):
+        """Drop history older than HISTORY_RETENTION_DAYS."""
+        raise NotImplementedError
+
+    def trajectory(self, account, symbol, since, until, limit=None):
+        """(recorded_at, mark_price, unrealized_profit, stop_price, state) rows of one symbol in time order."""
+        raise NotImplementedError
+
+    def cycle_pnl(self, account, since, until):
+        """(recorded_at, pnl_sum, positions) per cycle of one account."""
+        raise NotImplementedError
+
+    def take_resync(self, account):
+        """True once if writes of `account` were lost and the next sync should rewrite every row."""
+        return False
+
+    def close(self):
+        pass
+
+    def print_stats(self):
+        pass
+
+
+###---- MySQL (Dat.db_config, through db_pool)
+class MySQLBackend(StorageBackend):
+    name = "mysql"
+
+    UPSERT_POSITION_QUERY = """
+        INSERT INTO trading_positions (
+            account, symbol, position_exchange, position_amount, entry_price, margin_type, position_side,
+            position_direction, leverage, liquidation_price, mark_price, unrealized_profit,
+            last_trade_time, position_status, breakeven_price
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            position_amount = VALUES(position_amount),
+            entry_price = VALUES(entry_price),
+            position_direction = VALUES(position_direction),
+            mark_price = VALUES(mark_price),
+            unrealized_profit = VALUES(unrealized_profit),
+            last_trade_time = VALUES(last_trade_time),
+            position_status = 1,
+            breakeven_price = VALUES(breakeven_price)
+    """
+    UPDATE_MARK_QUERY = "UPDATE trading_positions SET mark_price = %s, unrealized_profit = %s WHERE account = %s AND symbol = %s;"
+    INSERT_STATE_QUERY = """
+        INSERT INTO position_state (account, symbol, state, updated_at, status_)
+        VALUES (%s, %s, %s, NOW(), 1)
+        ON DUPLICATE KEY UPDATE
+            state = VALUES(state),
+            updated_at = NOW(),
+            status_ = 1
+    """
+    ACCOUNT_TABLES = ("trading_positions", "position_state")
+    # The primary key doubles as the trajectory index and includes the partitioning column, as MySQL
+    # requires. SUM(unrealized_profit) per account and recorded_at is the cycle's pnl_sum.
+    CREATE_HISTORY_QUERY = """
+        CREATE TABLE IF NOT EXISTS position_history (
+            account VARCHAR(32) NOT NULL,
+            symbol VARCHAR(32) NOT NULL,
+            recorded_at DATETIME(3) NOT NULL,
+            mark_price DECIMAL(24, 8) NOT NULL,
+            unrealized_profit DECIMAL(24, 8) NOT NULL,
+            stop_price DECIMAL(24, 8) NULL,
+            state SMALLINT NULL,
+            PRIMARY KEY (account, symbol, recorded_at)
+        )
+        PARTITION BY RANGE (TO_DAYS(recorded_at)) ({partitions})
+    """
+
+    def __init__(self):
+        self._history_ready = False
+
+    def ensure_schema(self):
+        """
+        Add the account column to the position tables if missing: existing rows go to accounts.DEFAULT_ACCOUNT
+        and the unique key on symbol becomes (account, symbol).
+        """
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            for table in self.ACCOUNT_TABLES:
+                cursor.execute("""
+                    SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'account';
+                """, (table,))
+                if cursor.fetchall():
+                    continue
+                cursor.execute("""
+                    SELECT INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0
+                    GROUP BY INDEX_NAME HAVING GROUP_CONCAT(COLUMN_NAME) = 'symbol';
+                """, (table,))
+                keys = [row[0] for row in cursor.fetchall()]
+                changes = [f"ADD COLUMN account VARCHAR(32) NOT NULL DEFAULT '{accounts.DEFAULT_ACCOUNT}' FIRST"]
+                changes += ["DROP PRIMARY KEY" if key == "PRIMARY" else f"DROP INDEX `{key}`" for key in keys]
+                changes.append("ADD PRIMARY KEY (account, symbol)" if "PRIMARY" in keys
+                               else "ADD UNIQUE KEY uq_account_symbol (account, symbol)")
+                cursor.execute(f"ALTER TABLE {table} {', '.join(changes)};")
+                log.info("Columna account añadida a %s (filas existentes → %s)", table, accounts.DEFAULT_ACCOUNT)
+            cursor.close()
+
+    def apply(self, operations):
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            for name, args in operations:
+                getattr(self, f"_{name}")(cursor, *args)
+            connection.commit()
+            cursor.close()
+
+    def _sync(self, cursor, account, upserts, mark_updates, closed_symbols, pending_metrics, pending_states):
+        if upserts:
+            cursor.executemany(self.UPSERT_POSITION_QUERY, upserts)
+        if mark_updates:
+            cursor.executemany(self.UPDATE_MARK_QUERY, mark_updates)
+        if closed_symbols:
+            placeholders = ', '.join(['%s'] * len(closed_symbols))
+            params = (account,) + tuple(closed_symbols)
+            cursor.execute(f"UPDATE position_state SET status_ = 0 WHERE account = %s AND symbol IN ({placeholders});",
+                           params)
+            cursor.execute(f"""
+                UPDATE trading_positions
+                SET position_amount = 0.0,
+                    entry_price = 0.0,
+                    liquidation_price = 0.0,
+                    mark_price = 0.0,
+                    unrealized_profit = 0.0,
+                    trailing_stop = 0.0,
+                    take_profit = 0.0,
+                    position_status = 0,
+                    info = '',
+                    tp_set = 0,
+                    sl_set = 0,
+                    breakeven_price = 0.0
+                WHERE account = %s AND symbol IN ({placeholders});
+            """, params)
+        for key, rows in _group_metrics(account, pending_metrics).items():
+            cursor.executemany(f"UPDATE trading_positions SET {', '.join(f'{c} = %s' for c in key)} "
+                               f"WHERE account = %s AND symbol = %s;", rows)
+        if pending_states:
+            cursor.executemany(self.INSERT_STATE_QUERY, [(account, symbol, state) for symbol, state in pending_states.items()])
+
+    def _tp_sl(self, cursor, account, symbol, columns):
+        key = [c for c in TP_SL_COLUMNS if c in columns]
+        cursor.execute(f"UPDATE trading_positions SET {', '.join(f'{c} = %s' for c in key)} WHERE account = %s AND symbol = %s;",
+                       tuple(columns[c] for c in key) + (account, symbol))
+
+    ###---- position_history: daily partitions, created with the first history write
+    @staticmethod
+    def _partition_name(day):
+        return f"p{day.strftime('%Y%m%d')}"
+
+    @classmethod
+    def _partition_clause(cls, day):
+        """Partition holding `day`: everything before the next day."""
+        return f"PARTITION {cls._partition_name(day)} VALUES LESS THAN (TO_DAYS('{(day + timedelta(days=1)).isoformat()}'))"
+
+    def _ensure_history(self, cursor):
+        if self._history_ready:
+            return
+        today = datetime.now().date()
+        days = [today + timedelta(days=i) for i in range(HISTORY_PARTITIONS_AHEAD + 1)]
+        partitions = ", ".join([self._partition_clause(d) for d in days] + ["PARTITION pmax VALUES LESS THAN MAXVALUE"])
+        cursor.execute(self.CREATE_HISTORY_QUERY.format(partitions=partitions))
+        # Tables created before accounts: existing rows belong to the default account
+        cursor.execute("""
+            SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'position_history' AND COLUMN_NAME = 'account';
+        """)
+        if not cursor.fetchall():
+            cursor.execute(f"""
+                ALTER TABLE position_history
+                    ADD COLUMN account VARCHAR(32) NOT NULL DEFAULT '{accounts.DEFAULT_ACCOUNT}' FIRST,
+                    DROP PRIMARY KEY, ADD PRIMARY KEY (account, symbol, recorded_at);
+            """)
+        self._history_ready = True
+
+    def _history(self, cursor, rows):
+        self._ensure_history(cursor)
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(rows))
+        cursor.execute(f"INSERT IGNORE INTO position_history {HISTORY_COLUMNS} VALUES {placeholders};",
+                       tuple(v for row in rows for v in row))
+
+    def maintain_history(self, now=None):
+        """Split future daily partitions off pmax and drop those older than HISTORY_RETENTION_DAYS."""
+        today = (now or datetime.now()).date()
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            self._ensure_history(cursor)
+            cursor.execute("""
+                SELECT PARTITION_NAME FROM INFORMATION_SCHEMA.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'position_history' AND PARTITION_NAME IS NOT NULL;
+            """)
+            existing = {row[0] for row in cursor.fetchall()}
+
+            missing = [d for d in (today + timedelta(days=i) for i in range(HISTORY_PARTITIONS_AHEAD + 1))
+                       if self._partition_name(d) not in existing]
+            last_existing = max((n for n in existing if n != "pmax"), default=None)
+            missing = [d for d in missing if last_existing is None or self._partition_name(d) > last_existing]
+            if missing:
+                clauses = ", ".join([self._partition_clause(d) for d in missing] + ["PARTITION pmax VALUES LESS THAN MAXVALUE"])
+                cursor.execute(f"ALTER TABLE position_history REORGANIZE PARTITION pmax INTO ({clauses});")
+
+            cutoff = self._partition_name(today - timedelta(days=HISTORY_RETENTION_DAYS))
+            expired = sorted(n for n in existing if n != "pmax" and n < cutoff)
+            if expired:
+                cursor.execute(f"ALTER TABLE position_history DROP PARTITION {', '.join(expired)};")
+                log.info("[HISTORY] Dropped %s expired partitions (retention %s days)", len(expired), HISTORY_RETENTION_DAYS)
+            cursor.close()
+
+    def trajectory(self, account, symbol, since, until, limit=None):
+        # The recorded_at range lets MySQL prune partitions; the primary key serves the account/symbol lookup
+        query = """
+            SELECT recorded_at, mark_price, unrealized_profit, stop_price, state
+            FROM position_history
+            WHERE account = %s AND symbol = %s AND recorded_at >= %s AND recorded_at < %s
+            ORDER BY recorded_at
+        """
+        params = (account, symbol, since, until)
+        if limit:
+            query += " LIMIT %s"
+            params += (limit,)
+        return self._fetch(query, params)
+
+    def cycle_pnl(self, account, since, until):
+        return self._fetch("""
+            SELECT recorded_at, SUM(unrealized_profit), COUNT(*)
+            FROM position_history
+            WHERE account = %s AND recorded_at >= %s AND recorded_at < %s
+            GROUP BY recorded_at
+            ORDER BY recorded_at
+        """, (account, since, until))
+
+    def _fetch(self, query, params, one=False):
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            result = cursor.fetchone() if one else cursor.fetchall()
+            cursor.close()
+        return result
+
+    def active_symbols(self, account):
+        rows = self._fetch("SELECT symbol FROM trading_positions WHERE account = %s AND position_status = 1;", (account,))
+        return {row[0] for row in rows}
+
+    def tp_sl_status(self, account, symbol):
+        return self._fetch("SELECT tp_set, sl_set FROM trading_positions WHERE account = %s AND symbol = %s;",
+                           (account, symbol), one=True)
+
+    def load_states(self, account, symbols=None):
+        query = """
+            SELECT tp.symbol, tp.tp_set, tp.sl_set, tp.trailing_stop, tp.take_profit, ps.state
+            FROM trading_positions tp
+            LEFT JOIN position_state ps ON ps.account = tp.account AND ps.symbol = tp.symbol
+            WHERE tp.account = %s
+        """
+        if symbols is None:
+            return self._fetch(query + " AND tp.position_status = 1;", (account,))
+        return self._fetch(query + f" AND tp.symbol IN ({', '.join(['%s'] * len(symbols))});", (account,) + tuple(symbols))
+
+
+###---- SQLite (embedded file in WAL mode: readers never block the writer, commits skip the fsync of every page)
+class SQLiteBackend(StorageBackend):
+    """
+    Same tables as MySQL in one local file. Each thread keeps its own connection; the statements are
+    constant strings, so sqlite3's per-connection statement cache prepares each of them once.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS trading_positions (
+            account TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            position_exchange TEXT,
+            position_amount REAL NOT NULL DEFAULT 0,
+            entry_price REAL NOT NULL DEFAULT 0,
+            margin_type TEXT,
+            position_side TEXT,
+            position_direction TEXT,
+            leverage REAL,
+            liquidation_price REAL NOT NULL DEFAULT 0,
+            mark_price REAL NOT NULL DEFAULT 0,
+            unrealized_profit REAL NOT NULL DEFAULT 0,
+            last_trade_time TEXT,
+            position_status INTEGER NOT NULL DEFAULT 0,
+            breakeven_price REAL NOT NULL DEFAULT 0,
+            trailing_stop REAL NOT NULL DEFAULT 0,
+            take_profit REAL NOT NULL DEFAULT 0,
+            volume REAL,
+            change_ REAL,
+            info TEXT NOT NULL DEFAULT '',
+            tp_set INTEGER NOT NULL DEFAULT 0,
+            sl_set INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (account, symbol)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS position_state (
+            account TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            state INTEGER,
+            updated_at TEXT,
+            status_ INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (account, symbol)
+        )
+        """,
+        # No partitions: retention is a range DELETE on recorded_at (ISO text, so it sorts by time)
+        """
+        CREATE TABLE IF NOT EXISTS position_history (
+            account TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            recorded_at TEXT NOT NULL,
+            mark_price REAL NOT NULL,
+            unrealized_profit REAL NOT NULL,
+            stop_price REAL,
+            state INTEGER,
+            PRIMARY KEY (account, symbol, recorded_at)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_history_account_time ON position_history (account, recorded_at)",
+    )
+    UPSERT_POSITION_QUERY = """
+        INSERT INTO trading_positions (
+            account, symbol, position_exchange, position_amount, entry_price, margin_type, position_side,
+            position_direction, leverage, liquidation_price, mark_price, unrealized_profit,
+            last_trade_time, position_status, breakeven_price
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (account, symbol) DO UPDATE SET
+            position_amount = excluded.position_amount,
+            entry_price = excluded.entry_price,
+            position_direction = excluded.position_direction,
+            mark_price = excluded.mark_price,
+            unrealized_profit = excluded.unrealized_profit,
+            last_trade_time = excluded.last_trade_time,
+            position_status = 1,
+            breakeven_price = excluded.breakeven_price
+    """
+    UPDATE_MARK_QUERY = "UPDATE trading_positions SET mark_price = ?, unrealized_profit = ? WHERE account = ? AND symbol = ?"
+    INSERT_STATE_QUERY = """
+        INSERT INTO position_state (account, symbol, state, updated_at, status_)
+        VALUES (?, ?, ?, datetime('now', 'localtime'), 1)
+        ON CONFLICT (account, symbol) DO UPDATE SET
+            state = excluded.state,
+            updated_at = excluded.updated_at,
+            status_ = 1
+    """
+    # One row per closed symbol instead of IN (...), so the statement text never changes
+    CLOSE_STATE_QUERY = "UPDATE position_state SET status_ = 0 WHERE account = ? AND symbol = ?"
+    DEACTIVATE_QUERY = """
+        UPDATE trading_positions
+        SET position_amount = 0.0, entry_price = 0.0, liquidation_price = 0.0, mark_price = 0.0,
+            unrealized_profit = 0.0, trailing_stop = 0.0, take_profit = 0.0, position_status = 0,
+            info = '', tp_set = 0, sl_set = 0, breakeven_price = 0.0
+        WHERE account = ? AND symbol = ?
+    """
+    LOAD_STATES_QUERY = """
+        SELECT tp.symbol, tp.tp_set, tp.sl_set, tp.trailing_stop, tp.take_profit, ps.state
+        FROM trading_positions tp
+        LEFT JOIN position_state ps ON ps.account = tp.account AND ps.symbol = tp.symbol
+        WHERE tp.account = ?
+    """
+    INSERT_HISTORY_QUERY = f"INSERT OR IGNORE INTO position_history {HISTORY_COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE in apply()
+            connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                                         check_same_thread=False, cached_statements=256)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")      # WAL stays consistent; only the last commits can be lost on power loss
+            if not self._schema_ready:
+                with self._schema_lock:
+                    if not self._schema_ready:
+                        for statement in self.SCHEMA:
+                            connection.execute(statement)
+                        self._schema_ready = True
+                        log.info("SQLite storage en %s (WAL)", self.path)
+            self._local.connection = connection
+        return connection
+
+    def ensure_schema(self):
+        """Tables are created with the first connection."""
+        self._connection()
+
+    def apply(self, operations):
+        connection = self._connection()
+        cursor = connection.cursor()
+        # IMMEDIATE takes the write lock up front: a concurrent writer waits busy_timeout instead of failing mid-way
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for name, args in operations:
+                getattr(self, f"_{name}")(cursor, *args)
+            cursor.execute("COMMIT")
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _sync(self, cursor, account, upserts, mark_updates, closed_symbols, pending_metrics, pending_states):
+        if upserts:
+            cursor.executemany(self.UPSERT_POSITION_QUERY, upserts)
+        if mark_updates:
+            cursor.executemany(self.UPDATE_MARK_QUERY, mark_updates)
+        if closed_symbols:
+            rows = [(account, symbol) for symbol in closed_symbols]
+            cursor.executemany(self.CLOSE_STATE_QUERY, rows)
+            cursor.executemany(self.DEACTIVATE_QUERY, rows)
+        for key, rows in _group_metrics(account, pending_metrics).items():
+            cursor.executemany(f"UPDATE trading_positions SET {', '.join(f'{c} = ?' for c in key)} "
+                               f"WHERE account = ? AND symbol = ?", rows)
+        if pending_states:
+            cursor.executemany(self.INSERT_STATE_QUERY, [(account, symbol, state) for symbol, state in pending_states.items()])
+
+    def _tp_sl(self, cursor, account, symbol, columns):
+        key = [c for c in TP_SL_COLUMNS if c in columns]
+        cursor.execute(f"UPDATE trading_positions SET {', '.join(f'{c} = ?' for c in key)} WHERE account = ? AND symbol = ?",
+                       tuple(columns[c] for c in key) + (account, symbol))
+
+    @staticmethod
+    def _timestamp(value):
+        return value.isoformat(sep=" ", timespec="milliseconds")
+
+    def _history(self, cursor, rows):
+        cursor.executemany(self.INSERT_HISTORY_QUERY, [(account, symbol, self._timestamp(recorded_at)) + tuple(rest)
+                                                       for account, symbol, recorded_at, *rest in rows])
+
+    def maintain_history(self, now=None):
+        cutoff = datetime.combine((now or datetime.now()).date() - timedelta(days=HISTORY_RETENTION_DAYS), datetime.min.time())
+        self.apply([("expire_history", (self._timestamp(cutoff),))])
+
+    def _expire_history(self, cursor, cutoff):
+        cursor.execute("DELETE FROM position_history WHERE recorded_at < ?", (cutoff,))
+        if cursor.rowcount > 0:
+            log.info("[HISTORY] Deleted %s expired rows (retention %s days)", cursor.rowcount, HISTORY_RETENTION_DAYS)
+
+    def trajectory(self, account, symbol, since, until, limit=None):
+        query = """
+            SELECT recorded_at, mark_price, unrealized_profit, stop_price, state
+            FROM position_history
+            WHERE account = ? AND symbol = ? AND recorded_at >= ? AND recorded_at < ?
+            ORDER BY recorded_at
+        """
+        params = (account, symbol, self._timestamp(since), self._timestamp(until))
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        return [(datetime.fromisoformat(row[0]),) + row[1:] for row in self._connection().execute(query, params)]
+
+    def cycle_pnl(self, account, since, until):
+        rows = self._connection().execute("""
+            SELECT recorded_at, SUM(unrealized_profit), COUNT(*)
+            FROM position_history
+            WHERE account = ? AND recorded_at >= ? AND recorded_at < ?
+            GROUP BY recorded_at
+            ORDER BY recorded_at
+        """, (account, self._timestamp(since), self._timestamp(until)))
+        return [(datetime.fromisoformat(row[0]),) + row[1:] for row in rows]
+
+    def active_symbols(self, account):
+        rows = self._connection().execute(
+            "SELECT symbol FROM trading_positions WHERE account = ? AND position_status = 1", (account,))
+        return {row[0] for row in rows}
+
+    def tp_sl_status(self, account, symbol):
+        return self._connection().execute(
+            "SELECT tp_set, sl_set FROM trading_positions WHERE account = ? AND symbol = ?", (account, symbol)).fetchone()
+
+    def load_states(self, account, symbols=None):
+        if symbols is None:
+            return self._connection().execute(self.LOAD_STATES_QUERY + " AND tp.position_status = 1", (account,)).fetchall()
+        return self._connection().execute(self.LOAD_STATES_QUERY + f" AND tp.symbol IN ({', '.join(['?'] * len(symbols))})",
+                                          (account,) + tuple(symbols)).fetchall()
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+###---- Replication: local writes, forwarded to another backend (MySQL) in batches from a background thread
+class ReplicatingBackend(StorageBackend):
+    """
+    Reads and writes go to `local`; every write is also queued and replayed on `remote` by a background
+    thread, REPLICATION_BATCH operations per transaction, in order. A failed batch is put back for the
+    next attempt. Past REPLICATION_MAX_BACKLOG the oldest operations are dropped and the next
+    sync_positions() of their accounts rewrites every row, so positions converge again.
+    """
+
+    def __init__(self, local, remote, interval=REPLICATION_INTERVAL, batch_size=REPLICATION_BATCH,
+                 max_backlog=REPLICATION_MAX_BACKLOG):
+        self.local = local
+        self.remote = remote
+        self.name = f"{local.name}+{remote.name}"
+        self.interval = interval
+        self.batch_size = batch_size
+        self._backlog = deque(maxlen=max_backlog)
+        self._backlog_lock = threading.Lock()
+        self._resync = set()            # Accounts with dropped operations
+        self._remote_checked = set()    # Accounts whose remote active symbols were merged in once
+        self._remote_ready = False
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self.stats = {"queued": 0, "replicated": 0, "dropped": 0, "batches": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="storage-replicator", daemon=True)
+        self._thread.start()
+
+    def ensure_schema(self):
+        self.local.ensure_schema()
+        self._ensure_remote()
+
+    def _ensure_remote(self):
+        if not self._remote_ready:
+            self.remote.ensure_schema()
+            self._remote_ready = True
+
+    def apply(self, operations):
+        self.local.apply(operations)
+        with self._backlog_lock:
+            for operation in operations:
+                if len(self._backlog) == self._backlog.maxlen:
+                    dropped_name, dropped_args = self._backlog[0]
+                    if dropped_name != "history":     # Lost history rows stay lost; position rows are rewritten
+                        self._resync.add(dropped_args[0])    # args[0] is the account
+                    self.stats["dropped"] += 1
+                self._backlog.append(operation)
+            self.stats["queued"] += len(operations)
+            if len(self._backlog) >= self.batch_size:
+                self._wakeup.set()
+
+    def take_resync(self, account):
+        with self._backlog_lock:
+            if account not in self._resync:
+                return False
+            self._resync.discard(account)
+        log.warning("[REPLICATION] Operaciones descartadas para %s: se reescriben todas las filas", account)
+        return True
+
+    def active_symbols(self, account):
+        symbols = self.local.active_symbols(account)
+        if account not in self._remote_checked:
+            # Rows left active in MySQL by an earlier run without the local file get deactivated too
+            try:
+                symbols |= self.remote.active_symbols(account)
+                self._remote_checked.add(account)
+            except DB_ERRORS as error:
+                log.warning("[REPLICATION] No se pudieron leer los símbolos activos remotos: %s", error)
+        return symbols
+
+    def tp_sl_status(self, account, symbol):
+        return self.local.tp_sl_status(account, symbol)
+
+    def load_states(self, account, symbols=None):
+        return self.local.load_states(account, symbols)
+
+    def maintain_history(self, now=None):
+        self.local.maintain_history(now)
+        try:
+            self.remote.maintain_history(now)
+        except DB_ERRORS as error:
+            log.warning("[REPLICATION] No se pudo mantener el historial remoto: %s", error)
+
+    def trajectory(self, account, symbol, since, until, limit=None):
+        return self.local.trajectory(account, symbol, since, until, limit)
+
+    def cycle_pnl(self, account, since, until):
+        return self.local.cycle_pnl(account, since, until)
+
+    def _drain(self):
+        with self._backlog_lock:
+            batch = []
+            while self._backlog and len(batch) < self.batch_size:
+                batch.append(self._backlog.popleft())
+            return batch
+
+    @metrics.timed("storage_replication")
+    def flush(self):
+        """Forward everything queued so far. On error the current batch is put back for the next attempt."""
+        with self._flush_lock:
+            try:
+                self._ensure_remote()
+                while True:
+                    batch = self._drain()
+                    if not batch:
+                        break
+                    try:
+                        self.remote.apply(batch)
+                    except DB_ERRORS:
+                        with self._backlog_lock:
+                            self._backlog.extendleft(reversed(batch))
+                        raise
+                    self.stats["replicated"] += len(batch)
+                    self.stats["batches"] += 1
+            except DB_ERRORS as error:
+                self.stats["errors"] += 1
+                log.error("[REPLICATION] Error replicando a %s: %s", self.remote.name, error)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._backlog:
+                self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        if self._backlog:
+            self.flush()
+        self.local.close()
+
+    def print_stats(self):
+        s = dict(self.stats, backlog=len(self._backlog))
+        log.info("[REPLICATION] queued=%s replicated=%s backlog=%s dropped=%s batches=%s errors=%s", s['queued'],
+                 s['replicated'], s['backlog'], s['dropped'], s['batches'], s['errors'], extra=s)
+
+
+###---- Backend registry: Dat.storage_backend picks one (default mysql)
+BACKENDS = {"mysql": MySQLBackend, "sqlite": SQLiteBackend}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def register_backend(name, backend_class):
+    BACKENDS[name] = backend_class
+
+
+def _create_backend():
+    backend = BACKENDS[STORAGE_BACKEND]()
+    if STORAGE_REPLICATE and STORAGE_BACKEND != "mysql":
+        backend = ReplicatingBackend(backend, MySQLBackend())
+    return backend
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+                atexit.register(_backend.close)
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the process-wide backend (tests, benchmarks); the previous one is closed."""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    if previous is not None and previous is not backend:
+        previous.close()
+
+
+def print_stats():
+    if _backend is not None:
+        _backend.print_stats()
@@ -1,222 +1,294 @@
 import Dat
-import mysql.connector
 from datetime import datetime
 import time
+import threading
+from operator import attrgetter
+import accounts
+import metrics
+import profiler
+import storage
+from logging_pipeline import get_logger
+
+log = get_logger(__name__)
+
+###---- Every row belongs to an account (accounts.current()); tables are keyed by (account, symbol).
+# The SQL lives in storage.py: Dat.storage_backend picks MySQL (default) or an embedded SQLite file.
+
+
+@metrics.timed()
+def ensure_account_column():
+    """
+    Prepare the position tables of the storage backend: on MySQL add the account column if missing
+    (existing rows go to accounts.DEFAULT_ACCOUNT), on SQLite create them. Run once at startup.
+    """
+    storage.get_backend().ensure_schema()
+
+
+###---- Write-behind buffer: state codes and metric updates are held until the next sync_positions()
+WRITE_BEHIND = getattr(Dat, 'db_write_behind', True)
+_pending_lock = threading.Lock()
+_pending_metrics = {}   # account -> {symbol -> {column: value}}, later updates overwrite earlier ones
+_pending_states = {}    # account -> {symbol -> last state code of the cycle}
+
+
+def _take_pending(account):
+    with _pending_lock:
+        return _pending_metrics.pop(account, {}), _pending_states.pop(account, {})
+
+
+def _restore_pending(account, pending_metrics, pending_states):
+    """Put back updates whose write failed; values buffered since then are newer and win."""
+    with _pending_lock:
+        buffered = _pending_metrics.setdefault(account, {})
+        for symbol, columns in pending_metrics.items():
+            current = buffered.setdefault(symbol, {})
+            for column, value in columns.items():
+                current.setdefault(column, value)
+        states = _pending_states.setdefault(account, {})
+        for symbol, state in pending_states.items():
+            states.setdefault(symbol, state)
+
+
+@profiler.traced()
+@metrics.timed()
+def flush_pending():
+    """Write buffered updates on their own (cycles where sync_positions() is not called)."""
+    account = accounts.current_name()
+    pending_metrics, pending_states = _take_pending(account)
+    if not pending_metrics and not pending_states:
+        return
+    try:
+        storage.get_backend().write_sync(account, [], [], (), pending_metrics, pending_states)
+    except storage.DB_ERRORS as error:
+        log.error("Error al escribir actualizaciones pendientes: %s", error)
+        _restore_pending(account, pending_metrics, pending_states)
+
+
+###---- Incremental sync: last-written snapshot per symbol, active symbols tracked locally (per account)
+INCREMENTAL_SYNC = getattr(Dat, 'db_incremental_sync', True)
+MARK_WRITE_INTERVAL = getattr(Dat, 'db_mark_write_interval', 30)    # Seconds between mark/PnL-only writes per symbol
+STRUCTURAL_FIELDS = ('amount', 'entry_price', 'break_even_price', 'update_time')    # exchange.Position attributes
+MARK_FIELDS = ('mark_price', 'unrealized_profit')
+_structural = attrgetter(*STRUCTURAL_FIELDS)
+_marks = attrgetter(*MARK_FIELDS)
+
+
+class _SyncState:
+    """What sync_positions() last wrote for one account."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_written = {}      # symbol -> (structural values, mark values, monotonic time of the last mark write)
+        self.active_symbols = None  # Symbols with position_status = 1 in the DB; None = read them once from the DB
+
+
+_sync_lock = threading.Lock()
+_sync_states = {}       # account -> _SyncState
+_stats_lock = threading.Lock()
+sync_stats = {"upserts": 0, "mark_updates": 0, "skipped": 0, "deactivated": 0, "active_selects": 0}
+
+def _sync_state(account):
+    state = _sync_states.get(account)
+    if state is None:
+        with _sync_lock:
+            state = _sync_states.setdefault(account, _SyncState())
+    return state
+
+
+def reset_sync_state():
+    """Forget the last-written snapshots: the next sync_positions() re-reads active symbols and upserts every row."""
+    with _sync_lock:
+        _sync_states.clear()
+
+
+def _position_row(position, account):
+    last_trade_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(position.update_time / 1000))
+    return (
+        account, position.symbol, position.exchange, position.amount, position.entry_price,
+        position.margin_type, position.position_side, position.direction, position.leverage,
+        position.liquidation_price, position.mark_price, position.unrealized_profit, last_trade_time, 1, position.break_even_price
+    )
+
+
+def _diff_positions(positions, last_written, account, now):
+    """Split positions into full upserts, mark/PnL-only updates and unchanged rows, against the last-written snapshot."""
+    upserts, mark_updates, written = [], [], {}
+    for position in positions:
+        symbol = position.symbol
+        structural = _structural(position)
+        marks = _marks(position)
+        last = last_written.get(symbol) if INCREMENTAL_SYNC else None
+        if last is None or last[0] != structural:
+            upserts.append(_position_row(position, account))
+            written[symbol] = (structural, marks, now)
+        elif last[1] != marks and now - last[2] >= MARK_WRITE_INTERVAL:
+            mark_updates.append(marks + (account, symbol))
+            written[symbol] = (structural, marks, now)
+    return upserts, mark_updates, written
 
-DB_CONFIG = Dat.db_config
 
 ###---- Sincronizar posiciones (Insertar o Actualizar en lote)
+@profiler.traced()
+@metrics.timed()
 def sync_positions(positions):
     """
     Actualiza o inserta posiciones activas desde el feed de Binance.
     Si una posición ya no aparece en la API, se marca como inactiva (position_status = 0).
-    Ahora optimizado con executemany() para insertar/actualizar todas las posiciones de una vez.
+    Solo se escriben las filas que cambiaron desde la última sincronización: cambios estructurales
+    (cantidad, entrada, dirección) de inmediato, precio de marca/PnL cada MARK_WRITE_INTERVAL segundos.
+    Las métricas y estados pendientes (write-behind) se escriben en la misma transacción.
+    Todo se limita a la cuenta actual (accounts.current()).
     """
-    try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor_select = connection.cursor()
-
-        # Obtener símbolos activos actuales en DB
-        cursor_select.execute("SELECT symbol FROM trading_positions WHERE position_status = 1;")
-        existing_symbols = {row[0] for row in cursor_select.fetchall()}
-
-        # Preparar símbolos activos desde la API
-        api_symbols = {pos['symbol'] for pos in positions}
-
-        # --- Preparar los datos para inserción/actualización ---
-        data_list = []
-        for position in positions:
-            last_trade_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(position['updateTime'] / 1000))
-            data_list.append((
-                position['symbol'], position['positionExchange'], position['positionAmt'], position['entryPrice'],
-                position['marginType'], position['positionSide'], position['positionDirection'], position['leverage'],
-                position['liquidationPrice'], position['markPrice'], position['unRealizedProfit'], last_trade_time, 1, position['breakEvenPrice']
-            ))
-
-        insert_query = """
-            INSERT INTO trading_positions (
-                symbol, position_exchange, position_amount, entry_price, margin_type, position_side, 
-                position_direction, leverage, liquidation_price, mark_price, unrealized_profit, 
-                last_trade_time, position_status, breakeven_price
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                position_amount = VALUES(position_amount),
-                entry_price = VALUES(entry_price),
-                position_direction = VALUES(position_direction),
-                mark_price = VALUES(mark_price),
-                unrealized_profit = VALUES(unrealized_profit),
-                last_trade_time = VALUES(last_trade_time),
-                position_status = 1,
-                breakeven_price = VALUES(breakeven_price)
-        """
-
-        # ✅ Ejecutar todos los inserts/updates en lote
-        cursor_insert_update = connection.cursor()
-        if data_list:
-            cursor_insert_update.executemany(insert_query, data_list)
-            # print(f"\n{len(data_list)} posiciones sincronizadas en lote.")
-
-        # --- Marcar posiciones cerradas como inactivas y restablecer valores
-        closed_symbols = existing_symbols - api_symbols
+    account = accounts.current_name()
+    sync = _sync_state(account)
+    backend = storage.get_backend()
+    pending_metrics, pending_states = _take_pending(account)
+    with sync.lock:
+        if backend.take_resync(account):
+            sync.last_written.clear()
+            sync.active_symbols = None
+        now = time.monotonic()
+        api_symbols = {pos.symbol for pos in positions}
+        upserts, mark_updates, written = _diff_positions(positions, sync.last_written, account, now)
+        closed_symbols = sync.active_symbols - api_symbols if sync.active_symbols is not None else set()
+        if (INCREMENTAL_SYNC and sync.active_symbols is not None and not upserts and not mark_updates
+                and not closed_symbols and not pending_metrics and not pending_states):
+            with _stats_lock:
+                sync_stats["skipped"] += len(positions)
+            return
+
+        active_selects = 0
+        try:
+            # Símbolos activos en DB: solo la primera vez (o tras un error), luego se siguen en memoria
+            if sync.active_symbols is None or not INCREMENTAL_SYNC:
+                closed_symbols = backend.active_symbols(account) - api_symbols
+                active_selects = 1
+
+            # Métricas y estados acumulados durante el ciclo (sin símbolos ya cerrados)
+            open_metrics = {sym: cols for sym, cols in pending_metrics.items() if sym not in closed_symbols}
+            open_states = {sym: st for sym, st in pending_states.items() if sym not in closed_symbols}
+
+            # ✅ Inserts/updates en lote de las filas que cambiaron, cierres y pendientes: una transacción
+            backend.write_sync(account, upserts, mark_updates, closed_symbols, open_metrics, open_states)
+
+        except storage.DB_ERRORS as error:
+            log.error("Error al sincronizar posiciones: %s", error)
+            # The pending updates go back to the buffer for the next sync
+            _restore_pending(account, pending_metrics, pending_states)
+            # Nothing is known to be written: start over with a full sync next time
+            sync.last_written.clear()
+            sync.active_symbols = None
+            return
+
         if closed_symbols:
-            placeholders = ', '.join(['%s'] * len(closed_symbols))
-            update_state_table = f"""
-                                UPDATE position_state
-                                SET status_ = 0
-                                WHERE symbol IN ({placeholders});
-                            """
-            deactivate_query = f"""
-                                UPDATE trading_positions
-                                SET position_amount = 0.0,
-                                    entry_price = 0.0,
-                                    liquidation_price = 0.0,
-                                    mark_price = 0.0,
-                                    unrealized_profit = 0.0,
-                                    trailing_stop = 0.0,
-                                    take_profit = 0.0,
-                                    position_status = 0,
-                                    info = '',
-                                    tp_set = 0,
-                                    sl_set = 0,
-                                    breakeven_price = 0.0
-                                WHERE symbol IN ({placeholders});
-                            """
-            cursor_insert_update.execute(update_state_table, tuple(closed_symbols))
-            cursor_insert_update.execute(deactivate_query, tuple(closed_symbols))
-            print(f"Valores restablecidos para operaciones inactivas.")
-            # print(f"Se marcaron como inactivas: {', '.join(closed_symbols)}")
-
-        connection.commit()
-        cursor_insert_update.close()
-
-    except mysql.connector.Error as error:
-        print(f"Error al sincronizar posiciones: {error}")
-
-    finally:
-        if connection.is_connected():
-            connection.close()
+            log.info("Valores restablecidos para operaciones inactivas: %s", ", ".join(sorted(closed_symbols)),
+                     extra={"symbols": sorted(closed_symbols)})
+
+        for symbol in set(sync.last_written) - api_symbols:
+            del sync.last_written[symbol]
+        sync.last_written.update(written)
+        sync.active_symbols = api_symbols
+    with _stats_lock:
+        sync_stats["active_selects"] += active_selects
+        sync_stats["upserts"] += len(upserts)
+        sync_stats["mark_updates"] += len(mark_updates)
+        sync_stats["skipped"] += len(positions) - len(upserts) - len(mark_updates)
+        sync_stats["deactivated"] += len(closed_symbols)
+
+
+def print_sync_stats():
+    s = sync_stats
+    log.info("[DB SYNC] upserts=%s mark_updates=%s skipped=%s deactivated=%s active_selects=%s", s['upserts'],
+             s['mark_updates'], s['skipped'], s['deactivated'], s['active_selects'], extra=dict(s))
 
 
 ###---- Actualizar métricas dinámicas de la posición (Trailing Stop, TP, Volumen, Cambio)
+@profiler.traced()
+@metrics.timed()
 def update_position_metrics(symbol, trailing_stop=None, take_profit=None, volume=None, change_=None, info=None):
     """
     Actualiza los valores dinámicos de una posición específica.
     Solo actualiza los campos provistos (no sobrescribe los nulos).
+    Con WRITE_BEHIND activo se acumula hasta el próximo sync_positions().
     """
-    try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor = connection.cursor()
-
-        fields = []
-        values = []
-
-        if trailing_stop is not None:
-            fields.append("trailing_stop = %s")
-            values.append(trailing_stop)
-        if take_profit is not None:
-            fields.append("take_profit = %s")
-            values.append(take_profit)
-        if volume is not None:
-            fields.append("volume = %s")
-            values.append(volume)
-        if change_ is not None:
-            fields.append("change_ = %s")
-            values.append(change_)
-        if info is not None:
-            fields.append("info = %s")
-            values.append(info)
-
-        if not fields:
-            print(f"No se proporcionaron campos para actualizar en {symbol}.")
-            return
+    columns = {name: value for name, value in (("trailing_stop", trailing_stop), ("take_profit", take_profit),
+                                                ("volume", volume), ("change_", change_), ("info", info))
+               if value is not None}
 
-        query = f"UPDATE trading_positions SET {', '.join(fields)} WHERE symbol = %s;"
-        values.append(symbol)
+    if not columns:
+        log.warning("No se proporcionaron campos para actualizar en %s.", symbol, extra={"symbol": symbol})
+        return
 
-        cursor.execute(query, tuple(values))
-        connection.commit()
+    account = accounts.current_name()
+    if WRITE_BEHIND:
+        with _pending_lock:
+            _pending_metrics.setdefault(account, {}).setdefault(symbol, {}).update(columns)
+        return
 
-        print(f"Actualización de métricas completada para {symbol} → {fields}")
+    try:
+        storage.get_backend().update_metrics(account, symbol, columns)
+        log.debug("Actualización de métricas completada para %s → %s", symbol, list(columns), extra={"symbol": symbol})
 
-    except mysql.connector.Error as error:
-        print(f"Error al actualizar métricas de posición: {error}")
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+    except storage.DB_ERRORS as error:
+        log.error("Error al actualizar métricas de posición: %s", error, extra={"symbol": symbol})
 
 
 ###----  Keep track of TP and SL
+@profiler.traced()
+@metrics.timed()
 def mark_tp_sl_as_set(symbol, tp_set=None, sl_set=None):
     """Mark TP or SL as set (1) or unset (0) for a given symbol."""
-    try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor = connection.cursor()
-
-        fields, values = [], []
-        if tp_set is not None:
-            fields.append("tp_set = %s")
-            values.append(tp_set)
-        if sl_set is not None:
-            fields.append("sl_set = %s")
-            values.append(sl_set)
-
-        if not fields:
-            return
-
-        query = f"UPDATE trading_positions SET {', '.join(fields)} WHERE symbol = %s;"
-        values.append(symbol)
-
-        cursor.execute(query, tuple(values))
-        connection.commit()
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+    columns = {name: value for name, value in (("tp_set", tp_set), ("sl_set", sl_set)) if value is not None}
+    if not columns:
+        return
+    storage.get_backend().set_tp_sl(accounts.current_name(), symbol, columns)
 
 
+@profiler.traced()
+@metrics.timed()
 def check_tp_sl_status(symbol):
     """Return the current TP/SL flags from DB for a symbol."""
-    connection = mysql.connector.connect(**DB_CONFIG)
-    cursor = connection.cursor()
-    cursor.execute("SELECT tp_set, sl_set FROM trading_positions WHERE symbol = %s;", (symbol,))
-    row = cursor.fetchone()
-    cursor.close()
-    connection.close()
+    row = storage.get_backend().tp_sl_status(accounts.current_name(), symbol)
     if not row:
         return {"tp_set": 0, "sl_set": 0}
     return {"tp_set": row[0], "sl_set": row[1]}
 
 
+###---- Bulk load of bot state (TP/SL flags, stop, last state code) in one query
+@profiler.traced()
+@metrics.timed()
+def load_position_states(symbols=None):
+    """
+    Return {symbol: {"tp_set", "sl_set", "trailing_stop", "take_profit", "state"}} for the current account's
+    active positions, or only for `symbols` when given.
+    """
+    if symbols is not None:
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+    rows = storage.get_backend().load_states(accounts.current_name(), symbols)
+    return {
+        row[0]: {"tp_set": row[1] or 0, "sl_set": row[2] or 0, "trailing_stop": row[3],
+                 "take_profit": row[4], "state": row[5]}
+        for row in rows
+    }
+
+
+@profiler.traced()
+@metrics.timed()
 def sync_info(symbol, state=None):
     """Keeping track of all changes made by the bot."""
     if not state:
         return  # No hace nada si no hay nota
-    
+
+    account = accounts.current_name()
+    if WRITE_BEHIND:
+        with _pending_lock:
+            _pending_states.setdefault(account, {})[symbol] = state
+        return
+
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor = connection.cursor()
-
-        insert_state = """
-                    INSERT INTO position_state (symbol, state, updated_at, status_)
-                    VALUES (%s, %s, NOW(), 1)
-                    ON DUPLICATE KEY UPDATE
-                        state = VALUES(state),
-                        updated_at = NOW(),
-                        status_ = 1
-                """
-
-        data = (symbol, state)
-        cursor.execute(insert_state, data)
-        connection.commit()
-
-        # print(f"[INFO] Log inserted for {symbol} at {datetime.now()}")
-    
-    except mysql.connector.Error as err:
-        print(f"[ERROR] Database error: {err}")
-
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
\ No newline at end of file
+        storage.get_backend().write_state(account, symbol, state)
+
+    except storage.DB_ERRORS as err:
+        log.error("[ERROR] Database error: %s", err, extra={"symbol": symbol, "state": state})
@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import replace
+
+import websockets
+
+import Dat
+import exchange_async
+import metrics
+import position_history
+import read_api
+import store_data
+import place_orders
+from async_monitor import AsyncMonitor
+from binance_ops import TRAIL_PERCENT, ACTIVATION_BUFFER
+from endpoints import binance_api
+from exchange import Order, Position
+from logging_pipeline import configure as configure_logging, get_logger
+from open_orders import OpenOrdersSnapshot
+
+WS_BASE_URL = getattr(Dat, 'ws_base_url', binance_api['WS_BASE_URL'])
+MARK_PRICE_STREAM = "!markPrice@arr@1s"     # Every symbol's mark price, once per second
+RECONCILE_INTERVAL = 60                      # Seconds between REST positionRisk/openOrders reconciliations
+DB_SYNC_INTERVAL = 5                         # Same cadence as the polling loop
+KEEPALIVE_INTERVAL = 30 * 60                 # listenKey expires after 60 min without a keepalive
+KEEPALIVE_RETRY = 60                         # Seconds before the next attempt after a failed keepalive
+RECONNECT_DELAY_MAX = 30
+TERMINAL_ORDER_STATUS = ("FILLED", "CANCELED", "EXPIRED", "EXPIRED_IN_MATCH", "REJECTED")
+
+log = get_logger(__name__)
+
+
+class PositionBook:
+    """
+    In-memory positions (exchange.Position) and open orders, kept current from
+    ACCOUNT_UPDATE / ORDER_TRADE_UPDATE / markPriceUpdate events and replaced on each REST reconciliation.
+    """
+
+    def __init__(self, store=None):
+        self.positions = {}
+        self.orders = OpenOrdersSnapshot()
+        self.store = store          # state_store.StateStore kept in step with the events, if given
+        self.needs_reconcile = False
+
+    def load(self, positions, snapshot):
+        self.positions = {p.symbol: p for p in positions}
+        if snapshot is not None:
+            self.orders = snapshot
+        self.needs_reconcile = False
+
+    def apply_account_update(self, event):
+        """ACCOUNT_UPDATE → symbols whose position changed."""
+        changed = []
+        for p in event.get("a", {}).get("P", []):
+            symbol, amt = p["s"], float(p["pa"])
+            if amt == 0:
+                self.positions.pop(symbol, None)
+                if self.store is not None:
+                    self.store.remove(symbol)
+                continue
+            entry = float(p["ep"])
+            position = self.positions.get(symbol)
+            if position is None:
+                # New position: leverage/liquidation are not in the event, fill them on next reconciliation
+                position = self.positions[symbol] = Position(symbol, amt, entry, entry, entry, 0.0)
+                self.needs_reconcile = True
+            position.amount = amt
+            position.entry_price = entry
+            position.break_even_price = float(p.get("bep", p["ep"]))
+            position.unrealized_profit = float(p["up"])
+            position.margin_type = p.get("mt", "cross")
+            position.position_side = p.get("ps", "BOTH")
+            position.update_time = event["E"]
+            changed.append(symbol)
+        return changed
+
+    def apply_order_update(self, event):
+        o = event["o"]
+        if o["X"] == "NEW":
+            self.orders.add(Order(symbol=o["s"], order_id=o["i"], type=o["o"], side=o["S"], stop_price=float(o["sp"]),
+                                  client_order_id=o["c"], status=o["X"]))
+        elif o["X"] in TERMINAL_ORDER_STATUS:
+            self.orders.remove(o["s"], o["i"])
+        if self.store is not None:
+            self.store.apply_order_event(o["s"], o["o"], o["X"], o["sp"])
+
+    def apply_mark_price(self, symbol, mark):
+        """markPriceUpdate → the updated position, or None if we hold nothing in this symbol."""
+        position = self.positions.get(symbol)
+        if position is None:
+            return None
+        position.set_mark(float(mark))
+        return position
+
+
+class StreamMonitor:
+    """
+    Event-driven alternative to the polling loop: trailing stops are evaluated when a held symbol's
+    mark price changes. Evaluations of one symbol never overlap; events arriving meanwhile collapse into one re-run.
+    """
+
+    def __init__(self, backend, ws_url=WS_BASE_URL, listen_key=None, dry_run=False, record_path=None):
+        self.backend = backend
+        self.ws_url = ws_url
+        self.listen_key = listen_key or ("offline" if dry_run else None)
+        self.dry_run = dry_run
+        self.monitor = AsyncMonitor(backend)
+        self.book = PositionBook(None if dry_run else self.monitor.store)
+        self._running = set()
+        self._dirty = set()
+        self._tasks = set()
+        self._sockets = {}      # stream -> open WebSocket
+        self._record = open(record_path, "a") if record_path else None
+        self._record_start = time.monotonic()
+
+    ###---- REST side (skipped in dry-run)
+    async def _create_listen_key(self):
+        listen_key = await self.backend.create_user_stream()
+        if listen_key is None:
+            raise ConnectionError("listenKey request failed")
+        return listen_key
+
+    async def _keepalive_loop(self):
+        interval = KEEPALIVE_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            if await self.backend.keepalive_user_stream(self.listen_key):
+                interval = KEEPALIVE_INTERVAL
+                continue
+            log.warning("[STREAM] listenKey keepalive failed, creating a new one")
+            try:
+                listen_key = await self._create_listen_key()
+            except Exception as e:
+                log.error("[STREAM] listenKey creation failed: %r, retrying in %ss", e, KEEPALIVE_RETRY)
+                interval = KEEPALIVE_RETRY
+                continue
+            interval = KEEPALIVE_INTERVAL
+            if listen_key != self.listen_key:
+                # The old key is gone: move the user stream over to the new one
+                self.listen_key = listen_key
+                ws = self._sockets.get("user")
+                if ws is not None:
+                    await ws.close()
+
+    async def reconcile(self):
+        positions, snapshot = await asyncio.gather(self.backend.get_positions(), self.monitor.fetch_snapshot())
+        if positions is None:
+            # A failed fetch is not "no positions": keep trailing the book we have until the next reconciliation
+            log.warning("[STREAM] Reconciliation skipped: positions fetch failed, keeping %s positions",
+                        len(self.book.positions))
+            return
+        self.book.load(positions, snapshot)
+        self.monitor.store.apply_positions(positions)
+        await asyncio.to_thread(self.monitor.store.refresh, [p.symbol for p in positions])
+        log.info("[STREAM] Reconciled %s positions, %s open orders", len(positions), len(self.book.orders))
+
+    async def _reconcile_loop(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                log.error("[STREAM] Reconciliation failed: %r", e)
+            for _ in range(RECONCILE_INTERVAL):
+                await asyncio.sleep(1)
+                if self.book.needs_reconcile:
+                    break
+
+    async def _db_sync_loop(self):
+        while True:
+            await asyncio.sleep(DB_SYNC_INTERVAL)
+            try:
+                positions = [replace(p) for p in self.book.positions.values()]
+                position_history.record_positions(positions, self.monitor.store)
+                read_api.publish(positions, self.monitor.store)
+                if positions:
+                    await asyncio.to_thread(store_data.sync_positions, positions)
+                else:
+                    await asyncio.to_thread(store_data.flush_pending)
+            except Exception as e:
+                log.error("[STREAM] DB sync failed: %r", e)
+
+    ###---- Trailing-stop evaluation driven by price events
+    def _schedule(self, symbol):
+        if symbol in self._running:
+            self._dirty.add(symbol)
+            return
+        self._running.add(symbol)
+        task = asyncio.create_task(self._evaluate(symbol))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _evaluate(self, symbol):
+        try:
+            while True:
+                self._dirty.discard(symbol)
+                position = self.book.positions.get(symbol)
+                if position is None:
+                    return
+                if self.dry_run and position.unrealized_profit <= 0:
+                    log.info("[DRY-RUN] %s mark=%s → negative PnL, no trailing stop", symbol, position.mark_price,
+                             extra={"symbol": symbol, "mark": position.mark_price})
+                elif self.dry_run:
+                    decision = place_orders.evaluate_trailing_stop(position, self.book.orders.stop_price(symbol),
+                                                                   TRAIL_PERCENT, ACTIVATION_BUFFER)
+                    log.info("[DRY-RUN] %s mark=%s → action=%s new_sl=%s state=%s", symbol, position.mark_price,
+                             decision['action'], decision['new_sl'], decision['state'],
+                             extra={"symbol": symbol, "mark": position.mark_price, "new_sl": decision['new_sl'],
+                                    "state": decision['state']})
+                else:
+                    await self.monitor.handle_position(replace(position), self.book.orders)
+                if symbol not in self._dirty:
+                    return
+        except Exception as e:
+            log.error("[%s] Stream evaluation failed: %r", symbol, e, exc_info=True, extra={"symbol": symbol})
+        finally:
+            self._running.discard(symbol)
+
+    ###---- WebSocket consumers
+    def _on_message(self, stream, raw):
+        message = json.loads(raw)
+        if self._record:
+            self._record.write(json.dumps({"t": round(time.monotonic() - self._record_start, 3),
+                                           "stream": stream, "msg": message}) + "\n")
+        data = message.get("data", message)     # Combined streams wrap the payload
+        events = data if isinstance(data, list) else [data]
+        for event in events:
+            kind = event.get("e")
+            if kind == "markPriceUpdate":
+                if self.book.apply_mark_price(event["s"], event["p"]) is not None:
+                    self._schedule(event["s"])
+            elif kind == "ACCOUNT_UPDATE":
+                for symbol in self.book.apply_account_update(event):
+                    self._schedule(symbol)
+            elif kind == "ORDER_TRADE_UPDATE":
+                self.book.apply_order_update(event)
+            elif kind == "listenKeyExpired":
+                log.warning("[STREAM] listenKey expired, reconnecting")
+                self.listen_key = None
+                return "reconnect"
+
+    async def _consume(self, stream, url_factory):
+        delay = 1
+        while True:
+            try:
+                url = await url_factory()
+                async with websockets.connect(url, ping_interval=180) as ws:
+                    log.info("[STREAM] Connected %s: %s", stream, url)
+                    self._sockets[stream] = ws
+                    delay = 1
+                    async for raw in ws:
+                        if self._on_message(stream, raw) == "reconnect":
+                            break
+            except (OSError, websockets.WebSocketException) as e:
+                log.warning("[STREAM] %s disconnected: %r, retrying in %ss", stream, e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+            if not self.dry_run:
+                self.book.needs_reconcile = True     # Events may have been missed while disconnected
+
+    async def _user_url(self):
+        if self.listen_key is None:
+            self.listen_key = await self._create_listen_key()
+        return f"{self.ws_url}/ws/{self.listen_key}"
+
+    async def _market_url(self):
+        return f"{self.ws_url}/stream?streams={MARK_PRICE_STREAM}"
+
+    async def run(self):
+        tasks = [self._consume("user", self._user_url), self._consume("market", self._market_url)]
+        if not self.dry_run:
+            await asyncio.to_thread(store_data.ensure_account_column)
+            tasks += [self._reconcile_loop(), self._db_sync_loop(), self._keepalive_loop()]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            if self._record:
+                self._record.close()
+
+
+async def main(args):
+    configure_logging()
+    metrics.start_server()
+    read_api.start_server()
+    async with exchange_async.create_backend() as backend:
+        monitor = StreamMonitor(backend, ws_url=args.ws_url, listen_key=args.listen_key,
+                                dry_run=args.dry_run, record_path=args.record)
+        await monitor.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream-driven position monitor (user-data + mark-price WebSockets).")
+    parser.add_argument("--ws-url", default=WS_BASE_URL, help="WebSocket base URL (e.g. ws://127.0.0.1:8765 for fake_ws_server)")
+    parser.add_argument("--listen-key", help="Use this listenKey instead of requesting one over REST")
+    parser.add_argument("--dry-run", action="store_true", help="No REST, orders or DB: print trailing-stop decisions only")
+    parser.add_argument("--record", help="Append every received message to this JSONL file (replayable by fake_ws_server)")
+    asyncio.run(main(parser.parse_args()))
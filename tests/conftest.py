@@ -0,0 +1,68 @@
+import itertools
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import Dat  # noqa: F401
+except ImportError:
+    # Dat holds each deployment's credentials and DB settings and is not in the repo; the tests only need the defaults
+    Dat = types.ModuleType("Dat")
+    Dat.BinK, Dat.BinS = "test-key", "test-secret"
+    sys.modules["Dat"] = Dat
+
+import accounts
+import exchange
+import exchange_info
+
+
+class FakeExchange(exchange.ExchangeBackend):
+    """ExchangeBackend answering from queued results: place_close_orders pops one list per call."""
+
+    name = "TEST"
+
+    def __init__(self):
+        self.place_results = []     # One list of (Order, error) per place_close_orders call, unused ones place the order
+        self.open_orders = []
+        self.placed = []            # Requests of each call
+        self.next_id = 1
+
+    def _placed_order(self, request):
+        self.next_id += 1
+        return exchange.Order(request.symbol, self.next_id, request.type, request.side, request.stop_price,
+                              request.client_order_id)
+
+    def place_close_orders(self, requests, priority=None):
+        self.placed.append(list(requests))
+        if self.place_results:
+            return self.place_results.pop(0)
+        return [(self._placed_order(r), None) for r in requests]
+
+    def get_open_orders(self, symbol=None):
+        return [o for o in self.open_orders if symbol is None or o.symbol == symbol]
+
+
+exchange.register_backend(FakeExchange.name, FakeExchange)
+_test_accounts = itertools.count(1)
+
+
+@pytest.fixture
+def fake_exchange():
+    """A new FakeExchange as the exchange.get_backend() of a test-only account."""
+    with accounts.use(accounts.Account(f"test-{next(_test_accounts)}", "key", "secret", FakeExchange.name)):
+        yield exchange.get_backend()
+
+
+@pytest.fixture
+def tick_sizes(monkeypatch):
+    """exchangeInfo filters of BTCUSDT (tick 0.1) and DOGEUSDT (tick 0.00001); other symbols use the legacy tick."""
+    filters = exchange_info._parse({"symbols": [
+        {"symbol": "BTCUSDT", "filters": [{"filterType": "PRICE_FILTER", "tickSize": "0.10"}]},
+        {"symbol": "DOGEUSDT", "filters": [{"filterType": "PRICE_FILTER", "tickSize": "0.00001"}]},
+    ]})
+    monkeypatch.setattr(exchange_info, "_filters", filters)
+    return filters
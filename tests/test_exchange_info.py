@@ -0,0 +1,30 @@
+from decimal import Decimal
+
+import exchange_info
+
+
+def test_round_price_uses_symbol_tick(tick_sizes):
+    assert exchange_info.round_price("BTCUSDT", 64123.456) == 64123.5
+    assert exchange_info.round_price("DOGEUSDT", 0.123456789) == 0.12346
+
+
+def test_round_price_is_half_even(tick_sizes):
+    assert exchange_info.round_price("BTCUSDT", 100.25) == 100.2
+    assert exchange_info.round_price("BTCUSDT", 100.35) == 100.4
+
+
+def test_round_price_has_clean_float(tick_sizes):
+    assert exchange_info.round_price("BTCUSDT", 0.1 + 0.2) == 0.3
+    assert repr(exchange_info.round_price("BTCUSDT", 3 * 33.1)) == "99.3"
+
+
+def test_round_price_falls_back_to_legacy_tick(tick_sizes):
+    assert exchange_info.tick_size("XYZUSDT", 12.0) == Decimal("0.01")
+    assert exchange_info.round_price("XYZUSDT", 12.3456) == 12.35
+    assert exchange_info.round_price("XYZUSDT", 0.0123456) == 0.01235
+
+
+def test_round_price_legacy_tick_follows_entry(tick_sizes):
+    # The tick is picked from the entry price when given, so a stop below 1 of a position entered above 1 keeps 2 decimals
+    assert exchange_info.round_price("XYZUSDT", 0.987654, entry=1.5) == 0.99
+    assert exchange_info.round_price("XYZUSDT", 0.987654) == 0.98765
@@ -0,0 +1,52 @@
+from exchange import Order
+from open_orders import OpenOrdersSnapshot
+
+
+def _snapshot():
+    return OpenOrdersSnapshot([
+        Order("BTCUSDT", 1, "STOP_MARKET", "SELL", 95.0, "sl-1"),
+        Order("BTCUSDT", 2, "TAKE_PROFIT_MARKET", "SELL", 110.0, "tp-1"),
+        Order("ETHUSDT", 3, "LIMIT", "BUY", 0.0, "limit-1"),
+    ])
+
+
+def test_orders_by_symbol_and_type():
+    snapshot = _snapshot()
+    assert [o.order_id for o in snapshot.orders("BTCUSDT")] == [1, 2]
+    assert [o.order_id for o in snapshot.orders("BTCUSDT", "STOP_MARKET")] == [1]
+    assert snapshot.orders("SOLUSDT") == []
+    assert len(snapshot) == 3
+
+
+def test_stop_price_and_protection():
+    snapshot = _snapshot()
+    assert snapshot.stop_price("BTCUSDT") == 95.0
+    assert snapshot.stop_price("BTCUSDT", "TAKE_PROFIT_MARKET") == 110.0
+    assert snapshot.stop_price("ETHUSDT") is None
+    assert snapshot.has_sl_tp("BTCUSDT")
+    assert not snapshot.has_sl_tp("ETHUSDT")
+    assert not snapshot.has_sl_tp("BTCUSDT", ("TRAILING_STOP_MARKET",))
+
+
+def test_client_order_id_lookup_is_per_symbol():
+    snapshot = _snapshot()
+    assert snapshot.has_client_order_id("BTCUSDT", "sl-1")
+    assert not snapshot.has_client_order_id("ETHUSDT", "sl-1")
+
+
+def test_add_ignores_known_order_ids_and_none():
+    snapshot = _snapshot()
+    snapshot.add(Order("BTCUSDT", 1, "STOP_MARKET", "SELL", 95.0, "sl-1"))
+    snapshot.add(None)
+    assert len(snapshot) == 3
+    snapshot.add(Order("BTCUSDT", 4, "STOP_MARKET", "SELL", 97.0, "sl-2"))
+    assert [o.stop_price for o in snapshot.orders("BTCUSDT", "STOP_MARKET")] == [95.0, 97.0]
+
+
+def test_remove():
+    snapshot = _snapshot()
+    snapshot.remove("BTCUSDT", 1)
+    snapshot.remove("BTCUSDT", 99)
+    assert snapshot.stop_price("BTCUSDT") is None
+    assert snapshot.has_sl_tp("BTCUSDT")
+    assert len(snapshot) == 2
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+import exchange
+import order_intents
+from exchange import DUPLICATE_CLIENT_ID, Order, client_order_id
+from open_orders import OpenOrdersSnapshot
+
+UNKNOWN = {"code": -1007, "msg": "Timeout waiting for response from backend server."}
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    counts = dict.fromkeys(order_intents.intent_stats, 0)
+    monkeypatch.setattr(order_intents, "intent_stats", counts)
+    return counts
+
+
+def test_identical_intents_collapse(stats):
+    queue = order_intents.IntentQueue()
+    first = queue.submit("BTCUSDT", "SELL", "STOP_MARKET", 95.0)
+    assert queue.submit("BTCUSDT", "SELL", "STOP_MARKET", 95.0) is first
+    queue.submit("BTCUSDT", "SELL", "STOP_MARKET", 96.0)
+    assert len(queue) == 2
+    assert stats["submitted"] == 3 and stats["collapsed"] == 1
+
+
+def test_order_already_open_is_not_queued(stats):
+    snapshot = OpenOrdersSnapshot([Order("BTCUSDT", 1, "STOP_MARKET", "SELL", 95.0,
+                                         client_order_id("BTCUSDT", "STOP_MARKET", 95.0))])
+    queue = order_intents.IntentQueue(snapshot)
+    assert queue.submit("BTCUSDT", "SELL", "STOP_MARKET", 95.0) is None
+    assert len(queue) == 0 and stats["already_open"] == 1
+
+
+def test_dispatch_places_and_updates_snapshot(fake_exchange, stats):
+    snapshot = OpenOrdersSnapshot()
+    queue = order_intents.IntentQueue(snapshot)
+    intents = [queue.submit(symbol, "SELL", "STOP_MARKET", 95.0) for symbol in ("BTCUSDT", "ETHUSDT")]
+    placed = queue.dispatch()
+    assert [placed[i.client_order_id].symbol for i in intents] == ["BTCUSDT", "ETHUSDT"]
+    assert snapshot.stop_price("ETHUSDT") == 95.0
+    assert len(fake_exchange.placed) == 1 and len(queue) == 0
+    assert stats["placed"] == 2 and stats["batches"] == 1
+
+
+def test_unknown_outcome_is_sent_again(fake_exchange, stats):
+    fake_exchange.place_results = [[(None, UNKNOWN), (None, {"code": -2021, "msg": "Order would immediately trigger."})]]
+    queue = order_intents.IntentQueue()
+    retried = queue.submit("BTCUSDT", "SELL", "STOP_MARKET", 95.0)
+    rejected = queue.submit("ETHUSDT", "SELL", "STOP_MARKET", 95.0)
+    placed = queue.dispatch()
+    assert placed[retried.client_order_id] is not None and placed[rejected.client_order_id] is None
+    assert [[r.symbol for r in call] for call in fake_exchange.placed] == [["BTCUSDT", "ETHUSDT"], ["BTCUSDT"]]
+    assert retried.attempts == 2
+    assert stats["retried"] == 1 and stats["placed"] == 1 and stats["rejected"] == 1
+
+
+def test_retries_stop_after_dispatch_attempts(fake_exchange, stats):
+    fake_exchange.place_results = [[(None, UNKNOWN)]] * order_intents.DISPATCH_ATTEMPTS
+    queue = order_intents.IntentQueue()
+    intent = queue.submit("BTCUSDT", "SELL", "STOP_MARKET", 95.0)
+    assert queue.dispatch() == {intent.client_order_id: None}
+    assert len(fake_exchange.placed) == order_intents.DISPATCH_ATTEMPTS
+    assert stats["rejected"] == 1
+
+
+def test_duplicate_id_adopts_the_open_order(fake_exchange, stats):
+    client_id = client_order_id("BTCUSDT", "STOP_MARKET", 95.0)
+    open_order = Order("BTCUSDT", 7, "STOP_MARKET", "SELL", 95.0, client_id)
+    fake_exchange.open_orders = [open_order]
+    fake_exchange.place_results = [[(None, {"code": DUPLICATE_CLIENT_ID, "msg": "Duplicate clientOrderId"})]]
+    snapshot = OpenOrdersSnapshot()
+    queue = order_intents.IntentQueue(snapshot)
+    queue.submit("BTCUSDT", "SELL", "STOP_MARKET", 95.0)
+    assert queue.dispatch() == {client_id: open_order}
+    assert snapshot.has_client_order_id("BTCUSDT", client_id)
+    assert stats["adopted"] == 1
+
+
+class AsyncFakeExchange:
+    """Awaitable front of a FakeExchange, in the shape of exchange_async.AsyncExchangeBackend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def place_close_orders(self, requests, priority=None):
+        return self.backend.place_close_orders(requests, priority)
+
+    async def get_open_orders(self, symbol=None):
+        return self.backend.get_open_orders(symbol)
+
+
+def test_dispatch_async_matches_dispatch(fake_exchange, stats):
+    client_id = client_order_id("ETHUSDT", "STOP_MARKET", 95.0)
+    fake_exchange.open_orders = [Order("ETHUSDT", 7, "STOP_MARKET", "SELL", 95.0, client_id)]
+    fake_exchange.place_results = [[(None, UNKNOWN), (None, {"code": DUPLICATE_CLIENT_ID, "msg": "Duplicate"})]]
+    snapshot = OpenOrdersSnapshot()
+    queue = order_intents.IntentQueue(snapshot)
+    queue.submit("BTCUSDT", "SELL", "STOP_MARKET", 95.0)
+    queue.submit("ETHUSDT", "SELL", "STOP_MARKET", 95.0)
+    placed = asyncio.run(queue.dispatch_async(AsyncFakeExchange(fake_exchange)))
+    assert all(isinstance(order, exchange.Order) for order in placed.values())
+    assert snapshot.stop_price("BTCUSDT") == snapshot.stop_price("ETHUSDT") == 95.0
+    assert stats["placed"] == 1 and stats["adopted"] == 1 and stats["retried"] == 1
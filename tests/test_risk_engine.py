@@ -0,0 +1,71 @@
+import itertools
+
+import pytest
+
+import exchange_info
+import place_orders
+from exchange import Position
+from risk_engine import RiskBatch
+
+TRAIL, BUFFER = 0.35, 0.5
+LONG_LEVELS, SHORT_LEVELS = (0.98, 1.05), (1.02, 0.95)
+
+
+def _positions():
+    """Longs and shorts across every decision branch: losing, break-even window, waiting, trailing."""
+    positions, existing_sl = [], {}
+    changes = (-1.0, 0.2, 0.4, 0.45, 0.6, 1.5)
+    for n, (symbol, sign, change, stop) in enumerate(itertools.product(
+            ("BTCUSDT", "DOGEUSDT", "XYZUSDT"), (1, -1), changes, ("none", "zero", "weak", "be", "tight"))):
+        entry = {"BTCUSDT": 60000.0, "DOGEUSDT": 0.1234, "XYZUSDT": 12.5}[symbol]
+        break_even = entry * (1 + sign * 0.0004)
+        mark = entry * (1 + sign * change / 100)
+        name = f"{symbol}{n}"
+        positions.append(Position(name, sign * 2.0, entry, mark, break_even, sign * 2.0 * (mark - entry)))
+        if stop != "none":
+            existing_sl[name] = {"zero": 0.0, "weak": entry * (1 - sign * 0.02), "be": break_even,
+                                 "tight": mark * (1 - sign * 0.001)}[stop]
+    return positions, existing_sl
+
+
+@pytest.fixture
+def tick_by_prefix(tick_sizes, monkeypatch):
+    """The generated symbols (BTCUSDT0, ...) use the filters of their prefix."""
+    filters = {f"{symbol}{n}": f for symbol, f in tick_sizes.items() for n in range(200)}
+    monkeypatch.setattr("exchange_info._filters", filters)
+
+
+def test_batch_matches_scalar_decision(tick_by_prefix):
+    positions, existing_sl = _positions()
+    batch = RiskBatch(positions, existing_sl, LONG_LEVELS, SHORT_LEVELS, TRAIL, BUFFER)
+    assert len(batch) == len(positions)
+    for i, position in enumerate(positions):
+        decision = batch.decision(i)
+        if position.unrealized_profit <= 0:
+            assert decision is None
+            continue
+        expected = place_orders.evaluate_trailing_stop(position, existing_sl.get(position.symbol), TRAIL, BUFFER)
+        for key in ("symbol", "side", "direction", "action", "info", "state"):
+            assert decision[key] == expected[key], (position, key)
+        for key in ("price_change", "mark", "break_even", "existing_sl"):
+            assert decision[key] == pytest.approx(expected[key]), (position, key)
+        # A trailing level exactly half a tick away may round either way: float division vs Decimal
+        tick = float(exchange_info.tick_size(position.symbol, position.entry_price))
+        assert decision["new_sl"] == pytest.approx(expected["new_sl"], abs=tick * 1.001), position
+
+
+def test_actions_are_the_rows_that_place_or_replace(tick_by_prefix):
+    positions, existing_sl = _positions()
+    batch = RiskBatch(positions, existing_sl, LONG_LEVELS, SHORT_LEVELS, TRAIL, BUFFER)
+    decisions = [batch.decision(i) for i in range(len(batch))]
+    assert batch.actions() == [d for d in decisions if d is not None and d["action"] is not None]
+    assert {d["action"] for d in batch.actions()} == {"place", "replace"}
+    assert batch.states() == [(d["symbol"], d["state"]) for d in decisions if d is not None]
+
+
+def test_placing_initial_starts_from_the_initial_stop(tick_by_prefix):
+    position = Position("BTCUSDT0", 1.0, 60000.0, 60900.0, 60024.0, 900.0)
+    batch = RiskBatch([position], {}, LONG_LEVELS, SHORT_LEVELS, TRAIL, BUFFER, placing_initial={"BTCUSDT0"})
+    expected = place_orders.evaluate_trailing_stop(position, batch.levels(0)["stop_loss"], TRAIL, BUFFER)
+    assert batch.decision(0)["existing_sl"] == batch.levels(0)["stop_loss"] == 58800.0
+    assert batch.decision(0)["action"] == expected["action"] == "replace"
@@ -0,0 +1,54 @@
+import pytest
+
+import scheduler
+from exchange import Position
+
+TRAIL, BUFFER, LOWER = 0.35, 0.5, 0.35
+
+
+def _position(amount, entry, mark):
+    return Position("BTCUSDT", amount, entry, mark, entry, amount * (mark - entry))
+
+
+def test_threshold_distance_long_without_stop():
+    # Break-even window at +0.35 %, activation at +0.5 %: the nearest one counts
+    distance = scheduler.threshold_distance(_position(1, 100.0, 100.1), None, TRAIL, BUFFER, LOWER)
+    assert distance == pytest.approx(0.25 / 100.1 * 100)
+
+
+def test_threshold_distance_short_mirrors_long():
+    distance = scheduler.threshold_distance(_position(-1, 100.0, 99.9), None, TRAIL, BUFFER, LOWER)
+    assert distance == pytest.approx(0.25 / 99.9 * 100)
+
+
+def test_threshold_distance_includes_trailing_level():
+    # Long with a stop at 101: the trailing SL beats it once mark * (1 - 0.35 %) > 101
+    position = _position(1, 100.0, 101.2)
+    distance = scheduler.threshold_distance(position, 101.0, TRAIL, BUFFER, LOWER)
+    assert distance == pytest.approx(abs(101.0 / (1 - TRAIL / 100) - 101.2) / 101.2 * 100)
+    short = scheduler.threshold_distance(_position(-1, 100.0, 98.8), 99.0, TRAIL, BUFFER, LOWER)
+    assert short == pytest.approx(abs(99.0 / (1 + TRAIL / 100) - 98.8) / 98.8 * 100)
+
+
+def test_threshold_distance_is_zero_at_a_threshold():
+    assert scheduler.threshold_distance(_position(1, 100.0, 100.5), None, TRAIL, BUFFER, LOWER) == pytest.approx(0)
+
+
+def test_poll_interval_is_clamped():
+    assert scheduler.poll_interval(0.0) == scheduler.MIN_INTERVAL
+    assert scheduler.poll_interval(100.0) == scheduler.MAX_INTERVAL
+
+
+def test_poll_interval_scales_with_square_of_distance():
+    volatility = 0.01 * scheduler.MIN_VOLATILITY    # Below the floor: MIN_VOLATILITY is used
+    sigma = scheduler.VOLATILITY_SIGMAS * scheduler.MIN_VOLATILITY
+    distance = sigma * (2 * scheduler.MIN_INTERVAL) ** 0.5
+    assert scheduler.poll_interval(distance, volatility) == pytest.approx(2 * scheduler.MIN_INTERVAL)
+    assert scheduler.poll_interval(distance / 2 ** 0.5) == pytest.approx(scheduler.MIN_INTERVAL)
+
+
+def test_poll_interval_shrinks_with_volatility():
+    distance = 0.2
+    calm = scheduler.poll_interval(distance, scheduler.MIN_VOLATILITY)
+    busy = scheduler.poll_interval(distance, 2 * scheduler.MIN_VOLATILITY)
+    assert busy <= calm
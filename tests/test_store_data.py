@@ -0,0 +1,80 @@
+import pytest
+
+import accounts
+import storage
+import store_data
+from exchange import Position
+
+
+def _position(symbol="BTCUSDT", amount=1.0, entry=100.0, mark=101.0):
+    return Position(symbol, amount, entry, mark, entry, amount * (mark - entry), update_time=1700000000000)
+
+
+def test_diff_new_and_structural_changes_are_upserts():
+    upserts, mark_updates, written = store_data._diff_positions([_position()], {}, "main", now=10.0)
+    assert [row[1] for row in upserts] == ["BTCUSDT"] and mark_updates == []
+
+    changed = _position(amount=2.0)
+    upserts, mark_updates, _ = store_data._diff_positions([changed], written, "main", now=11.0)
+    assert [row[3] for row in upserts] == [2.0] and mark_updates == []
+
+
+def test_diff_mark_changes_wait_for_the_write_interval():
+    _, _, written = store_data._diff_positions([_position()], {}, "main", now=10.0)
+    moved = _position(mark=102.0)
+
+    assert store_data._diff_positions([moved], written, "main", now=11.0) == ([], [], {})
+    later = 10.0 + store_data.MARK_WRITE_INTERVAL
+    upserts, mark_updates, _ = store_data._diff_positions([moved], written, "main", now=later)
+    assert upserts == [] and mark_updates == [(102.0, 2.0, "main", "BTCUSDT")]
+    assert store_data._diff_positions([_position()], written, "main", now=later) == ([], [], {})
+
+
+def test_diff_without_incremental_sync_upserts_everything(monkeypatch):
+    monkeypatch.setattr(store_data, "INCREMENTAL_SYNC", False)
+    _, _, written = store_data._diff_positions([_position()], {}, "main", now=10.0)
+    upserts, _, _ = store_data._diff_positions([_position()], written, "main", now=11.0)
+    assert len(upserts) == 1
+
+
+def test_restore_pending_keeps_newer_values(monkeypatch):
+    monkeypatch.setattr(store_data, "_pending_metrics", {"main": {"BTCUSDT": {"trailing_stop": 99.0}}})
+    monkeypatch.setattr(store_data, "_pending_states", {"main": {"BTCUSDT": 9}})
+    store_data._restore_pending("main", {"BTCUSDT": {"trailing_stop": 98.0, "info": "SL set"},
+                                         "ETHUSDT": {"take_profit": 2.0}}, {"BTCUSDT": 12, "ETHUSDT": 13})
+    assert store_data._pending_metrics["main"] == {"BTCUSDT": {"trailing_stop": 99.0, "info": "SL set"},
+                                                   "ETHUSDT": {"take_profit": 2.0}}
+    assert store_data._pending_states["main"] == {"BTCUSDT": 9, "ETHUSDT": 13}
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_data, "WRITE_BEHIND", True)
+    monkeypatch.setattr(store_data, "_pending_metrics", {})
+    monkeypatch.setattr(store_data, "_pending_states", {})
+    store_data.reset_sync_state()
+    backend = storage.SQLiteBackend(str(tmp_path / "positions.db"))
+    storage.set_backend(backend)
+    with accounts.use(accounts.Account("main", "key", "secret")):
+        yield backend
+    storage.set_backend(None)
+    store_data.reset_sync_state()
+
+
+def test_sync_positions_writes_only_changes(sqlite_storage, monkeypatch):
+    calls = []
+    write_sync = sqlite_storage.write_sync
+    monkeypatch.setattr(sqlite_storage, "write_sync", lambda *args: calls.append(args) or write_sync(*args))
+
+    store_data.sync_positions([_position(), _position("ETHUSDT")])
+    assert [len(calls[-1][1]), len(calls[-1][2])] == [2, 0]
+    store_data.sync_positions([_position(), _position("ETHUSDT")])
+    assert len(calls) == 1      # Nothing changed: no transaction at all
+
+    store_data.update_position_metrics("BTCUSDT", trailing_stop=100.5, info="SL set")
+    store_data.sync_info("BTCUSDT", 9)
+    store_data.sync_positions([_position()])
+    account, upserts, mark_updates, closed, metrics, states = calls[-1]
+    assert (upserts, mark_updates, set(closed)) == ([], [], {"ETHUSDT"})
+    assert metrics == {"BTCUSDT": {"trailing_stop": 100.5, "info": "SL set"}} and states == {"BTCUSDT": 9}
+    assert store_data.load_position_states()["BTCUSDT"]["trailing_stop"] == 100.5